@@ -1,9 +1,29 @@
+import asyncio
+import base64
+import binascii
 import json
+import time
 from http.cookiejar import MozillaCookieJar
 from http.cookies import Morsel
+from typing import Dict, Optional, Tuple
 
+import aiohttp
 from aiohttp import CookieJar
 
+from .sites import MaigretSite
+
+
+# time in seconds to use a token if its expiration is unknown
+DEFAULT_TOKEN_TTL = 3600
+# time in seconds to not repeat failed activation of a site
+FAILED_ACTIVATION_TTL = 60
+# token is refreshed this time in seconds before its expiration
+EXPIRATION_MARGIN = 30
+ACTIVATION_TIMEOUT = 10
+
+# headers for requests and expiration timestamp (None if unknown)
+ActivationResult = Tuple[Dict[str, str], Optional[float]]
+
 
 class ParsingActivator:
     @staticmethod
@@ -77,6 +97,193 @@ class ParsingActivator:
         site.headers["Cookie"] = cookies
 
 
+def get_jwt_expiration(token: str) -> Optional[float]:
+    """Expiration timestamp from a payload of JWT, None if there is no one"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        data = json.loads(base64.urlsafe_b64decode(payload))
+        return float(data["exp"])
+    except (IndexError, KeyError, TypeError, ValueError, binascii.Error):
+        return None
+
+
+class AsyncParsingActivator:
+    """
+    Async versions of ParsingActivator methods: they don't change the site,
+    but return headers to make requests with and their expiration time.
+    """
+
+    @staticmethod
+    async def twitter(site, session, logger) -> ActivationResult:
+        headers = dict(site.headers)
+        headers.pop("x-guest-token", None)
+        async with session.post(site.activation["url"], headers=headers) as r:
+            logger.info(r)
+            j = await r.json(content_type=None)
+        guest_token = j[site.activation["src"]]
+        return {"x-guest-token": guest_token}, None
+
+    @staticmethod
+    async def vimeo(site, session, logger) -> ActivationResult:
+        headers = dict(site.headers)
+        headers.pop("Authorization", None)
+        async with session.get(site.activation["url"], headers=headers) as r:
+            j = await r.json(content_type=None)
+        logger.debug(f"Vimeo viewer activation: {json.dumps(j, indent=4)}")
+        jwt_token = j["jwt"]
+        return {"Authorization": "jwt " + jwt_token}, get_jwt_expiration(jwt_token)
+
+    @staticmethod
+    async def spotify(site, session, logger) -> ActivationResult:
+        async with session.get(site.activation["url"]) as r:
+            j = await r.json(content_type=None)
+        bearer_token = j["accessToken"]
+        expires = j.get("accessTokenExpirationTimestampMs")
+        return {"authorization": f"Bearer {bearer_token}"}, (
+            expires / 1000 if expires else None
+        )
+
+    @staticmethod
+    async def weibo(site, session, logger) -> ActivationResult:
+        headers = dict(site.headers)
+        # 1 stage: get the redirect URL
+        async with session.get(
+            "https://weibo.com/clairekuo", headers=headers, allow_redirects=False
+        ) as r:
+            logger.debug(
+                f"1 stage: {'success' if r.status == 302 else 'no 302 redirect, fail!'}"
+            )
+            location = r.headers.get("Location")
+
+        # 2 stage: go to passport visitor page
+        headers["Referer"] = location
+        async with session.get(location, headers=headers) as r:
+            logger.debug(
+                f"2 stage: {'success' if r.status == 200 else 'no 200 response, fail!'}"
+            )
+
+        # 3 stage: gen visitor token
+        async with session.post(
+            "https://passport.weibo.com/visitor/genvisitor2",
+            headers=headers,
+            data={'cb': 'visitor_gray_callback', 'tid': '', 'from': 'weibo'},
+        ) as r:
+            cookies = "; ".join(f"{k}={v.value}" for k, v in r.cookies.items())
+            logger.debug(
+                f"3 stage: {'success' if r.status == 200 and cookies else 'no 200 response and cookies, fail!'}"
+            )
+        if not cookies:
+            raise ValueError("no visitor cookies")
+        return {"Cookie": cookies}, None
+
+
+class ActivationToken:
+    """Headers got by activation of a site, empty if activation failed"""
+
+    __slots__ = ("headers", "obtained_at", "expires")
+
+    def __init__(self, headers: Dict[str, str], obtained_at: float, expires: float):
+        self.headers = headers
+        self.obtained_at = obtained_at
+        self.expires = expires
+
+    def is_expired(self, now: float) -> bool:
+        return now >= self.expires - EXPIRATION_MARGIN
+
+
+class SiteActivator:
+    """
+    Activation of sites without blocking of the event loop. Tokens are
+    cached with their expiration time, concurrent activations of a site
+    are coalesced into one request which checks of the site wait for.
+    """
+
+    def __init__(self, methods=AsyncParsingActivator, timeout=ACTIVATION_TIMEOUT):
+        self.methods = methods
+        self.timeout = timeout
+        self.tokens: Dict[str, ActivationToken] = {}
+        self._activations: Dict[str, asyncio.Future] = {}
+
+    def get_headers(self, site: MaigretSite) -> Dict[str, str]:
+        """Headers of a not expired token of the site to add to requests"""
+        token = self.tokens.get(site.name)
+        if token is None or token.is_expired(time.time()):
+            return {}
+        return token.headers
+
+    def is_activation_needed(self, site: MaigretSite, html_text) -> bool:
+        return bool(
+            site.activation
+            and html_text
+            and site.markers.is_activation_needed(html_text)
+        )
+
+    async def wait(self, site: MaigretSite, logger):
+        """Wait for the running activation of the site, renew an expired token"""
+        if site.name in self._activations:
+            await self.activate(site, logger)
+            return
+        token = self.tokens.get(site.name)
+        if token is not None and token.headers and token.is_expired(time.time()):
+            await self.activate(site, logger)
+
+    async def activate(
+        self, site: MaigretSite, logger, since: Optional[float] = None
+    ) -> bool:
+        """
+        Activate the site if it wasn't activated after `since` timestamp
+        (e.g. while a request with an old token was made).
+        Return True if there are new headers to repeat the request with.
+        """
+        token = self.tokens.get(site.name)
+        now = time.time()
+        if (
+            since is not None
+            and token is not None
+            and token.obtained_at >= since
+            and not token.is_expired(now)
+        ):
+            return bool(token.headers)
+
+        future = self._activations.get(site.name)
+        if future is None:
+            future = asyncio.ensure_future(self._activate(site, logger))
+            self._activations[site.name] = future
+            future.add_done_callback(lambda _: self._activations.pop(site.name, None))
+        # a cancelled check doesn't cancel activation awaited by others
+        return await asyncio.shield(future)
+
+    async def _activate(self, site: MaigretSite, logger) -> bool:
+        logger.debug(f"Activation for {site.name}")
+        method = site.activation.get("method")
+        activate_fun = getattr(self.methods, method or "", None)
+        headers: Dict[str, str] = {}
+        expires = None
+        if activate_fun is None:
+            logger.warning(
+                f"Activation method {method} for site {site.name} not found!"
+            )
+        else:
+            try:
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+                async with aiohttp.ClientSession(timeout=timeout) as session:
+                    headers, expires = await activate_fun(site, session, logger)
+            except Exception as e:
+                logger.warning(
+                    f"Failed activation {method} for site {site.name}: {str(e)}",
+                    exc_info=True,
+                )
+
+        now = time.time()
+        if not headers:
+            expires = now + FAILED_ACTIVATION_TTL
+        self.tokens[site.name] = ActivationToken(
+            headers, now, expires or now + DEFAULT_TOKEN_TTL
+        )
+        return bool(headers)
+
+
 def import_aiohttp_cookies(cookiestxt_filename):
     cookies_obj = MozillaCookieJar(cookiestxt_filename)
     cookies_obj.load(ignore_discard=True, ignore_expires=True)
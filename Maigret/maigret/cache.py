@@ -0,0 +1,261 @@
+"""Maigret cache of site check results"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .errors import CheckError
+from .result import MaigretCheckResult, MaigretCheckStatus
+from .sites import MaigretSite
+from .types import QueryResultWrapper
+
+
+DEFAULT_CACHE_PATH = '~/.maigret/results_cache.sqlite'
+
+# fields of a site check result restored from the cache
+CACHED_FIELDS = ("url_user", "http_status", "ids_usernames", "ids_links")
+
+
+class CacheBackend(ABC):
+    """
+    Storage of serialized results: key -> (expiration timestamp, value).
+    Expired entries may be kept, they are checked by ResultCache.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, expires: float):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-memory LRU storage of `max_size` entries"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value: str, expires: float):
+        self.entries[key] = (expires, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """On-disk storage in a SQLite database, expired entries are purged on opening"""
+
+    def __init__(self, filename: str):
+        self.filename = os.path.expanduser(filename)
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(self.filename)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self.connection.execute(
+                "DELETE FROM results WHERE expires <= ?", (time.time(),)
+            )
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        row = self.connection.execute(
+            "SELECT expires, value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, key: str, value: str, expires: float):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (key, expires, value) VALUES (?, ?, ?)",
+                (key, expires, value),
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def normalize_username(username: str) -> str:
+    """
+    Unicode and whitespace normalization; case is kept,
+    as it matters for some sites
+    """
+    return unicodedata.normalize("NFKC", username).strip()
+
+
+def get_site_hash(site: MaigretSite, ignored_fields: Iterable[str] = ()) -> str:
+    """Hash of a site definition, results of a changed site are not reused"""
+    data = dict(site.json)
+    # changes with database updates, but doesn't affect checks
+    data.pop("alexaRank", None)
+    for field in ignored_fields:
+        data.pop(field, None)
+    if site.engine_obj:
+        data["engine"] = site.engine_obj.site
+    dump = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(dump.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of site check results with separate TTLs (in seconds) for found
+    accounts, not found ones and errors; TTL of 0 disables caching of such
+    results. Backends are looked up in order (e.g. in-memory LRU, then
+    SQLite), a hit of a later backend is copied into earlier ones.
+
+    A result is keyed by site name, normalized username, type of the
+    identifier and hash of the site definition.
+    """
+
+    def __init__(
+        self,
+        backends: Optional[List[CacheBackend]] = None,
+        claimed_ttl=24 * 3600,
+        available_ttl=6 * 3600,
+        error_ttl=300,
+    ):
+        self.backends = backends if backends is not None else [MemoryCacheBackend()]
+        self.ttls = {
+            MaigretCheckStatus.CLAIMED: claimed_ttl,
+            MaigretCheckStatus.AVAILABLE: available_ttl,
+            MaigretCheckStatus.UNKNOWN: error_ttl,
+        }
+        # counters for logging
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_path(cls, filename: Optional[str], **kwargs) -> "ResultCache":
+        """In-memory LRU in front of SQLite database (if filename is set)"""
+        backends: List[CacheBackend] = [MemoryCacheBackend()]
+        if filename:
+            backends.append(SQLiteCacheBackend(filename))
+        return cls(backends, **kwargs)
+
+    @staticmethod
+    def make_key(site: MaigretSite, username: str, id_type: str) -> str:
+        return "\x00".join(
+            (site.name, normalize_username(username), id_type, get_site_hash(site))
+        )
+
+    def get(
+        self,
+        site: MaigretSite,
+        username: str,
+        id_type: str,
+        is_parsing_enabled=False,
+    ) -> Optional[QueryResultWrapper]:
+        """Not expired result of a site check, None if there is no one"""
+        key = self.make_key(site, username, id_type)
+        now = time.time()
+        for i, backend in enumerate(self.backends):
+            entry = backend.get(key)
+            if entry is None or entry[0] <= now:
+                continue
+            data = json.loads(entry[1])
+            # found account without extracted ids is checked once more
+            is_claimed = data["status"] == MaigretCheckStatus.CLAIMED.value
+            if is_claimed and is_parsing_enabled and not data["parsing_enabled"]:
+                break
+            for upper_backend in self.backends[:i]:
+                upper_backend.set(key, entry[1], entry[0])
+            self.hits += 1
+            return self.load_result(data, site, username)
+
+        self.misses += 1
+        return None
+
+    def set(
+        self,
+        site: MaigretSite,
+        username: str,
+        id_type: str,
+        results_info: QueryResultWrapper,
+    ):
+        status = results_info["status"]
+        ttl = self.ttls.get(status.status, 0)
+        if not ttl:
+            return
+
+        key = self.make_key(site, username, id_type)
+        value = json.dumps(self.dump_result(results_info), ensure_ascii=False)
+        expires = time.time() + ttl
+        for backend in self.backends:
+            backend.set(key, value, expires)
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    @staticmethod
+    def dump_result(results_info: QueryResultWrapper) -> Dict[str, Any]:
+        status = results_info["status"]
+        error = status.error
+        data = {field: results_info.get(field) for field in CACHED_FIELDS}
+        data.update(
+            {
+                "parsing_enabled": results_info["parsing_enabled"],
+                "status": status.status.value,
+                "url": status.site_url_user,
+                "ids_data": status.ids_data,
+                "query_time": status.query_time,
+                "error": [error.type, error.desc] if error else None,
+                "cached_at": time.time(),
+            }
+        )
+        return data
+
+    @staticmethod
+    def load_result(
+        data: Dict[str, Any], site: MaigretSite, username: str
+    ) -> QueryResultWrapper:
+        error = data["error"]
+        status = MaigretCheckResult(
+            username,
+            site.pretty_name,
+            data["url"],
+            MaigretCheckStatus(data["status"]),
+            ids_data=data["ids_data"],
+            query_time=data["query_time"],
+            error=CheckError(*error) if error else None,
+            tags=site.tags,
+        )
+        results_info: QueryResultWrapper = {
+            "site": site,
+            "username": username,
+            "parsing_enabled": data["parsing_enabled"],
+            "url_main": site.url_main,
+            "status": status,
+            "is_similar": site.similar_search,
+            "rank": site.alexa_rank,
+            "is_cached": True,
+            "cached_at": data["cached_at"],
+        }
+        for field in CACHED_FIELDS:
+            if data.get(field) is not None:
+                results_info[field] = data[field]
+        return results_info
@@ -1,21 +1,34 @@
 # Standard library imports
 import ast
 import asyncio
+import codecs
 import logging
+import math
 import random
-import re
+import socket
 import ssl
 import sys
-from typing import Dict, List, Optional, Tuple
-from urllib.parse import quote
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
 # Third party imports
 import aiodns
 from alive_progress import alive_bar
-from aiohttp import ClientSession, TCPConnector, http_exceptions
+from aiohttp import ClientSession, DummyCookieJar, TCPConnector, http_exceptions
 from aiohttp.client_exceptions import ClientConnectorError, ServerDisconnectedError
 from python_socks import _errors as proxy_errors
-from socid_extractor import extract
 
 try:
     from mock import Mock
@@ -23,13 +36,20 @@ except ImportError:
     from unittest.mock import Mock
 
 # Local imports
-from . import errors
-from .activation import ParsingActivator, import_aiohttp_cookies
+from .activation import SiteActivator, import_aiohttp_cookies
+from .extraction import IdsExtractor
+from .frontier import SearchFrontier
+from .cache import ResultCache
 from .errors import CheckError
-from .executors import AsyncioQueueGeneratorExecutor
+from .executors import AsyncioHostAwareExecutor
+from .hedging import HedgingPolicy
+from .history import SelfCheckHistory
+from .resolver import CachingResolver, DNSCache, make_resolve_result
 from .result import MaigretCheckResult, MaigretCheckStatus
-from .sites import MaigretDatabase, MaigretSite
-from .types import QueryOptions, QueryResultWrapper
+from .retry import RETRY_AFTER_STATUSES, RetryPolicy, parse_retry_after
+from .sites import CheckPlan, MaigretDatabase, MaigretSite, SiteMarkers
+from .stats import RequestTiming, SitesStatsStore, make_trace_config
+from .types import QueryDraft, QueryOptions, QueryResultWrapper
 from .utils import ascii_data_display, get_random_user_agent
 
 
@@ -47,35 +67,170 @@ SUPPORTED_IDS = (
 
 BAD_CHARS = "#"
 
+STREAM_CHUNK_SIZE = 16 * 1024
+# pages are cut at the size by the CLI and MaigretService, sites can override it
+DEFAULT_MAX_BODY_SIZE = 2 * 1024 * 1024
+
 
 class CheckerBase:
     pass
 
 
+async def read_response_text(
+    response,
+    stop_markers: Collection[str],
+    max_body_size=0,
+    chunk_size=STREAM_CHUNK_SIZE,
+) -> Tuple[str, Optional[str]]:
+    """
+    Read and decode response body by chunks, stop downloading as soon as
+    one of the markers is found or the size limit is exceeded.
+    Return the text read and the marker found, the first one of
+    stop_markers if several are found at once.
+    """
+    charset = response.charset or "utf-8"
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors="ignore")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+
+    # keep the end of the previous chunk to find markers split between chunks
+    overlap = max(map(len, stop_markers), default=1) - 1
+    parts = []
+    tail = ''
+    size = 0
+    found_marker = None
+
+    async for chunk in response.content.iter_chunked(chunk_size):
+        size += len(chunk)
+        text = decoder.decode(chunk)
+        parts.append(text)
+
+        window = tail + text
+        found_marker = next((m for m in stop_markers if m in window), None)
+        if found_marker is not None:
+            response.close()
+            break
+        if max_body_size and size >= max_body_size:
+            response.close()
+            break
+        tail = window[-overlap:] if overlap else ''
+    else:
+        parts.append(decoder.decode(b'', final=True))
+
+    return ''.join(parts), found_marker
+
+
 class SimpleAiohttpChecker(CheckerBase):
     def __init__(self, *args, **kwargs):
         self.proxy = kwargs.get('proxy')
         self.cookie_jar = kwargs.get('cookie_jar')
         self.logger = kwargs.get('logger', Mock())
+        # connection pool settings, shared by all the checks of the checker
+        self.connections_limit = kwargs.get('connections_limit', 100)
+        self.connections_per_host_limit = kwargs.get('connections_per_host_limit', 0)
+        self.keepalive_timeout = kwargs.get('keepalive_timeout', 15)
+        self.dns_cache = kwargs.get('dns_cache') or DNSCache()
+        self.resolver = None
+        self.session = None
         self.url = None
         self.headers = None
         self.allow_redirects = True
         self.timeout = 0
         self.method = 'get'
-
-    def prepare(self, url, headers=None, allow_redirects=True, timeout=0, method='get'):
+        self.stop_markers = None
+        self.max_body_size = 0
+
+    def prepare(
+        self,
+        url,
+        headers=None,
+        allow_redirects=True,
+        timeout=0,
+        method='get',
+        stop_markers=None,
+        max_body_size=0,
+    ):
         self.url = url
         self.headers = headers
         self.allow_redirects = allow_redirects
         self.timeout = timeout
         self.method = method
+        self.stop_markers = stop_markers
+        self.max_body_size = max_body_size
         return None
 
+    def get_resolver(self) -> CachingResolver:
+        if self.resolver is None:
+            self.resolver = CachingResolver(self.dns_cache)
+        return self.resolver
+
+    def make_connector(self):
+        from aiohttp_socks import ProxyConnector
+
+        pool_options = {
+            'limit': self.connections_limit,
+            'limit_per_host': self.connections_per_host_limit,
+            'keepalive_timeout': self.keepalive_timeout,
+        }
+
+        if self.proxy:
+            connector = ProxyConnector.from_url(self.proxy, ssl=False, **pool_options)
+        else:
+            # resolver caches hosts by itself
+            connector = TCPConnector(
+                ssl=False,
+                resolver=self.get_resolver(),
+                use_dns_cache=False,
+                **pool_options,
+            )
+
+        return connector
+
+    async def resolve_hosts(self, hosts, concurrency=50, timeout=5.0) -> Set[str]:
+        """Warm up DNS cache, return failed hosts"""
+        # hosts are resolved by proxy
+        if self.proxy:
+            return set()
+        return await self.get_resolver().resolve_hosts(hosts, concurrency, timeout)
+
+    def get_session(self) -> ClientSession:
+        """
+        Return the pooled session of the checker, create it on the first call.
+        All the checks share it, so keep-alive connections are reused.
+        """
+        if self.session is None or self.session.closed:
+            self.session = ClientSession(
+                connector=self.make_connector(),
+                trust_env=True,
+                # cookies set by sites must not leak to other checks of the
+                # shared session, only the ones of a cookies file are sent
+                cookie_jar=self.cookie_jar if self.cookie_jar else DummyCookieJar(),
+                trace_configs=[make_trace_config()],
+            )
+        return self.session
+
     async def close(self):
-        pass
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+        if self.resolver is not None:
+            await self.resolver.close()
+        self.resolver = None
 
     async def _make_request(
-        self, session, url, headers, allow_redirects, timeout, method, logger
+        self,
+        session,
+        url,
+        headers,
+        allow_redirects,
+        timeout,
+        method,
+        logger,
+        stop_markers=None,
+        max_body_size=0,
+        timing: Optional[RequestTiming] = None,
     ) -> Tuple[str, int, Optional[CheckError]]:
         try:
             request_method = session.get if method == 'get' else session.head
@@ -84,13 +239,29 @@ class SimpleAiohttpChecker(CheckerBase):
                 headers=headers,
                 allow_redirects=allow_redirects,
                 timeout=timeout,
+                trace_request_ctx=timing,
             ) as response:
                 status_code = response.status
-                response_content = await response.content.read()
-                charset = response.charset or "utf-8"
-                decoded_content = response_content.decode(charset, "ignore")
-
                 error = CheckError("Connection lost") if status_code == 0 else None
+                if stop_markers or max_body_size:
+                    decoded_content, marker = await read_response_text(
+                        response, stop_markers or {}, max_body_size
+                    )
+                    # markers are errors of a page, it's not scanned again
+                    if marker is not None and error is None:
+                        error = stop_markers[marker]
+                else:
+                    response_content = await response.content.read()
+                    charset = response.charset or "utf-8"
+                    decoded_content = response_content.decode(charset, "ignore")
+
+                if timing is not None:
+                    timing.bytes = response.content.total_bytes
+                    if status_code in RETRY_AFTER_STATUSES:
+                        timing.retry_after = parse_retry_after(
+                            response.headers.get("Retry-After")
+                        )
+
                 logger.debug(decoded_content)
 
                 return decoded_content, status_code, error
@@ -117,43 +288,57 @@ class SimpleAiohttpChecker(CheckerBase):
                 logger.debug(e, exc_info=True)
                 return None, 0, CheckError("Unexpected", str(e))
 
-    async def check(self) -> Tuple[str, int, Optional[CheckError]]:
-        from aiohttp_socks import ProxyConnector
+    def check(
+        self, timing: Optional[RequestTiming] = None
+    ) -> Awaitable[Tuple[str, int, Optional[CheckError]]]:
+        """
+        Make the prepared request. The checker is shared between concurrent
+        checks, so the prepared params are bound right away and the checker
+        can be prepared for the next request before the result is awaited.
+        """
+        return self._check(
+            self.url,
+            self.headers,
+            self.allow_redirects,
+            self.timeout,
+            self.method,
+            self.stop_markers,
+            self.max_body_size,
+            timing,
+        )
 
-        connector = (
-            ProxyConnector.from_url(self.proxy)
-            if self.proxy
-            else TCPConnector(ssl=False)
+    async def _check(
+        self,
+        url,
+        headers,
+        allow_redirects,
+        timeout,
+        method,
+        stop_markers,
+        max_body_size,
+        timing: Optional[RequestTiming],
+    ) -> Tuple[str, int, Optional[CheckError]]:
+        html_text, status_code, error = await self._make_request(
+            self.get_session(),
+            url,
+            headers,
+            allow_redirects,
+            timeout,
+            method,
+            self.logger,
+            stop_markers,
+            max_body_size,
+            timing,
         )
-        connector.verify_ssl = False
-
-        async with ClientSession(
-            connector=connector,
-            trust_env=True,
-            # TODO: tests
-            cookie_jar=self.cookie_jar if self.cookie_jar else None,
-        ) as session:
-            html_text, status_code, error = await self._make_request(
-                session,
-                self.url,
-                self.headers,
-                self.allow_redirects,
-                self.timeout,
-                self.method,
-                self.logger,
-            )
 
-            if error and str(error) == "Invalid proxy response":
-                self.logger.debug(error, exc_info=True)
+        if error and str(error) == "Invalid proxy response":
+            self.logger.debug(error, exc_info=True)
 
-            return str(html_text) if html_text else '', status_code, error
+        return str(html_text) if html_text else '', status_code, error
 
 
 class ProxiedAiohttpChecker(SimpleAiohttpChecker):
-    def __init__(self, *args, **kwargs):
-        self.proxy = kwargs.get('proxy')
-        self.cookie_jar = kwargs.get('cookie_jar')
-        self.logger = kwargs.get('logger', Mock())
+    pass
 
 
 class AiodnsDomainResolver(CheckerBase):
@@ -163,38 +348,75 @@ class AiodnsDomainResolver(CheckerBase):
     def __init__(self, *args, **kwargs):
         loop = asyncio.get_event_loop()
         self.logger = kwargs.get('logger', Mock())
+        self.dns_cache = kwargs.get('dns_cache') or DNSCache()
         self.resolver = aiodns.DNSResolver(loop=loop)
 
-    def prepare(self, url, headers=None, allow_redirects=True, timeout=0, method='get'):
+    def prepare(
+        self,
+        url,
+        headers=None,
+        allow_redirects=True,
+        timeout=0,
+        method='get',
+        stop_markers=None,
+        max_body_size=0,
+    ):
         self.url = url
         return None
 
-    async def check(self) -> Tuple[str, int, Optional[CheckError]]:
+    async def check(
+        self, timing: Optional[RequestTiming] = None
+    ) -> Tuple[str, int, Optional[CheckError]]:
+        domain = self.url
         status = 404
         error = None
         text = ''
 
+        if self.dns_cache.is_failed(domain, socket.AF_INET):
+            return text, status, error
+
+        cached_ip = self.dns_cache.get_address(domain, socket.AF_INET)
+        if cached_ip:
+            return cached_ip, 200, error
+
         try:
-            res = await self.resolver.query(self.url, 'A')
+            res = await self.resolver.query(domain, 'A')
             text = str(res[0].host)
             status = 200
+            self.dns_cache.set(
+                domain, [make_resolve_result(domain, text)], socket.AF_INET
+            )
         except aiodns.error.DNSError:
-            pass
+            self.dns_cache.set_failed(domain, socket.AF_INET)
         except Exception as e:
             self.logger.error(e, exc_info=True)
             error = CheckError('DNS resolve error', str(e))
 
         return text, status, error
 
+    async def close(self):
+        pass
+
 
 class CheckerMock:
     def __init__(self, *args, **kwargs):
         pass
 
-    def prepare(self, url, headers=None, allow_redirects=True, timeout=0, method='get'):
+    def prepare(
+        self,
+        url,
+        headers=None,
+        allow_redirects=True,
+        timeout=0,
+        method='get',
+        stop_markers=None,
+        max_body_size=0,
+    ):
         return None
 
-    async def check(self) -> Tuple[str, int, Optional[CheckError]]:
+    async def check(
+        self, timing: Optional[RequestTiming] = None
+    ) -> Tuple[str, int, Optional[CheckError]]:
         await asyncio.sleep(0)
         return '', 0, None
 
@@ -204,15 +426,12 @@ class CheckerMock:
 
 # TODO: move to separate class
 def detect_error_page(
-    html_text, status_code, fail_flags, ignore_403
+    html_text, status_code, markers: SiteMarkers, ignore_403, is_scanned=False
 ) -> Optional[CheckError]:
-    # Detect service restrictions such as a country restriction
-    for flag, msg in fail_flags.items():
-        if flag in html_text:
-            return CheckError("Site-specific", msg)
-
-    # Detect common restrictions such as provider censorship and bot protection
-    err = errors.detect(html_text)
+    # Detect service restrictions such as a country restriction,
+    # then common restrictions such as provider censorship and bot protection;
+    # pages read by stop markers are already scanned, see read_response_text
+    err = None if is_scanned else markers.detect_error(html_text)
     if err:
         return err
 
@@ -220,6 +439,9 @@ def detect_error_page(
     if status_code == 403 and not ignore_403:
         return CheckError("Access denied", "403 status code, use proxy/vpn")
 
+    elif status_code == 429:
+        return CheckError("Too many requests", "429 status code")
+
     elif status_code >= 500:
         return CheckError("Server", f"{status_code} status code")
 
@@ -235,7 +457,12 @@ def debug_response_logging(url, html_text, status_code, check_error):
 
 
 def process_site_result(
-    response, query_notify, logger, results_info: QueryResultWrapper, site: MaigretSite
+    response,
+    query_notify,
+    logger,
+    results_info: QueryResultWrapper,
+    site: MaigretSite,
+    timing: Optional[RequestTiming] = None,
 ):
     if not response:
         return results_info
@@ -244,7 +471,6 @@ def process_site_result(
 
     # Retrieve other site information again
     username = results_info["username"]
-    is_parsing_enabled = results_info["parsing_enabled"]
     url = results_info.get("url_user")
     logger.info(url)
 
@@ -263,59 +489,38 @@ def process_site_result(
 
     html_text, status_code, check_error = response
 
-    # TODO: add elapsed request time counting
-    response_time = None
+    response_time = timing.total if timing else None
 
     if logger.level == logging.DEBUG:
         debug_response_logging(url, html_text, status_code, check_error)
 
+    markers = site.markers
+
     # additional check for errors
     if status_code and not check_error:
         check_error = detect_error_page(
-            html_text, status_code, site.errors_dict, site.ignore403
+            html_text,
+            status_code,
+            markers,
+            site.ignore403,
+            is_scanned=bool(results_info.get("request", {}).get("stop_markers")),
         )
 
-    # parsing activation
-    is_need_activation = any(
-        [s for s in site.activation.get("marks", []) if s in html_text]
-    )
-
-    if site.activation and html_text and is_need_activation:
-        logger.debug(f"Activation for {site.name}")
-        method = site.activation["method"]
-        try:
-            activate_fun = getattr(ParsingActivator(), method)
-            # TODO: async call
-            activate_fun(site, logger)
-        except AttributeError as e:
-            logger.warning(
-                f"Activation method {method} for site {site.name} not found!",
-                exc_info=True,
-            )
-        except Exception as e:
-            logger.warning(
-                f"Failed activation {method} for site {site.name}: {str(e)}",
-                exc_info=True,
-            )
-        # TODO: temporary check error
-
     site_name = site.pretty_name
     # presense flags
-    # True by default
-    presense_flags = site.presense_strs
+    # True by default, page with an error is not scanned
     is_presense_detected = False
 
-    if html_text:
-        if not presense_flags:
+    if html_text and not check_error:
+        if not markers.presense_strs:
             is_presense_detected = True
             site.stats["presense_flag"] = None
         else:
-            for presense_flag in presense_flags:
-                if presense_flag in html_text:
-                    is_presense_detected = True
-                    site.stats["presense_flag"] = presense_flag
-                    logger.debug(presense_flag)
-                    break
+            presense_flag = markers.detect_presense(html_text)
+            if presense_flag:
+                is_presense_detected = True
+                site.stats["presense_flag"] = presense_flag
+                logger.debug(presense_flag)
 
     def build_result(status, **kwargs):
         return MaigretCheckResult(
@@ -342,9 +547,7 @@ def process_site_result(
         )
     elif check_type == "message":
         # Checks if the error message is in the HTML
-        is_absence_detected = any(
-            [(absence_flag in html_text) for absence_flag in site.absence_strs]
-        )
+        is_absence_detected = markers.is_absence_detected(html_text)
         if not is_absence_detected and is_presense_detected:
             result = build_result(MaigretCheckStatus.CLAIMED)
         else:
@@ -371,28 +574,42 @@ def process_site_result(
             f"Unknown check type '{check_type}' for " f"site '{site.name}'"
         )
 
-    extracted_ids_data = {}
-
-    if is_parsing_enabled and result.status == MaigretCheckStatus.CLAIMED:
-        extracted_ids_data = extract_ids_data(html_text, logger, site)
-        if extracted_ids_data:
-            new_usernames = parse_usernames(extracted_ids_data, logger)
-            results_info = update_results_info(
-                results_info, extracted_ids_data, new_usernames
-            )
-            result.ids_data = extracted_ids_data
-
     # Save status of request
     results_info["status"] = result
 
     # Save results from request
     results_info["http_status"] = status_code
+    results_info["timing"] = timing
     results_info["is_similar"] = site.similar_search
     # results_site['response_text'] = html_text
     results_info["rank"] = site.alexa_rank
     return results_info
 
 
+def get_stop_markers(site: MaigretSite) -> Mapping[str, CheckError]:
+    """
+    Page markers after which the rest of the page can't change the check
+    result, so downloading can be stopped, with their errors. These are
+    error markers only: an error later in a page overrides presence and
+    absence markers.
+    """
+    # activation and other check types need the whole page
+    if site.check_type != "message" or site.activation:
+        return {}
+
+    return site.markers.stop_markers
+
+
+def is_extraction_needed(site: MaigretSite, options: QueryOptions) -> bool:
+    """Sites which have never yielded ids data are not parsed, see SitesStatsStore"""
+    stats_store = options.get("stats_store")
+    return stats_store is None or stats_store.is_extraction_needed(site.name)
+
+
+# fields of a site check result used only while the check is made
+TRANSIENT_RESULT_FIELDS = ("future", "request", "checker", "cookies")
+
+
 def make_site_result(
     site: MaigretSite, username: str, options: QueryOptions, logger, *args, **kwargs
 ) -> QueryResultWrapper:
@@ -409,28 +626,21 @@ def make_site_result(
         or None
     )
 
-    headers = {
-        "User-Agent": get_random_user_agent(),
-        # tell server that we want to close connection after request
-        "Connection": "close",
-    }
-
-    headers.update(site.headers)
-
     if "url" not in site.__dict__:
         logger.error("No URL for site %s", site.name)
 
-    if kwargs.get('retry') and hasattr(site, "mirrors"):
-        site.url_main = random.choice(site.mirrors)
-        logger.info(f"Use {site.url_main} as a main url of site {site}")
+    plan = site.check_plan
+    if kwargs.get('retry') and getattr(site, "mirrors", None):
+        # the site is shared by all the checks, so a mirror is used for this one only
+        url_main = random.choice(site.mirrors)
+        plan = CheckPlan(site, url_main=url_main)
+        logger.info(f"Use {url_main} as a main url of site {site}")
 
     # URL of user on site (if it exists)
-    url = site.url.format(
-        urlMain=site.url_main, urlSubpath=site.url_subpath, username=quote(username)
-    )
+    url = plan.make_url(username)
 
-    # workaround to prevent slash errors
-    url = re.sub("(?<!:)/+", "/", url)
+    # adaptive timeout of the site or the global one
+    timeout = kwargs.get('timeout') or options['timeout']
 
     # always clearweb_checker for now
     checker = options["checkers"][site.protocol]
@@ -446,7 +656,7 @@ def make_site_result(
             error=CheckError("Check is disabled"),
         )
     # current username type could not be applied
-    elif site.type != options["id_type"]:
+    elif options["id_type"] and site.type != options["id_type"]:
         results_site["status"] = MaigretCheckResult(
             username,
             site.name,
@@ -455,14 +665,14 @@ def make_site_result(
             error=CheckError('Unsupported identifier type', f'Want "{site.type}"'),
         )
     # username is not allowed.
-    elif site.regex_check and re.search(site.regex_check, username) is None:
+    elif not plan.is_username_allowed(username):
         results_site["status"] = MaigretCheckResult(
             username,
             site.name,
             url,
             MaigretCheckStatus.ILLEGAL,
             error=CheckError(
-                'Unsupported username format', f'Want "{site.regex_check}"'
+                'Unsupported username format', f'Want "{plan.regex_check}"'
             ),
         )
         results_site["url_user"] = ""
@@ -472,53 +682,27 @@ def make_site_result(
     else:
         # URL of user on site (if it exists)
         results_site["url_user"] = url
-        url_probe = site.url_probe
-        if url_probe is None:
-            # Probe URL is normal one seen by people out on the web.
-            url_probe = url
-        else:
-            # There is a special URL for probing existence separate
-            # from where the user profile normally can be found.
-            url_probe = url_probe.format(
-                urlMain=site.url_main,
-                urlSubpath=site.url_subpath,
-                username=username,
-            )
 
-        for k, v in site.get_params.items():
-            url_probe += f"&{k}={v}"
-
-        if site.check_type == "status_code" and site.request_head_only:
-            # In most cases when we are detecting by status code,
-            # it is not necessary to get the entire body:  we can
-            # detect fine with just the HEAD response.
-            request_method = 'head'
-        else:
-            # Either this detect method needs the content associated
-            # with the GET response, or this specific website will
-            # not respond properly unless we request the whole page.
-            request_method = 'get'
-
-        if site.check_type == "response_url":
-            # Site forwards request to a different URL if username not
-            # found.  Disallow the redirect so we can capture the
-            # http status from the original URL request.
-            allow_redirects = False
-        else:
-            # Allow whatever redirect that the site wants to do.
-            # The final result of the request will be what is available.
-            allow_redirects = True
-
-        future = checker.prepare(
-            method=request_method,
-            url=url_probe,
-            headers=headers,
-            allow_redirects=allow_redirects,
-            timeout=options['timeout'],
-        )
+        headers = plan.make_headers(get_random_user_agent())
+        activator = options.get("activator")
+        if site.activation and activator is not None:
+            headers.update(activator.get_headers(site))
+
+        request = {
+            "method": plan.method,
+            "url": plan.make_probe_url(username, url),
+            "headers": headers,
+            "allow_redirects": plan.allow_redirects,
+            "timeout": timeout,
+            "stop_markers": get_stop_markers(site),
+            "max_body_size": site.max_body_size or options.get("max_body_size", 0),
+        }
+        future = checker.prepare(**request)
 
         # Store future request object in the results object
         results_site["future"] = future
+        # params to repeat the request, e.g. hedged one
+        results_site["request"] = request
 
     results_site["checker"] = checker
 
@@ -528,27 +712,161 @@ def make_site_result(
 async def check_site_for_username(
     site, username, options: QueryOptions, logger, query_notify, *args, **kwargs
 ) -> Tuple[str, QueryResultWrapper]:
+    retry_policy = options.get("retry_policy")
+    attempt = 0
+    while True:
+        response_result, response, timing = await check_site_once(
+            site,
+            username,
+            options,
+            logger,
+            query_notify,
+            attempt=attempt,
+            timeout=kwargs.get('timeout'),
+        )
+        if response is None:
+            # no request was made
+            break
+
+        status = response_result["status"]
+        if retry_policy is None or status.status != MaigretCheckStatus.UNKNOWN:
+            break
+        delay = retry_policy.acquire(attempt, status.error, timing.retry_after)
+        if delay is None:
+            break
+
+        attempt += 1
+        logger.info(
+            f"Retrying {site.name} in {delay:.2f}s after {status.error} "
+            f"(attempt {attempt})"
+        )
+        await asyncio.sleep(delay)
+
+    query_notify.update(response_result['status'], site.similar_search)
+
+    # request objects are not needed anymore, but results of all the sites
+    # are kept till the end of the search (and longer by the reports)
+    for field in TRANSIENT_RESULT_FIELDS:
+        response_result.pop(field, None)
+
+    return site.name, response_result
+
+
+async def check_site_once(
+    site,
+    username,
+    options: QueryOptions,
+    logger,
+    query_notify,
+    attempt=0,
+    timeout=None,
+    activated=False,
+) -> Tuple[QueryResultWrapper, Optional[Tuple], Optional[RequestTiming]]:
+    """
+    Make one check of a site, return its result, raw response and timing.
+    Response is None if no request was made (e.g. the site is disabled).
+    A check of a site needing activation is repeated once after it.
+    """
+    activator = options.get("activator")
+    if site.activation and activator is not None:
+        # don't make a request with a token being renewed or expired
+        await activator.wait(site, logger)
+
     default_result = make_site_result(
-        site, username, options, logger, retry=kwargs.get('retry')
+        site,
+        username,
+        options,
+        logger,
+        retry=attempt,
+        timeout=timeout,
     )
-    # future = default_result.get("future")
-    # if not future:
-    # return site.name, default_result
 
     checker = default_result.get("checker")
     if not checker:
         print(f"error, no checker for {site.name}")
-        return site.name, default_result
+        return default_result, None, None
+
+    if "status" in default_result:
+        return default_result, None, None
 
-    response = await checker.check()
+    timing = RequestTiming()
+    requested_at = time.time()
+
+    host = site.request_host
+    if host in options.get("failed_hosts", ()):
+        # don't wait for the request timeout, domain is already known as failed
+        response = ('', 0, CheckError('DNS resolve error', f'{host} is not resolved'))
+    else:
+        hedging = options.get("hedging")
+        delay = None
+        if hedging is not None and isinstance(checker, SimpleAiohttpChecker):
+            delay = hedging.get_delay(site.name)
+
+        if delay is None:
+            response = await checker.check(timing=timing)
+        else:
+            request = default_result["request"]
+
+            def make_check(url, request_timing):
+                checker.prepare(**{**request, "url": url})
+                return checker.check(timing=request_timing)
+
+            response, timing = await hedging.check(
+                make_check, site, request["url"], delay, timing, request["timeout"]
+            )
+    timing.finish()
+
+    if (
+        not activated
+        and activator is not None
+        and activator.is_activation_needed(site, response[0])
+        and await activator.activate(site, logger, since=requested_at)
+    ):
+        return await check_site_once(
+            site,
+            username,
+            options,
+            logger,
+            query_notify,
+            attempt=attempt,
+            timeout=timeout,
+            activated=True,
+        )
 
     response_result = process_site_result(
-        response, query_notify, logger, default_result, site
+        response, query_notify, logger, default_result, site, timing
     )
 
-    query_notify.update(response_result['status'], site.similar_search)
+    stats_store = options.get("stats_store")
 
-    return site.name, response_result
+    if (
+        response_result["parsing_enabled"]
+        and response_result["status"].status == MaigretCheckStatus.CLAIMED
+        and is_extraction_needed(site, options)
+    ):
+        response_result = await extract_ids_to_result(
+            response_result, response[0], logger, site, options.get("extractor")
+        )
+        if stats_store is not None:
+            stats_store.update_extraction(
+                site.name, bool(response_result["status"].ids_data)
+            )
+
+    if stats_store is not None:
+        error = response[2]
+        # timed out check is counted with its timeout as a latency,
+        # so an adaptive timeout grows for a slowed down site
+        is_timeout = error is not None and error.type == "Request timeout"
+        status = response_result["status"].status
+        stats_store.update(
+            site.name,
+            timing,
+            is_error=status == MaigretCheckStatus.UNKNOWN,
+            is_latency_known=bool(response[1]) or is_timeout,
+            is_claimed=status == MaigretCheckStatus.CLAIMED,
+        )
+
+    return response_result, response, timing
 
 
 async def debug_ip_request(checker, logger):
@@ -560,21 +878,121 @@ async def debug_ip_request(checker, logger):
         logger.debug(f"IP requesting {check_error.type}: {check_error.desc}")
 
 
-def get_failed_sites(results: Dict[str, QueryResultWrapper]) -> List[str]:
-    sites = []
-    for sitename, r in results.items():
-        status = r.get('status', {})
-        if status and status.error:
-            if errors.is_permanent(status.error.type):
-                continue
-            sites.append(sitename)
-    return sites
+def get_host_key(site: MaigretSite, dns_cache: DNSCache) -> str:
+    """Key to group requests to the same server: IP address if it's known"""
+    host = site.request_host or site.url_host
+    return dns_cache.get_address(host) or host
+
+
+def make_checkers(
+    logger,
+    proxy=None,
+    tor_proxy=None,
+    i2p_proxy=None,
+    cookie_jar=None,
+    check_domains=False,
+    dns_cache=None,
+    **pool_options,
+) -> dict:
+    """Make checkers for all the supported protocols of sites"""
+    # one DNS cache for all the checkers
+    pool_options['dns_cache'] = dns_cache or DNSCache()
+
+    clearweb_checker = SimpleAiohttpChecker(
+        proxy=proxy, cookie_jar=cookie_jar, logger=logger, **pool_options
+    )
+
+    # TODO
+    tor_checker = CheckerMock()
+    if tor_proxy:
+        tor_checker = ProxiedAiohttpChecker(  # type: ignore
+            proxy=tor_proxy, cookie_jar=cookie_jar, logger=logger, **pool_options
+        )
+
+    # TODO
+    i2p_checker = CheckerMock()
+    if i2p_proxy:
+        i2p_checker = ProxiedAiohttpChecker(  # type: ignore
+            proxy=i2p_proxy, cookie_jar=cookie_jar, logger=logger, **pool_options
+        )
+
+    # TODO
+    dns_checker = CheckerMock()
+    if check_domains:
+        dns_checker = AiodnsDomainResolver(  # type: ignore
+            logger=logger, dns_cache=pool_options['dns_cache']
+        )
+
+    return {
+        '': clearweb_checker,
+        'tor': tor_checker,
+        'dns': dns_checker,
+        'i2p': i2p_checker,
+    }
+
+
+def make_unfinished_result(site: MaigretSite, username: str) -> QueryResultWrapper:
+    """Result of a site not checked before the search deadline"""
+    return {
+        'site': site,
+        'username': username,
+        'url_main': site.url_main,
+        'status': MaigretCheckResult(
+            username,
+            site.name,
+            '',
+            MaigretCheckStatus.UNKNOWN,
+            error=CheckError('Deadline exceeded', 'Site was not checked in time'),
+        ),
+        'is_unfinished': True,
+    }
 
 
 async def maigret(
     username: str,
     site_dict: Dict[str, MaigretSite],
     logger,
+    *args,
+    **kwargs,
+) -> QueryResultWrapper:
+    """Main search func
+
+    Checks for existence of username on certain sites.
+
+    Keyword Arguments:
+    username               -- Username string will be used for search.
+    site_dict              -- Dictionary containing sites data in MaigretSite objects.
+    logger                 -- Standard Python logger object.
+
+    See maigret_batch() for the rest of arguments.
+
+    Return Value:
+    Dictionary containing results from report. Key of dictionary is the name
+    of the social network site, and the value is another dictionary with
+    the following keys:
+        url_main:      URL of main site.
+        url_user:      URL of user on site (if account exists).
+        status:        QueryResult() object indicating results of test for
+                       account existence.
+        http_status:   HTTP status code of query which checked for existence on
+                       site.
+        response_text: Text that came back from request.  May be None if
+                       there was an HTTP error when checking for existence.
+        timing:        RequestTiming() object with DNS, connect, TTFB and
+                       total times of the request.
+    """
+    all_results: Dict[str, QueryResultWrapper] = {}
+    async for _, sitename, result in maigret_batch(
+        [username], site_dict, logger, *args, **kwargs
+    ):
+        all_results[sitename] = result
+    return all_results
+
+
+async def maigret_batch(
+    usernames: List[str],
+    site_dict: Dict[str, MaigretSite],
+    logger,
     query_notify=None,
     proxy=None,
     tor_proxy=None,
@@ -589,15 +1007,39 @@ async def maigret(
     cookies=None,
     retries=0,
     check_domains=False,
+    max_connections_per_host=4,
+    keepalive_timeout=15,
+    checkers=None,
+    prewarm_dns=True,
+    dns_concurrency=50,
+    dns_timeout=5.0,
+    max_body_size=0,
+    stats_store: Optional[SitesStatsStore] = None,
+    adaptive_timeout=False,
+    timeout_factor=2.0,
+    min_timeout=1.0,
+    max_timeout=None,
+    deadline: Optional[float] = None,
+    hedging=False,
+    max_hedge_ratio=0.2,
+    max_retry_ratio=0.2,
+    result_cache: Optional[ResultCache] = None,
+    bypass_cache=False,
+    site_usernames: Optional[Dict[str, List[str]]] = None,
+    activator: Optional[SiteActivator] = None,
+    extractor: Optional[IdsExtractor] = None,
+    frontier: Optional[SearchFrontier] = None,
     *args,
     **kwargs,
-) -> QueryResultWrapper:
-    """Main search func
+) -> AsyncIterator[Tuple[str, str, QueryResultWrapper]]:
+    """Batch search func
 
-    Checks for existence of username on certain sites.
+    Checks for existence of usernames on certain sites. Checks of all the
+    sites for all the usernames are made by one scheduler with one
+    connection pool, results are yielded as soon as they are ready.
 
     Keyword Arguments:
-    username               -- Username string will be used for search.
+    usernames              -- Usernames (of the same id_type) to search.
     site_dict              -- Dictionary containing sites data in MaigretSite objects.
     query_notify           -- Object with base type of QueryNotify().
                               This will be used to notify the caller about
@@ -611,95 +1053,235 @@ async def maigret(
                               https://maigret.readthedocs.io/en/latest/supported-identifier-types.html
     max_connections        -- Maximum number of concurrent connections allowed.
                               Default is 100.
+    max_connections_per_host -- Maximum number of concurrent connections to
+                              the same host, 0 means no limit. Default is 4.
+    keepalive_timeout      -- Time in seconds to keep idle connections of the
+                              shared pool open. Default is 15 seconds.
+    checkers               -- Already initialized checkers by protocol, see
+                              make_checkers(). They are not closed after the
+                              search, so their pools can be reused.
+    prewarm_dns            -- Resolve hosts of all the sites before checks,
+                              sites with unresolved hosts fail immediately.
+                              Default is True.
+    dns_concurrency        -- Maximum number of concurrent DNS resolvings
+                              while prewarming. Default is 50.
+    dns_timeout            -- Time in seconds to wait for a host while
+                              prewarming, so a slow lookup doesn't delay all
+                              the checks; hosts not resolved in time are
+                              checked as usual. Default is 5.
+    max_body_size          -- Maximum size in bytes of a page to download,
+                              sites can override it. Default is 0 (no limit),
+                              the CLI uses DEFAULT_MAX_BODY_SIZE (2 MiB).
+    stats_store            -- SitesStatsStore to collect timings, errors and
+                              traffic of checked sites. It's not saved by
+                              the search. Default is None.
+    adaptive_timeout       -- Use timeouts of sites derived from their latencies
+                              in stats_store: p95 * timeout_factor clamped to
+                              [min_timeout, max_timeout]. The global timeout
+                              is a ceiling. Default is False.
+    deadline               -- Timestamp (as time.time()) to finish the search at.
+                              Sites are checked in order of expected value
+                              (claim rate / latency from stats_store), sites
+                              not checked in time get "Deadline exceeded"
+                              error. Default is None (no limit).
+    hedging                -- Repeat requests to sites not answered by their
+                              p90 latency from stats_store (to a mirror if
+                              any) and take the first answer, see
+                              HedgingPolicy. Default is False.
+    max_hedge_ratio        -- Maximum share of hedged requests among checks.
+                              Default is 0.2.
+    retries                -- Count of retries of a site check failed with
+                              a temporary error. Retries are made at once
+                              after a jittered exponential backoff (or
+                              Retry-After delay of 429/503 responses), see
+                              RetryPolicy. Default is 0.
+    max_retry_ratio        -- Maximum share of retried checks among all the
+                              checks of the search. Default is 0.2.
+    result_cache           -- ResultCache to take not expired results of sites
+                              from instead of checking them and to put new
+                              results to. Default is None.
+    bypass_cache           -- Check all the sites ignoring cached results,
+                              new results are still cached. Default is False.
+    site_usernames         -- Usernames to check on each site by its name
+                              instead of `usernames`, as identifiers of the
+                              type of the site (e.g. for self-check).
+                              Default is None.
+    activator              -- SiteActivator to get tokens of sites needing
+                              activation, share it between searches to reuse
+                              the tokens. Default is a new one.
+    extractor              -- IdsExtractor to extract ids data from pages of
+                              found accounts (if is_parsing_enabled), e.g.
+                              by a pool of worker processes. It's not closed
+                              after the search. Default is extraction in
+                              the event loop.
+    frontier               -- SearchFrontier of a recursive search: `usernames`
+                              are added to it, and all its identifiers are
+                              checked on sites of their types, including
+                              ones added while the search goes (e.g. ids
+                              extracted from yielded results). Identifiers
+                              of lower depths are checked first.
+                              Default is None.
     no_progressbar         -- Displaying of ASCII progressbar during scanner.
     cookies                -- Filename of a cookie jar file to use for each request.
 
-    Return Value:
-    Dictionary containing results from report. Key of dictionary is the name
-    of the social network site, and the value is another dictionary with
-    the following keys:
-        url_main:      URL of main site.
-        url_user:      URL of user on site (if account exists).
-        status:        QueryResult() object indicating results of test for
-                       account existence.
-        http_status:   HTTP status code of query which checked for existence on
-                       site.
-        response_text: Text that came back from request.  May be None if
-                       there was an HTTP error when checking for existence.
+    Yields:
+    Tuples of username, site name and result of the site check, see
+    maigret() for its keys.
     """
 
+    def get_usernames(sitename: str) -> List[str]:
+        if site_usernames is None:
+            return usernames
+        return site_usernames.get(sitename, [])
+
+    def get_id_type(site: MaigretSite) -> str:
+        if site_usernames is None and frontier is None:
+            return id_type
+        return site.type
+
     # notify caller that we are starting the query.
     if not query_notify:
         query_notify = Mock()
 
-    query_notify.start(username, id_type)
-
-    cookie_jar = None
-    if cookies:
-        logger.debug(f"Using cookies jar file {cookies}")
-        cookie_jar = import_aiohttp_cookies(cookies)
-
-    clearweb_checker = SimpleAiohttpChecker(
-        proxy=proxy, cookie_jar=cookie_jar, logger=logger
-    )
-
-    # TODO
-    tor_checker = CheckerMock()
-    if tor_proxy:
-        tor_checker = ProxiedAiohttpChecker(  # type: ignore
-            proxy=tor_proxy, cookie_jar=cookie_jar, logger=logger
+    query_notify.start(', '.join(usernames), id_type)
+
+    is_checkers_shared = checkers is not None
+    if not is_checkers_shared:
+        cookie_jar = None
+        if cookies:
+            logger.debug(f"Using cookies jar file {cookies}")
+            cookie_jar = import_aiohttp_cookies(cookies)
+
+        checkers = make_checkers(
+            logger,
+            proxy=proxy,
+            tor_proxy=tor_proxy,
+            i2p_proxy=i2p_proxy,
+            cookie_jar=cookie_jar,
+            check_domains=check_domains,
+            connections_limit=max_connections,
+            connections_per_host_limit=max_connections_per_host,
+            keepalive_timeout=keepalive_timeout,
         )
 
-    # TODO
-    i2p_checker = CheckerMock()
-    if i2p_proxy:
-        i2p_checker = ProxiedAiohttpChecker(  # type: ignore
-            proxy=i2p_proxy, cookie_jar=cookie_jar, logger=logger
-        )
-
-    # TODO
-    dns_checker = CheckerMock()
-    if check_domains:
-        dns_checker = AiodnsDomainResolver(logger=logger)  # type: ignore
+    clearweb_checker = checkers['']
 
     if logger.level == logging.DEBUG:
         await debug_ip_request(clearweb_checker, logger)
 
-    # setup parallel executor
-    executor = AsyncioQueueGeneratorExecutor(
+    # resolve all the hosts of sites to check in advance
+    failed_hosts: Set[str] = set()
+    if prewarm_dns:
+        hosts = [
+            site.request_host
+            for site in site_dict.values()
+            if not site.protocol
+            and site.request_host
+            and site.type == get_id_type(site)
+            and (not site.disabled or forced)
+        ]
+        dns_timeout = min(dns_timeout, timeout)
+        if deadline is not None:
+            dns_timeout = max(min(dns_timeout, deadline - time.time()), 0.1)
+        failed_hosts = await clearweb_checker.resolve_hosts(
+            hosts, concurrency=dns_concurrency, timeout=dns_timeout
+        )
+        if failed_hosts:
+            logger.info(f"Hosts not resolved: {', '.join(sorted(failed_hosts))}")
+
+    checks_count = sum(len(get_usernames(sitename)) for sitename in site_dict)
+    retry_policy = RetryPolicy(
+        retries,
+        # small searches still can retry every site
+        max_retries=max(retries, math.ceil(checks_count * max_retry_ratio)),
+    )
+
+    # setup parallel executor, a task includes all the retries of a site
+    executor = AsyncioHostAwareExecutor(
         logger=logger,
         in_parallel=max_connections,
-        timeout=timeout + 0.5,
+        in_parallel_per_host=max_connections_per_host,
+        timeout=(timeout + 0.5) * (retries + 1) + retry_policy.max_total_delay,
+        deadline=deadline,
         *args,
         **kwargs,
     )
 
     # make options objects for all the requests
     options: QueryOptions = {}
-    options["cookies"] = cookie_jar
-    options["checkers"] = {
-        '': clearweb_checker,
-        'tor': tor_checker,
-        'dns': dns_checker,
-        'i2p': i2p_checker,
-    }
+    options["cookies"] = clearweb_checker.cookie_jar
+    options["checkers"] = checkers
     options["parsing"] = is_parsing_enabled
     options["timeout"] = timeout
-    options["id_type"] = id_type
+    # None to check every site with its own type of identifiers
+    options["id_type"] = (
+        id_type if site_usernames is None and frontier is None else None
+    )
     options["forced"] = forced
+    options["failed_hosts"] = failed_hosts
+    options["max_body_size"] = max_body_size
+    options["stats_store"] = stats_store
+    options["retry_policy"] = retry_policy
+    options["activator"] = activator if activator is not None else SiteActivator()
+    options["extractor"] = extractor if extractor is not None else IdsExtractor()
+    if hedging and stats_store is not None:
+        options["hedging"] = HedgingPolicy(
+            stats_store, max_hedges=int(checks_count * max_hedge_ratio)
+        )
 
-    # results from analysis of all sites
-    all_results: Dict[str, QueryResultWrapper] = {}
+    def get_site_timeout(site: MaigretSite) -> float:
+        if not adaptive_timeout or stats_store is None:
+            return timeout
+        return stats_store.get_timeout(
+            site.name,
+            timeout,
+            factor=timeout_factor,
+            min_timeout=min_timeout,
+            max_timeout=max_timeout,
+        )
 
     sites = list(site_dict.keys())
+    if deadline is not None and stats_store is not None:
+        # the most valuable checks first, they are likely to be done in time
+        priorities = stats_store.get_priorities(sites, timeout)
+        sites.sort(key=lambda name: priorities[name], reverse=True)
+
+    async def check_site(site, username, *args, **kwargs):
+        sitename, result = await check_site_for_username(
+            site, username, *args, **kwargs
+        )
+        return username, sitename, result
+
+    if frontier is not None:
+        for username in usernames:
+            frontier.add(username, id_type)
+    sites_by_type: Dict[str, List[str]] = {}
+    for sitename in sites:
+        sites_by_type.setdefault(site_dict[sitename].type, []).append(sitename)
+
+    def get_checks() -> Iterator[Tuple[str, str, int]]:
+        """Site names and usernames to check with priorities of checks"""
+        if frontier is None:
+            for sitename in sites:
+                for username in get_usernames(sitename):
+                    yield sitename, username, 0
+            return
+        # identifiers can be added to the frontier while checks are made
+        while True:
+            new_usernames = frontier.pop_new()
+            if not new_usernames:
+                return
+            for username, username_type, depth in new_usernames:
+                for sitename in sites_by_type.get(username_type, []):
+                    yield sitename, username, depth
 
-    attempts = retries + 1
-    while attempts:
-        tasks_dict = {}
+    try:
+        tasks = []
+        cached_count = 0
+        use_cache = result_cache is not None and not bypass_cache
 
-        for sitename, site in site_dict.items():
-            if sitename not in sites:
-                continue
+        def make_task(sitename: str, username: str, priority: int) -> QueryDraft:
+            site = site_dict[sitename]
             default_result: QueryResultWrapper = {
                 'site': site,
                 'status': MaigretCheckResult(
@@ -710,47 +1292,102 @@ async def maigret(
                     error=CheckError('Request failed'),
                 ),
             }
-            tasks_dict[sitename] = (
-                check_site_for_username,
+            return (
+                check_site,
                 [site, username, options, logger, query_notify],
                 {
-                    'default': (sitename, default_result),
-                    'retry': retries - attempts + 1,
+                    'default': (username, sitename, default_result),
+                    'host': get_host_key(site, clearweb_checker.dns_cache),
+                    'timeout': get_site_timeout(site),
+                    'priority': priority,
                 },
             )
 
-        cur_results = []
+        def prepare_checks(
+            new_tasks: List[QueryDraft],
+        ) -> Iterator[Tuple[str, str, QueryResultWrapper]]:
+            """Make tasks of new checks, yield cached results instead of checks"""
+            nonlocal cached_count
+            for sitename, username, priority in get_checks():
+                site = site_dict[sitename]
+                if use_cache and (not site.disabled or forced):
+                    cached_result = result_cache.get(
+                        site, username, get_id_type(site), is_parsing_enabled
+                    )
+                    if cached_result is not None:
+                        cached_count += 1
+                        query_notify.update(
+                            cached_result['status'], site.similar_search
+                        )
+                        yield username, sitename, cached_result
+                        continue
+                new_tasks.append(make_task(sitename, username, priority))
+
+        for cached in prepare_checks(tasks):
+            yield cached
+
+        finished = set()
+        # count of checks of a recursive search is unknown
+        is_recursive = frontier is not None and frontier.max_depth != 0
         with alive_bar(
-            len(tasks_dict), title="Searching", force_tty=True, disable=no_progressbar
+            None if is_recursive else len(tasks),
+            title="Searching",
+            force_tty=True,
+            disable=no_progressbar,
         ) as progress:
-            async for result in executor.run(tasks_dict.values()):
-                cur_results.append(result)
+            async for username, sitename, site_result in executor.run(tasks):
+                finished.add((username, sitename))
+                # only results of checks made (not skipped or timed out ones)
+                if result_cache is not None and site_result.get("timing") is not None:
+                    site = site_dict[sitename]
+                    result_cache.set(site, username, get_id_type(site), site_result)
                 progress()
+                yield username, sitename, site_result
+
+                if frontier is None or executor.is_deadline_exceeded:
+                    continue
+                # identifiers added to the frontier by the caller (e.g.
+                # extracted from the results) are checked by the same run
+                new_tasks: List[QueryDraft] = []
+                for cached in prepare_checks(new_tasks):
+                    yield cached
+                for task in new_tasks:
+                    tasks.append(task)
+                    executor.add(task)
+
+        if executor.is_deadline_exceeded:
+            unfinished = [
+                (task_args[1], task_args[0].name)
+                for _, task_args, _ in tasks
+                if (task_args[1], task_args[0].name) not in finished
+            ]
+            logger.info(f"Deadline exceeded, {len(unfinished)} checks are unfinished")
+            for username, sitename in unfinished:
+                yield username, sitename, make_unfinished_result(
+                    site_dict[sitename], username
+                )
 
-        all_results.update(cur_results)
-
-        # rerun for failed sites
-        sites = get_failed_sites(dict(cur_results))
-        attempts -= 1
+        if retry_policy.used:
+            logger.info(f"Retried checks: {retry_policy.used}")
 
-        if not sites:
-            break
+        if use_cache:
+            logger.info(f"Cached results: {cached_count}, checked: {len(tasks)}")
 
-        if attempts:
-            query_notify.warning(
-                f'Restarting checks for {len(sites)} sites... ({attempts} attempts left)'
+        if options.get("hedging"):
+            hedging_policy = options["hedging"]
+            logger.info(
+                f"Hedged requests: {hedging_policy.hedges}, won: {hedging_policy.wins}"
             )
-
-    # closing http client session
-    await clearweb_checker.close()
-    await tor_checker.close()
-    await i2p_checker.close()
+    finally:
+        # closing http client sessions, shared checkers are closed by their owner,
+        # also when results are not consumed till the end
+        if not is_checkers_shared:
+            for checker in checkers.values():
+                await checker.close()
 
     # notify caller that all queries are finished
     query_notify.finish()
 
-    return all_results
-
 
 def timeout_check(value):
     """Check Timeout Argument.
@@ -777,18 +1414,48 @@ def timeout_check(value):
     return timeout
 
 
-async def site_self_check(
+async def run_self_checks(
+    site_data: Dict[str, MaigretSite],
+    logger: logging.Logger,
+    progress=None,
+    timeout=30,
+    retries=1,
+    **kwargs,
+) -> Dict[str, Dict[str, QueryResultWrapper]]:
+    """
+    Check claimed and unclaimed usernames of all the sites with one search,
+    sharing its connection pool and host-aware scheduler.
+    Returns results by site name and username.
+    """
+    site_usernames = {
+        name: list(dict.fromkeys([site.username_claimed, site.username_unclaimed]))
+        for name, site in site_data.items()
+    }
+    results: Dict[str, Dict[str, QueryResultWrapper]] = {}
+    async for username, sitename, result in maigret_batch(
+        [],
+        site_data,
+        logger,
+        timeout=timeout,
+        forced=True,
+        no_progressbar=True,
+        retries=retries,
+        site_usernames=site_usernames,
+        **kwargs,
+    ):
+        results.setdefault(sitename, {})[username] = result
+        if progress:
+            progress()
+    return results
+
+
+def get_self_check_changes(
     site: MaigretSite,
+    results: Dict[str, QueryResultWrapper],
     logger: logging.Logger,
-    semaphore,
-    db: MaigretDatabase,
-    silent=False,
-    proxy=None,
-    tor_proxy=None,
-    i2p_proxy=None,
     skip_errors=False,
-    cookies=None,
-):
+) -> Dict[str, Any]:
+    """Changes of a site by results of checks of its claimed and unclaimed usernames"""
     changes = {
         "disabled": False,
     }
@@ -798,37 +1465,22 @@ async def site_self_check(
         (site.username_unclaimed, MaigretCheckStatus.AVAILABLE),
     ]
 
-    logger.info(f"Checking {site.name}...")
-
     for username, status in check_data:
-        async with semaphore:
-            results_dict = await maigret(
-                username=username,
-                site_dict={site.name: site},
-                logger=logger,
-                timeout=30,
-                id_type=site.type,
-                forced=True,
-                no_progressbar=True,
-                retries=1,
-                proxy=proxy,
-                tor_proxy=tor_proxy,
-                i2p_proxy=i2p_proxy,
-                cookies=cookies,
-            )
-
-            # don't disable entries with other ids types
-            # TODO: make normal checking
-            if site.name not in results_dict:
-                logger.info(results_dict)
-                changes["disabled"] = True
-                continue
+        # don't disable entries with other ids types
+        # TODO: make normal checking
+        if username not in results:
+            logger.info(results)
+            changes["disabled"] = True
+            continue
 
-            logger.debug(results_dict)
+        logger.debug(results[username])
 
-            result = results_dict[site.name]["status"]
+        result = results[username]["status"]
 
-        if result.error and 'Cannot connect to host' in result.error.desc:
+        if result.error and (
+            result.error.type == 'DNS resolve error'
+            or 'Cannot connect to host' in result.error.desc
+        ):
             changes["disabled"] = True
 
         site_status = result.status
@@ -852,19 +1504,32 @@ async def site_self_check(
                 logger.warning(
                     f"Not found `{username}` in {site.name}, must be claimed"
                 )
-                logger.info(results_dict[site.name])
+                logger.info(results[username])
                 changes["disabled"] = True
             else:
                 logger.warning(f"Found `{username}` in {site.name}, must be available")
-                logger.info(results_dict[site.name])
+                logger.info(results[username])
                 changes["disabled"] = True
 
     logger.info(f"Site {site.name} checking is finished")
 
+    return changes
+
+
+def apply_self_check_changes(
+    site: MaigretSite,
+    changes: Dict[str, Any],
+    db: MaigretDatabase,
+    logger: logging.Logger,
+    silent=False,
+) -> bool:
+    """Apply changes of self-check to a site, return whether it's changed"""
+    is_changed = False
     if changes["disabled"] != site.disabled:
         site.disabled = changes["disabled"]
         logger.info(f"Switching property 'disabled' for {site.name} to {site.disabled}")
         db.update_site(site)
+        is_changed = True
         if not silent:
             action = "Disabled" if site.disabled else "Enabled"
             print(f"{action} site {site.name}...")
@@ -873,6 +1538,39 @@ async def site_self_check(
     if "unchecked" in site.tags:
         site.tags.remove("unchecked")
         db.update_site(site)
+        is_changed = True
+
+    return is_changed
+
+
+async def site_self_check(
+    site: MaigretSite,
+    logger: logging.Logger,
+    semaphore,
+    db: MaigretDatabase,
+    silent=False,
+    proxy=None,
+    tor_proxy=None,
+    i2p_proxy=None,
+    skip_errors=False,
+    cookies=None,
+):
+    logger.info(f"Checking {site.name}...")
+
+    async with semaphore:
+        results = await run_self_checks(
+            {site.name: site},
+            logger,
+            proxy=proxy,
+            tor_proxy=tor_proxy,
+            i2p_proxy=i2p_proxy,
+            cookies=cookies,
+        )
+
+    changes = get_self_check_changes(
+        site, results.get(site.name, {}), logger, skip_errors
+    )
+    apply_self_check_changes(site, changes, db, logger, silent)
 
     return changes
 
@@ -886,9 +1584,14 @@ async def self_check(
     proxy=None,
     tor_proxy=None,
     i2p_proxy=None,
+    history: Optional[SelfCheckHistory] = None,
 ) -> bool:
-    sem = asyncio.Semaphore(max_connections)
-    tasks = []
+    """
+    Check claimed and unclaimed usernames of sites and disable (enable)
+    sites with wrong results. All the checks are made by one search,
+    changes are applied to the database after all of them.
+    Outcomes of the checks are added to history if it's set.
+    """
     all_sites = site_data
 
     def disabled_count(lst):
@@ -899,18 +1602,35 @@ async def self_check(
     )
     disabled_old_count = disabled_count(all_sites.values())
 
-    for _, site in all_sites.items():
-        check_coro = site_self_check(
-            site, logger, sem, db, silent, proxy, tor_proxy, i2p_proxy, skip_errors=True
+    results: Dict[str, Dict[str, QueryResultWrapper]] = {}
+    if all_sites:
+        checks_count = sum(
+            len({site.username_claimed, site.username_unclaimed})
+            for site in all_sites.values()
         )
-        future = asyncio.ensure_future(check_coro)
-        tasks.append(future)
+        with alive_bar(checks_count, title='Self-checking', force_tty=True) as progress:
+            results = await run_self_checks(
+                all_sites,
+                logger,
+                progress=progress,
+                max_connections=max_connections,
+                proxy=proxy,
+                tor_proxy=tor_proxy,
+                i2p_proxy=i2p_proxy,
+            )
 
-    if tasks:
-        with alive_bar(len(tasks), title='Self-checking', force_tty=True) as progress:
-            for f in asyncio.as_completed(tasks):
-                await f
-                progress()  # Update the progress bar
+    all_changes = {
+        name: get_self_check_changes(
+            site, results.get(name, {}), logger, skip_errors=True
+        )
+        for name, site in all_sites.items()
+    }
+    changed_count = 0
+    for name, changes in all_changes.items():
+        if apply_self_check_changes(all_sites[name], changes, db, logger, silent):
+            changed_count += 1
+        if history is not None:
+            history.update(all_sites[name], is_working=not changes["disabled"])
 
     unchecked_new_count = len(
         [site for site in all_sites.values() if "unchecked" in site.tags]
@@ -934,15 +1654,28 @@ async def self_check(
     if unchecked_new_count != unchecked_old_count:
         print(f"Unchecked sites verified: {unchecked_old_count - unchecked_new_count}")
 
-    return total_disabled != 0 or unchecked_new_count != unchecked_old_count
+    # sites can be both disabled and enabled with the same total
+    return changed_count > 0
 
 
-def extract_ids_data(html_text, logger, site) -> Dict:
-    try:
-        return extract(html_text)
-    except Exception as e:
-        logger.warning(f"Error while parsing {site.name}: {e}", exc_info=True)
-        return {}
+async def extract_ids_data(
+    html_text, logger, site, extractor: Optional[IdsExtractor] = None
+) -> Dict:
+    return await (extractor or IdsExtractor()).extract(html_text, logger, site)
+
+
+async def extract_ids_to_result(
+    results_info: QueryResultWrapper, html_text, logger, site, extractor=None
+) -> QueryResultWrapper:
+    """Add ids data extracted from a page of a found account to its result"""
+    extracted_ids_data = await extract_ids_data(html_text, logger, site, extractor)
+    if extracted_ids_data:
+        new_usernames = parse_usernames(extracted_ids_data, logger)
+        results_info = update_results_info(
+            results_info, extracted_ids_data, new_usernames
+        )
+        results_info["status"].ids_data = extracted_ids_data
+    return results_info
 
 
 def parse_usernames(extracted_ids_data, logger) -> Dict:
@@ -70,6 +70,8 @@ ERRORS_TYPES = {
     'Censorship': 'Switch to another internet service provider',
     'Request timeout': 'Try to increase timeout or to switch to another internet service provider',
     'Connecting failure': 'Try to decrease number of parallel connections (e.g. -n 10)',
+    'Deadline exceeded': 'Try to increase time limit of the search (--deadline)',
+    'Too many requests': 'Try to decrease number of parallel connections (e.g. -n 10)',
 }
 
 # TODO: checking for reason
@@ -86,6 +88,8 @@ TEMPORARY_ERRORS_TYPES = [
     'Proxy',
     'Interrupted',
     'Connection lost',
+    'Too many requests',
+    'Server',
 ]
 
 THRESHOLD = 3  # percent
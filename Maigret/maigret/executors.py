@@ -1,7 +1,8 @@
 import asyncio
 import sys
 import time
-from typing import Any, Iterable, List, Callable
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
 
 import alive_progress
 from alive_progress import alive_bar
@@ -242,3 +243,141 @@ class AsyncioQueueGeneratorExecutor:
             await asyncio.gather(*workers)
             self.execution_time = time.time() - start_time
             self.logger.debug(f"Spent time: {self.execution_time}")
+
+
+class AsyncioHostAwareExecutor:
+    """
+    Executor with a global concurrency cap and a per-host one.
+
+    Queries are grouped by the `host` key of their kwargs (e.g. hostname
+    or resolved IP address of a site), hosts are served in a round-robin
+    manner, so a lot of sites on the same hosting don't get requests at
+    the same time. Queries without a host are limited by the global cap only.
+
+    Queries with a lower `priority` kwarg (0 by default) are started first,
+    queries with higher ones take slots not used by them. More queries can
+    be added by `add` while the run goes.
+
+    If `deadline` (a timestamp) is set, queries still running or pending
+    at that time are cancelled and the run stops, see `is_deadline_exceeded`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.workers_count = kwargs.get('in_parallel', 10)
+        self.host_workers_count = kwargs.get('in_parallel_per_host', 4)
+        self.timeout = kwargs.get('timeout')
+        self.deadline = kwargs.get('deadline')
+        self.is_deadline_exceeded = False
+        self.logger = kwargs['logger']
+        # pending queries and round-robin order of their hosts by priority
+        self._pending: Dict[int, Dict[Any, Deque[QueryDraft]]] = {}
+        self._hosts: Dict[int, Deque[Any]] = {}
+        self._active: Dict[Any, int] = {}
+
+    def add(self, query: QueryDraft):
+        """Add a query to the running run"""
+        host = query[2].get('host')
+        if host is None:
+            # unique key, no per-host limit
+            host = object()
+        priority = query[2].get('priority', 0)
+        pending = self._pending.setdefault(priority, {})
+        if host not in pending:
+            pending[host] = deque()
+            self._hosts.setdefault(priority, deque()).append(host)
+        self._active.setdefault(host, 0)
+        pending[host].append(query)
+
+    def _is_pending(self, host) -> bool:
+        return any(host in pending for pending in self._pending.values())
+
+    def _is_host_available(self, host) -> bool:
+        if not self.host_workers_count:
+            return True
+        return self._active[host] < self.host_workers_count
+
+    def _next(self) -> Optional[Tuple[Any, QueryDraft]]:
+        """
+        Take a query of the next host with free slots in round-robin order,
+        from the lowest priority having such one
+        """
+        for priority in sorted(self._pending):
+            pending, hosts = self._pending[priority], self._hosts[priority]
+            for _ in range(len(hosts)):
+                host = hosts[0]
+                hosts.rotate(-1)
+                if not self._is_host_available(host):
+                    continue
+
+                queue = pending[host]
+                query = queue.popleft()
+                if not queue:
+                    del pending[host]
+                    # rotated host is the last one now
+                    hosts.pop()
+                    if not pending:
+                        del self._pending[priority]
+                        del self._hosts[priority]
+                return host, query
+
+        return None
+
+    async def _run_query(self, query: QueryDraft):
+        f, args, kwargs = query
+        try:
+            return await asyncio.wait_for(f(*args, **kwargs), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return kwargs.get('default')
+
+    async def run(self, queries: Iterable[QueryDraft]):
+        """Run queries and yield results as soon as they are ready."""
+        start_time = time.time()
+        self._pending, self._active, self._hosts = {}, {}, {}
+        self.is_deadline_exceeded = False
+        for q in queries:
+            self.add(q)
+
+        running: Dict[asyncio.Task, Any] = {}
+        try:
+            while self._pending or running:
+                remaining = None
+                if self.deadline is not None:
+                    remaining = self.deadline - time.time()
+                    if remaining <= 0:
+                        self.is_deadline_exceeded = True
+                        self.logger.debug("Deadline exceeded, stopping")
+                        break
+
+                while len(running) < self.workers_count:
+                    item = self._next()
+                    if item is None:
+                        break
+                    host, query = item
+                    self._active[host] += 1
+                    running[create_task_func()(self._run_query(query))] = host
+
+                done, _ = await asyncio.wait(
+                    running.keys(),
+                    timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    host = running.pop(task)
+                    self._active[host] -= 1
+                    if not self._active[host] and not self._is_pending(host):
+                        del self._active[host]
+
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self.logger.error(f"Error in worker: {e}")
+                        continue
+                    yield result
+        finally:
+            for task in running:
+                task.cancel()
+            if self.is_deadline_exceeded:
+                # let cancelled requests release their connections
+                await asyncio.gather(*running, return_exceptions=True)
+            self.execution_time = time.time() - start_time
+            self.logger.debug(f"Spent time: {self.execution_time}")
@@ -0,0 +1,57 @@
+"""Maigret extraction of ids data from pages of found accounts"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from socid_extractor import extract
+
+from .sites import MaigretSite
+
+
+class IdsExtractor:
+    """
+    Extraction of ids data by socid_extractor, which is CPU-bound. With
+    workers > 0 pages are parsed by a pool of processes (or threads),
+    so the event loop keeps making requests meanwhile and extraction
+    scales across cores. Otherwise pages are parsed in the event loop.
+
+    Threads take pages without copying, processes get a pickled copy
+    of a page only. The pool is started on the first extraction and
+    must be closed after all the searches.
+    """
+
+    def __init__(self, workers=0, use_processes=True):
+        self.workers = workers
+        self.use_processes = use_processes
+        self._pool: Optional[Executor] = None
+
+    @property
+    def pool(self) -> Optional[Executor]:
+        if self._pool is None and self.workers > 0:
+            if self.use_processes:
+                # forked workers may deadlock on locks of resolver threads
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="maigret-extract"
+                )
+        return self._pool
+
+    async def extract(self, html_text: str, logger, site: MaigretSite) -> Dict:
+        try:
+            if self.pool is None:
+                return extract(html_text)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, extract, html_text)
+        except Exception as e:
+            logger.warning(f"Error while parsing {site.name}: {e}", exc_info=True)
+            return {}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
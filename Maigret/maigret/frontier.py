@@ -0,0 +1,59 @@
+"""Maigret frontier of a recursive search"""
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .cache import normalize_username
+
+
+class SearchFrontier:
+    """
+    Identifiers to search by: initial ones and ones extracted from results
+    while the search goes. Every identifier is searched once, they are
+    compared normalized (see normalize_username) and case-insensitively.
+    Extracted identifiers are searched up to `max_depth` hops from
+    the initial ones (None for no limit).
+
+    New identifiers are taken by a running search (see maigret_batch),
+    identifiers of lower depths are checked first.
+    """
+
+    def __init__(self, max_depth: Optional[int] = None):
+        self.max_depth = max_depth
+        # normalized identifiers with their depths, None for ignored ones
+        self.depths: Dict[str, Optional[int]] = {}
+        self._new: Deque[Tuple[str, str, int]] = deque()
+
+    @staticmethod
+    def normalize(identifier: str) -> str:
+        return normalize_username(identifier).casefold()
+
+    def __contains__(self, identifier) -> bool:
+        return self.normalize(identifier) in self.depths
+
+    def __len__(self) -> int:
+        return len(self.depths)
+
+    def get_depth(self, identifier: str) -> Optional[int]:
+        return self.depths.get(self.normalize(identifier))
+
+    def add(self, identifier: str, id_type: str, depth=0) -> bool:
+        """Add an identifier to search by, return False if it's not added"""
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        key = self.normalize(identifier)
+        if not key or key in self.depths:
+            return False
+        self.depths[key] = depth
+        self._new.append((identifier, id_type, depth))
+        return True
+
+    def ignore(self, identifier: str):
+        """Don't search by an identifier"""
+        self.depths.setdefault(self.normalize(identifier), None)
+
+    def pop_new(self) -> List[Tuple[str, str, int]]:
+        """Identifiers added since the last call with their types and depths"""
+        new = list(self._new)
+        self._new.clear()
+        return new
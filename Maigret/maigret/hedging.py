@@ -0,0 +1,132 @@
+"""Maigret hedged requests to sites with long tail latency"""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+from .errors import CheckError
+from .sites import MaigretSite
+from .stats import RequestTiming, SitesStatsStore
+
+
+CheckResponse = Tuple[str, int, Optional[CheckError]]
+
+
+class HedgingPolicy:
+    """
+    Policy of hedged requests of one search: if a site has not answered
+    by its historical latency percentile (p90, but not less than twice the
+    median), the same request is made once more (to a mirror of the site,
+    if any) and the first answer is taken.
+
+    The number of hedged requests is capped by `max_hedges`.
+    """
+
+    def __init__(
+        self,
+        stats_store: SitesStatsStore,
+        max_hedges: int,
+        percentile=90,
+        min_delay=0.05,
+        median_factor=2.0,
+        min_samples=5,
+    ):
+        self.stats_store = stats_store
+        self.max_hedges = max_hedges
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.median_factor = median_factor
+        self.min_samples = min_samples
+        # counters for logging and benchmarks
+        self.hedges = 0
+        self.wins = 0
+
+    def get_delay(self, site_name: str) -> Optional[float]:
+        """Time to wait for the first request, None if it shouldn't be hedged"""
+        if self.hedges >= self.max_hedges:
+            return None
+        stats = self.stats_store.get(site_name)
+        if stats is None or len(stats.latencies) < self.min_samples:
+            return None
+        # sites with narrow latency distribution aren't hedged on a mere jitter
+        return max(
+            stats.percentile(self.percentile),
+            stats.percentile(50) * self.median_factor,
+            self.min_delay,
+        )
+
+    def acquire(self) -> bool:
+        if self.hedges >= self.max_hedges:
+            return False
+        self.hedges += 1
+        return True
+
+    @staticmethod
+    def get_url(site: MaigretSite, url: str) -> str:
+        """URL for a hedged request: the same one on a mirror of the site if any"""
+        mirrors = [m for m in getattr(site, "mirrors", []) if m != site.url_main]
+        if mirrors and site.url_main and url.startswith(site.url_main):
+            return random.choice(mirrors) + url[len(site.url_main) :]
+        return url
+
+    async def check(
+        self,
+        make_check: Callable[[str, RequestTiming], Awaitable[CheckResponse]],
+        site: MaigretSite,
+        url: str,
+        delay: float,
+        timing: RequestTiming,
+        timeout: float,
+    ) -> Tuple[CheckResponse, RequestTiming]:
+        """
+        Make the request with make_check(url, timing) and hedge it after delay.
+        Return the first successful response and its timing. Both requests
+        are bounded by timeout counted from the start of the first one,
+        the losing one is cancelled.
+        """
+        primary = asyncio.ensure_future(make_check(url, timing))
+        tasks = {primary: timing}
+        try:
+            done, _ = await asyncio.wait([primary], timeout=delay)
+            if done or not self.acquire():
+                return await primary, timing
+
+            # the hedged request counts time from the start of the first one
+            hedge_timing = RequestTiming()
+            hedge_timing.started = timing.started
+            hedge = asyncio.ensure_future(
+                make_check(self.get_url(site, url), hedge_timing)
+            )
+            tasks[hedge] = hedge_timing
+
+            failed: Optional[Tuple[CheckResponse, RequestTiming]] = None
+            pending = set(tasks)
+            while pending:
+                remaining = timeout - (time.monotonic() - timing.started)
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(remaining, 0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                # successful responses first
+                for task in sorted(done, key=lambda t: t.result()[2] is not None):
+                    response = task.result()
+                    # an error of one request doesn't mean the other one fails
+                    if response[2] is None or not pending:
+                        if task is hedge:
+                            self.wins += 1
+                        return response, tasks[task]
+                    failed = response, tasks[task]
+
+            if failed is not None:
+                return failed
+            error = CheckError("Request timeout", f"no response in {timeout}s")
+            return ("", 0, error), timing
+        finally:
+            # cancelled requests release their connections in the background
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
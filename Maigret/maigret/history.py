@@ -0,0 +1,165 @@
+"""Maigret persisted history of self-checks of sites"""
+
+import os
+import time
+from typing import Any, Dict, Optional
+
+from .cache import get_site_hash
+from .sites import MaigretSite
+from .utils import load_json_file, save_json_file
+
+
+DEFAULT_HISTORY_PATH = '~/.maigret/self_check_history.json'
+# fields changed by self-checks themselves
+SELF_CHECK_FIELDS = ("disabled", "tags")
+
+
+def get_checked_site_hash(site: MaigretSite) -> str:
+    """Hash of a site definition, except the fields self-checks change"""
+    return get_site_hash(site, ignored_fields=SELF_CHECK_FIELDS)
+
+
+class SiteCheckHistory:
+    """
+    History of self-checks of a site: time and outcome of the last check,
+    time of the last change of the outcome, count of consecutive failed
+    checks and hash of the site definition checked.
+    """
+
+    __slots__ = ("last_checked", "is_working", "last_changed", "failures", "site_hash")
+
+    def __init__(self):
+        self.last_checked = 0.0
+        self.is_working = True
+        self.last_changed: Optional[float] = None
+        self.failures = 0
+        self.site_hash = ""
+
+    def add(self, is_working: bool, site_hash: str, now: float):
+        # the first check is not a change of the outcome
+        if self.last_checked and is_working != self.is_working:
+            self.last_changed = now
+        self.last_checked = now
+        self.is_working = is_working
+        self.failures = 0 if is_working else self.failures + 1
+        self.site_hash = site_hash
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        return {
+            "last_checked": self.last_checked,
+            "is_working": self.is_working,
+            "last_changed": self.last_changed,
+            "failures": self.failures,
+            "site_hash": self.site_hash,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "SiteCheckHistory":
+        history = cls()
+        history.last_checked = data.get("last_checked", 0.0)
+        history.is_working = data.get("is_working", True)
+        history.last_changed = data.get("last_changed")
+        history.failures = data.get("failures", 0)
+        history.site_hash = data.get("site_hash", "")
+        return history
+
+
+class SelfCheckHistory:
+    """
+    Per-site history of self-checks, persisted between runs in a JSON file.
+    Used to re-check only sites which need it, see get_sites_to_check().
+    """
+
+    def __init__(
+        self,
+        filename: Optional[str] = None,
+        stale_after=7 * 24 * 3600,
+        unstable_after=3600,
+        unstable_period=3 * 24 * 3600,
+    ):
+        self.filename = os.path.expanduser(filename) if filename else None
+        # time in seconds to re-check sites working and stable
+        self.stale_after = stale_after
+        # time in seconds to re-check sites failed or flapping
+        self.unstable_after = unstable_after
+        # time in seconds a site is flapping after a change of its outcome
+        self.unstable_period = unstable_period
+        self.sites: Dict[str, SiteCheckHistory] = {}
+
+    def __contains__(self, site_name) -> bool:
+        return site_name in self.sites
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    def get(self, site_name: str) -> Optional[SiteCheckHistory]:
+        return self.sites.get(site_name)
+
+    def update(self, site: MaigretSite, is_working: bool, now: Optional[float] = None):
+        history = self.sites.get(site.name)
+        if history is None:
+            history = self.sites[site.name] = SiteCheckHistory()
+        history.add(is_working, get_checked_site_hash(site), now or time.time())
+
+    def is_unstable(self, history: SiteCheckHistory, now: float) -> bool:
+        """Site failed the last check or changed its outcome recently"""
+        if history.failures:
+            return True
+        return (
+            history.last_changed is not None
+            and now - history.last_changed < self.unstable_period
+        )
+
+    def get_sites_to_check(
+        self,
+        site_data: Dict[str, MaigretSite],
+        budget: int,
+        now: Optional[float] = None,
+    ) -> Dict[str, MaigretSite]:
+        """
+        Up to `budget` sites to re-check: sites never checked or changed
+        since the last check go first, then unstable (failed or flapping)
+        ones checked more than `unstable_after` ago, then others checked
+        more than `stale_after` ago. Sites checked long ago go first in
+        each group.
+        """
+        now = now or time.time()
+        due = []
+        for name, site in site_data.items():
+            history = self.sites.get(name)
+            if history is None or history.site_hash != get_checked_site_hash(site):
+                group = 0
+            elif self.is_unstable(history, now):
+                if now - history.last_checked < self.unstable_after:
+                    continue
+                group = 1
+            elif now - history.last_checked >= self.stale_after:
+                group = 2
+            else:
+                continue
+            last_checked = history.last_checked if history else 0.0
+            due.append((group, last_checked, name))
+
+        due.sort()
+        return {name: site_data[name] for _, _, name in due[:budget]}
+
+    def load(self) -> "SelfCheckHistory":
+        if not self.filename:
+            return self
+        data = load_json_file(self.filename, "self-check history")
+        if data is None:
+            # no self-checks were made yet
+            return self
+
+        self.sites = {
+            name: SiteCheckHistory.from_json(site_data)
+            for name, site_data in data.get("sites", {}).items()
+        }
+        return self
+
+    def save(self):
+        if not self.filename:
+            return
+        data = {"sites": {name: h.json for name, h in self.sites.items()}}
+        save_json_file(self.filename, data)
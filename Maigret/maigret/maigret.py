@@ -8,20 +8,26 @@ import logging
 import os
 import sys
 import platform
+import time
 import re
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
-from typing import List, Tuple
+from collections import Counter
+from typing import Dict, List, Tuple
 import os.path as path
 
 from socid_extractor import extract, parse
 
 from .__version__ import __version__
+from .activation import SiteActivator
+from .extraction import IdsExtractor
+from .frontier import SearchFrontier
 from .checking import (
     timeout_check,
+    DEFAULT_MAX_BODY_SIZE,
     SUPPORTED_IDS,
     self_check,
     BAD_CHARS,
-    maigret,
+    maigret_batch,
 )
 from . import errors
 from .notify import QueryNotifyPrint
@@ -38,7 +44,10 @@ from .report import (
     sort_report_by_data_points,
     save_graph_report,
 )
-from .sites import MaigretDatabase
+from .sites import MaigretDatabase, MaigretSite
+from .cache import DEFAULT_CACHE_PATH, ResultCache
+from .history import DEFAULT_HISTORY_PATH, SelfCheckHistory
+from .stats import DEFAULT_STATS_PATH, SitesStatsStore
 from .submit import Submitter
 from .types import QueryResultWrapper
 from .utils import get_dict_ascii_tree
@@ -150,6 +159,50 @@ def setup_arguments_parser(settings: Settings):
         "A longer timeout will be more likely to get results from slow sites. "
         "On the other hand, this may cause a long delay to gather all results. ",
     )
+    parser.add_argument(
+        "--deadline",
+        action="store",
+        metavar='SECONDS',
+        dest="deadline",
+        type=timeout_check,
+        default=None,
+        help="Time in seconds to finish the whole search in. The most promising sites "
+        "are checked first, results gathered by the deadline are reported.",
+    )
+    parser.add_argument(
+        "--hedge-requests",
+        action="store_true",
+        dest="hedge_requests",
+        default=False,
+        help="Repeat requests to sites that haven't answered by their usual (p90) "
+        "latency in previous runs and take the first answer.",
+    )
+    parser.add_argument(
+        "--adaptive-timeout",
+        action="store_true",
+        dest="adaptive_timeout",
+        default=False,
+        help="Use timeouts of sites derived from their latencies in previous runs "
+        "(see --stats-file), TIMEOUT is a ceiling.",
+    )
+    parser.add_argument(
+        "--timeout-factor",
+        action="store",
+        type=float,
+        metavar='FACTOR',
+        dest="timeout_factor",
+        default=2.0,
+        help="Adaptive timeout of a site is its p95 latency multiplied by FACTOR (default 2.0).",
+    )
+    parser.add_argument(
+        "--min-timeout",
+        action="store",
+        metavar='MIN_TIMEOUT',
+        dest="min_timeout",
+        type=timeout_check,
+        default=1.0,
+        help="Minimal adaptive timeout of a site in seconds (default 1s).",
+    )
     parser.add_argument(
         "--retries",
         action="store",
@@ -167,6 +220,23 @@ def setup_arguments_parser(settings: Settings):
         default=settings.max_connections,
         help=f"Allowed number of concurrent connections (default {settings.max_connections}).",
     )
+    parser.add_argument(
+        "--max-connections-per-host",
+        action="store",
+        type=int,
+        dest="connections_per_host",
+        default=4,
+        help="Allowed number of concurrent connections to the same host, 0 means no limit (default 4).",
+    )
+    parser.add_argument(
+        "--max-body-size",
+        metavar="SIZE",
+        type=int,
+        dest="max_body_size",
+        default=DEFAULT_MAX_BODY_SIZE,
+        help="Download at most SIZE bytes of a page, 0 means no limit "
+        f"(default {DEFAULT_MAX_BODY_SIZE}).",
+    )
     parser.add_argument(
         "--no-recursion",
         action="store_true",
@@ -174,6 +244,15 @@ def setup_arguments_parser(settings: Settings):
         default=(not settings.recursive_search),
         help="Disable recursive search by additional data extracted from pages.",
     )
+    parser.add_argument(
+        "--recursion-depth",
+        metavar="N",
+        type=int,
+        dest="recursion_depth",
+        default=None,
+        help="Search recursively by ids extracted from pages up to N hops "
+        "from the initial usernames (default: no limit).",
+    )
     parser.add_argument(
         "--no-extracting",
         action="store_true",
@@ -181,6 +260,15 @@ def setup_arguments_parser(settings: Settings):
         default=(not settings.info_extracting),
         help="Disable parsing pages for additional data and other usernames.",
     )
+    parser.add_argument(
+        "--extract-workers",
+        metavar="N",
+        type=int,
+        dest="extract_workers",
+        default=0,
+        help="Parse pages of found accounts in N worker processes, so parsing "
+        "doesn't slow down requests (default 0: parse in the main process).",
+    )
     parser.add_argument(
         "--id-type",
         dest="id_type",
@@ -201,6 +289,35 @@ def setup_arguments_parser(settings: Settings):
         default=settings.sites_db_path,
         help="Load Maigret database from a JSON file or HTTP web resource.",
     )
+    parser.add_argument(
+        "--stats-file",
+        metavar="STATS_FILE",
+        dest="stats_file",
+        default=DEFAULT_STATS_PATH,
+        help=f"File to keep per-site timings and errors of checks (default {DEFAULT_STATS_PATH}).",
+    )
+    parser.add_argument(
+        "--use-cache",
+        action="store_true",
+        dest="use_cache",
+        default=False,
+        help="Reuse results of recent checks of the same usernames instead of "
+        "checking the sites again.",
+    )
+    parser.add_argument(
+        "--bypass-cache",
+        action="store_true",
+        dest="bypass_cache",
+        default=False,
+        help="Check all the sites ignoring cached results and refresh the cache.",
+    )
+    parser.add_argument(
+        "--cache-file",
+        metavar="CACHE_FILE",
+        dest="cache_file",
+        default=DEFAULT_CACHE_PATH,
+        help=f"SQLite file to cache results of checks in (default {DEFAULT_CACHE_PATH}).",
+    )
     parser.add_argument(
         "--cookies-jar-file",
         metavar="COOKIE_FILE",
@@ -318,6 +435,22 @@ def setup_arguments_parser(settings: Settings):
         default=settings.self_check_enabled,
         help="Do self check for sites and database and disable non-working ones.",
     )
+    parser.add_argument(
+        "--self-check-budget",
+        metavar="N",
+        type=int,
+        dest="self_check_budget",
+        default=0,
+        help="Self-check only up to N sites which need it most (new, changed, failed "
+        "or not checked for a long time) according to the history of self-checks.",
+    )
+    parser.add_argument(
+        "--self-check-history",
+        metavar="HISTORY_FILE",
+        dest="self_check_history",
+        default=DEFAULT_HISTORY_PATH,
+        help=f"File to keep history of self-checks of sites (default {DEFAULT_HISTORY_PATH}).",
+    )
     modes_group.add_argument(
         "--stats",
         action="store_true",
@@ -462,6 +595,39 @@ def setup_arguments_parser(settings: Settings):
     return parser
 
 
+def save_username_reports(
+    args, report_filepath_tpl, username, results, query_notify
+):
+    """Save reports enabled by CLI arguments on results of a one username"""
+    if args.xmind:
+        username = username.replace('/', '_')
+        filename = report_filepath_tpl.format(username=username, postfix='.xmind')
+        save_xmind_report(filename, username, results)
+        query_notify.warning(f'XMind report for {username} saved in {filename}')
+
+    if args.csv:
+        username = username.replace('/', '_')
+        filename = report_filepath_tpl.format(username=username, postfix='.csv')
+        save_csv_report(filename, username, results)
+        query_notify.warning(f'CSV report for {username} saved in {filename}')
+
+    if args.txt:
+        username = username.replace('/', '_')
+        filename = report_filepath_tpl.format(username=username, postfix='.txt')
+        save_txt_report(filename, username, results)
+        query_notify.warning(f'TXT report for {username} saved in {filename}')
+
+    if args.json:
+        username = username.replace('/', '_')
+        filename = report_filepath_tpl.format(
+            username=username, postfix=f'_{args.json}.json'
+        )
+        save_json_report(filename, username, results, report_type=args.json)
+        query_notify.warning(
+            f'JSON {args.json} report for {username} saved in {filename}'
+        )
+
+
 async def main():
     # Logging
     log_level = logging.ERROR
@@ -555,6 +721,18 @@ async def main():
 
     site_data = get_top_sites_for_id(args.id_type)
 
+    # Per-site statistics of checks, collected between runs
+    stats_store = SitesStatsStore(args.stats_file)
+    try:
+        stats_store.load()
+    except ValueError as e:
+        logger.warning(e)
+
+    # Results of checks reused between runs
+    result_cache = None
+    if args.use_cache or args.bypass_cache:
+        result_cache = ResultCache.from_path(args.cache_file)
+
     if args.new_site_to_submit:
         submitter = Submitter(db=db, logger=logger, settings=settings, args=args)
         is_submitted = await submitter.dialog(args.new_site_to_submit, args.cookie_file)
@@ -564,6 +742,22 @@ async def main():
 
     # Database self-checking
     if args.self_check:
+        self_check_history = SelfCheckHistory(args.self_check_history)
+        try:
+            self_check_history.load()
+        except ValueError as e:
+            logger.warning(e)
+
+        if args.self_check_budget > 0:
+            site_data = self_check_history.get_sites_to_check(
+                site_data, args.self_check_budget
+            )
+            if len(site_data) == 0:
+                query_notify.warning(
+                    'All the sites are self-checked recently! Exiting...'
+                )
+                return
+
         if len(site_data) == 0:
             query_notify.warning(
                 'No sites to self-check with the current filters! Exiting...'
@@ -581,7 +775,12 @@ async def main():
             max_connections=args.connections,
             tor_proxy=args.tor_proxy,
             i2p_proxy=args.i2p_proxy,
+            history=self_check_history,
         )
+        try:
+            self_check_history.save()
+        except OSError as e:
+            logger.warning(f'History of self-checks is not saved: {e}')
         if is_need_update:
             if input('Do you want to save changes permanently? [Yn]\n').lower() in (
                 'y',
@@ -632,56 +831,63 @@ async def main():
             'You can run search by full list of sites with flag `-a`', '!'
         )
 
-    already_checked = set()
     general_results = []
 
-    while usernames:
-        username, id_type = list(usernames.items())[0]
-        del usernames[username]
+    deadline = time.time() + args.deadline if args.deadline else None
+    # tokens of sites are reused by searches of all the usernames
+    activator = SiteActivator()
+    extractor = IdsExtractor(workers=args.extract_workers)
 
-        if username.lower() in already_checked:
-            continue
+    # ids extracted from results are searched by the same run of checks
+    frontier = SearchFrontier(
+        max_depth=args.recursion_depth if recursive_search_enabled else 0
+    )
 
-        already_checked.add(username.lower())
+    def add_to_search(username: str, id_type: str, depth=0) -> bool:
+        if username in frontier:
+            return False
 
         if username in args.ignore_ids_list:
+            frontier.ignore(username)
             query_notify.warning(
                 f'Skip a search by username {username} cause it\'s marked as ignored.'
             )
-            continue
+            return False
 
         # check for characters do not supported by sites generally
         found_unsupported_chars = set(BAD_CHARS).intersection(set(username))
         if found_unsupported_chars:
+            frontier.ignore(username)
             pretty_chars_str = ','.join(
                 map(lambda s: f'"{s}"', found_unsupported_chars)
             )
             query_notify.warning(
                 f'Found unsupported URL characters: {pretty_chars_str}, skip search by username "{username}"'
             )
-            continue
+            return False
 
-        sites_to_check = get_top_sites_for_id(id_type)
+        return frontier.add(username, id_type, depth)
 
-        results = await maigret(
-            username=username,
-            site_dict=dict(sites_to_check),
-            query_notify=query_notify,
-            proxy=args.proxy,
-            tor_proxy=args.tor_proxy,
-            i2p_proxy=args.i2p_proxy,
-            timeout=args.timeout,
-            is_parsing_enabled=parsing_enabled,
-            id_type=id_type,
-            debug=args.verbose,
-            logger=logger,
-            cookies=args.cookie_file,
-            forced=args.use_disabled_sites,
-            max_connections=args.connections,
-            no_progressbar=args.no_progressbar,
-            retries=args.retries,
-            check_domains=args.with_domains,
-        )
+    initial_usernames = [u for u, t in usernames.items() if add_to_search(u, t)]
+
+    # sites for all the types of ids which can be searched
+    id_types = set(usernames.values())
+    if recursive_search_enabled:
+        id_types.update(site.type for site in db.sites)
+    sites_to_check: Dict[str, MaigretSite] = {}
+    for id_type in id_types:
+        sites_to_check.update(get_top_sites_for_id(id_type))
+    checks_count_by_type = Counter(site.type for site in sites_to_check.values())
+
+    all_results: Dict[str, QueryResultWrapper] = {}
+    all_extracted_ids: Dict[str, Dict[str, str]] = {}
+    finished_usernames = set()
+
+    def finish_search(username: str, id_type: str):
+        finished_usernames.add(username)
+        results = all_results[username]
+        if len(frontier) > 1:
+            query_notify.info(f'Results of {id_type} {username}:')
 
         errs = errors.notify_about_errors(
             results, query_notify, show_statistics=args.verbose
@@ -694,40 +900,74 @@ async def main():
 
         general_results.append((username, id_type, results))
 
-        # TODO: tests
         if recursive_search_enabled:
-            extracted_ids = extract_ids_from_results(results, db)
+            extracted_ids = all_extracted_ids.get(username, {})
             query_notify.warning(f'Extracted IDs: {extracted_ids}')
-            usernames.update(extracted_ids)
 
         # reporting for a one username
-        if args.xmind:
-            username = username.replace('/', '_')
-            filename = report_filepath_tpl.format(username=username, postfix='.xmind')
-            save_xmind_report(filename, username, results)
-            query_notify.warning(f'XMind report for {username} saved in {filename}')
-
-        if args.csv:
-            username = username.replace('/', '_')
-            filename = report_filepath_tpl.format(username=username, postfix='.csv')
-            save_csv_report(filename, username, results)
-            query_notify.warning(f'CSV report for {username} saved in {filename}')
-
-        if args.txt:
-            username = username.replace('/', '_')
-            filename = report_filepath_tpl.format(username=username, postfix='.txt')
-            save_txt_report(filename, username, results)
-            query_notify.warning(f'TXT report for {username} saved in {filename}')
+        save_username_reports(
+            args, report_filepath_tpl, username, results, query_notify
+        )
 
-        if args.json:
-            username = username.replace('/', '_')
-            filename = report_filepath_tpl.format(
-                username=username, postfix=f'_{args.json}.json'
-            )
-            save_json_report(filename, username, results, report_type=args.json)
-            query_notify.warning(
-                f'JSON {args.json} report for {username} saved in {filename}'
-            )
+    try:
+        async for username, sitename, result in maigret_batch(
+            usernames=initial_usernames,
+            site_dict=sites_to_check,
+            query_notify=query_notify,
+            proxy=args.proxy,
+            tor_proxy=args.tor_proxy,
+            i2p_proxy=args.i2p_proxy,
+            timeout=args.timeout,
+            is_parsing_enabled=parsing_enabled,
+            id_type=args.id_type,
+            debug=args.verbose,
+            logger=logger,
+            cookies=args.cookie_file,
+            forced=args.use_disabled_sites,
+            max_connections=args.connections,
+            max_connections_per_host=args.connections_per_host,
+            max_body_size=args.max_body_size,
+            no_progressbar=args.no_progressbar,
+            retries=args.retries,
+            check_domains=args.with_domains,
+            stats_store=stats_store,
+            adaptive_timeout=args.adaptive_timeout,
+            timeout_factor=args.timeout_factor,
+            min_timeout=args.min_timeout,
+            deadline=deadline,
+            hedging=args.hedge_requests,
+            result_cache=result_cache,
+            bypass_cache=args.bypass_cache,
+            activator=activator,
+            extractor=extractor,
+            frontier=frontier,
+        ):
+            results = all_results.setdefault(username, {})
+            results[sitename] = result
+            id_type = result['site'].type
+
+            if recursive_search_enabled:
+                extracted_ids = extract_ids_from_results({sitename: result}, db)
+                all_extracted_ids.setdefault(username, {}).update(extracted_ids)
+                depth = frontier.get_depth(username) or 0
+                for new_username, new_id_type in extracted_ids.items():
+                    add_to_search(new_username, new_id_type, depth + 1)
+
+            if len(results) == checks_count_by_type[id_type]:
+                finish_search(username, id_type)
+    finally:
+        extractor.close()
+
+    # e.g. checks failed with errors
+    for username, results in all_results.items():
+        if username not in finished_usernames:
+            finish_search(username, next(iter(results.values()))['site'].type)
+
+    skipped_usernames = frontier.pop_new()
+    if skipped_usernames:
+        query_notify.warning(
+            f'Search deadline exceeded, skip searches by {len(skipped_usernames)} usernames'
+        )
 
     # reporting for all the result
     if general_results:
@@ -766,6 +1006,13 @@ async def main():
 
     # update database
     db.save_to_file(db_file)
+    try:
+        stats_store.save()
+    except OSError as e:
+        # stats are only an optimization, e.g. home dir can be read-only
+        logger.warning(f'Stats of sites are not saved: {e}')
+    if result_cache is not None:
+        result_cache.close()
 
 
 def run():
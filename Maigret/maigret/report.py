@@ -458,6 +458,8 @@ def generate_json_report(username: str, results: dict, file, report_type):
         for field in ["future", "checker"]:
             if field in data:
                 del data[field]
+        if data.get("timing"):
+            data["timing"] = data["timing"].json
 
         if is_report_per_line:
             data["sitename"] = sitename
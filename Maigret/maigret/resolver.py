@@ -0,0 +1,148 @@
+"""Maigret DNS resolving with an in-process TTL cache"""
+
+import asyncio
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiohttp.abc import AbstractResolver, ResolveResult
+from aiohttp.resolver import DefaultResolver
+
+
+# addresses list or None for a failed resolving
+CacheEntry = Tuple[float, Optional[List[ResolveResult]]]
+
+
+def make_resolve_result(hostname: str, ip: str, port=0) -> ResolveResult:
+    family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+    return ResolveResult(
+        hostname=hostname,
+        host=ip,
+        port=port,
+        family=family,
+        proto=0,
+        flags=socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+    )
+
+
+class DNSCache:
+    """
+    TTL cache of resolved hosts shared between checkers and searches.
+    Failed resolvings are cached too (with a shorter TTL).
+    """
+
+    def __init__(self, ttl=300, negative_ttl=60):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: Dict[Tuple[str, int], CacheEntry] = {}
+
+    def _get_entry(self, host: str, family=socket.AF_UNSPEC) -> Optional[CacheEntry]:
+        entry = self._entries.get((host, family))
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[(host, family)]
+            return None
+        return entry
+
+    def __contains__(self, host) -> bool:
+        return self._get_entry(host) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, host: str, family=socket.AF_UNSPEC
+    ) -> Optional[List[ResolveResult]]:
+        """Return cached addresses, None if there are no ones or host is failed"""
+        entry = self._get_entry(host, family)
+        return entry[1] if entry else None
+
+    def get_address(self, host: str, family=socket.AF_UNSPEC) -> Optional[str]:
+        addresses = self.get(host, family)
+        return addresses[0]['host'] if addresses else None
+
+    def is_failed(self, host: str, family=socket.AF_UNSPEC) -> bool:
+        entry = self._get_entry(host, family)
+        return entry is not None and entry[1] is None
+
+    def set(self, host: str, addresses: List[ResolveResult], family=socket.AF_UNSPEC):
+        self._entries[(host, family)] = (time.monotonic() + self.ttl, addresses)
+
+    def set_failed(self, host: str, family=socket.AF_UNSPEC):
+        self._entries[(host, family)] = (time.monotonic() + self.negative_ttl, None)
+
+
+class CachingResolver(AbstractResolver):
+    """
+    aiohttp resolver backed by DNSCache. Concurrent resolvings of the
+    same host are merged into one request.
+    """
+
+    def __init__(self, cache: DNSCache, resolver: Optional[AbstractResolver] = None):
+        self.cache = cache
+        self._resolver = resolver
+        self._in_flight: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    @property
+    def resolver(self) -> AbstractResolver:
+        # default resolver needs a running loop, so it's created lazily
+        if self._resolver is None:
+            self._resolver = DefaultResolver()
+        return self._resolver
+
+    async def _resolve(self, host: str, family) -> List[ResolveResult]:
+        try:
+            addresses = await self.resolver.resolve(host, 0, family)
+        except OSError:
+            self.cache.set_failed(host, family)
+            raise
+        self.cache.set(host, addresses, family)
+        return addresses
+
+    async def resolve(
+        self, host: str, port: int = 0, family=socket.AF_INET
+    ) -> List[ResolveResult]:
+        if self.cache.is_failed(host, family):
+            raise OSError(None, f"Domain name {host} not found (cached)")
+
+        addresses = self.cache.get(host, family)
+        if addresses is None:
+            key = (host, family)
+            future = self._in_flight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self._resolve(host, family))
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            addresses = await asyncio.shield(future)
+
+        return [{**a, 'port': port or a['port']} for a in addresses]
+
+    async def resolve_hosts(
+        self, hosts: Iterable[str], concurrency=50, timeout=5.0
+    ) -> Set[str]:
+        """
+        Resolve hosts concurrently to warm up the cache.
+        Return hosts that definitely failed; timed out ones are not included.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        failed = set()
+
+        async def resolve_host(host):
+            async with semaphore:
+                try:
+                    await asyncio.wait_for(
+                        self.resolve(host, family=socket.AF_UNSPEC), timeout
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                except OSError:
+                    failed.add(host)
+
+        await asyncio.gather(*[resolve_host(h) for h in set(hosts)])
+        return failed
+
+    async def close(self):
+        if self._resolver is not None:
+            await self._resolver.close()
+            self._resolver = None
@@ -34,6 +34,18 @@ class MaigretCheckResult:
     Describes result of checking a given username on a given site
     """
 
+    __slots__ = (
+        "username",
+        "site_name",
+        "site_url_user",
+        "status",
+        "query_time",
+        "context",
+        "ids_data",
+        "tags",
+        "error",
+    )
+
     def __init__(
         self,
         username,
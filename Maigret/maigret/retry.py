@@ -0,0 +1,96 @@
+"""Maigret inline retries of temporarily failed site checks"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from . import errors
+from .errors import CheckError
+
+
+# statuses with which servers ask to come back later
+RETRY_AFTER_STATUSES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header: delay in seconds
+    or HTTP date. None if the header is absent or malformed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None:
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+class RetryPolicy:
+    """
+    Policy of retries of one search: a site check failed with a temporary
+    error is retried at once in the same task, up to `retries` times, after
+    a jittered exponential backoff or a delay asked by the server with
+    Retry-After header. Checks of other sites go on in the meanwhile.
+
+    The number of retries of all the sites is capped by `max_retries`,
+    so a broken connection doesn't double the time of the search.
+    """
+
+    def __init__(
+        self,
+        retries: int,
+        max_retries: int,
+        base_delay=0.5,
+        max_delay=5.0,
+    ):
+        self.retries = retries
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # counter for logging
+        self.used = 0
+
+    def get_delay(
+        self, attempt: int, retry_after: Optional[float] = None
+    ) -> Optional[float]:
+        """
+        Time to wait before the retry number `attempt` (from 0),
+        None if the server asks to wait longer than `max_delay`
+        """
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            return retry_after
+        # "full jitter": retries of many sites don't come back at once
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def acquire(
+        self,
+        attempt: int,
+        error: Optional[CheckError],
+        retry_after: Optional[float] = None,
+    ) -> Optional[float]:
+        """
+        Delay before retrying a check failed with error for the attempt
+        number `attempt`, None if it shouldn't be retried
+        """
+        if error is None or errors.is_permanent(error.type):
+            return None
+        if attempt >= self.retries or self.used >= self.max_retries:
+            return None
+        delay = self.get_delay(attempt, retry_after)
+        if delay is not None:
+            self.used += 1
+        return delay
+
+    @property
+    def max_total_delay(self) -> float:
+        """Upper bound of time spent in backoffs by one site check"""
+        return self.retries * self.max_delay
@@ -0,0 +1,221 @@
+"""Maigret long-lived search service"""
+
+import asyncio
+import logging
+import os.path as path
+import sys
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .activation import SiteActivator, import_aiohttp_cookies
+from .cache import ResultCache
+from .checking import DEFAULT_MAX_BODY_SIZE, make_checkers, maigret_batch
+from .resolver import DNSCache
+from .sites import MaigretDatabase, MaigretSite
+from .stats import SitesStatsStore
+from .types import QueryResultWrapper
+
+
+DEFAULT_DB_PATH = path.join(path.dirname(path.realpath(__file__)), "resources/data.json")
+
+
+class MaigretService:
+    """
+    Search service to be created once per process (e.g. by a bot).
+
+    Keeps the sites database, the cookie jar, the DNS cache and the
+    checkers with their HTTP connection pools (and so TLS connections)
+    and the tokens of sites needing activation warm between searches. Per-site statistics of checks are collected
+    and saved to `stats_path` (if any) on closing. Results of checks are
+    reused between searches if `result_cache` is set (it's closed by
+    its owner), see ResultCache.
+    Must be used inside one event loop and closed
+    with `close()` or as an async context manager.
+    """
+
+    def __init__(
+        self,
+        db: Optional[MaigretDatabase] = None,
+        db_path: str = DEFAULT_DB_PATH,
+        logger=None,
+        proxy=None,
+        tor_proxy=None,
+        i2p_proxy=None,
+        cookies=None,
+        check_domains=False,
+        max_connections=100,
+        max_connections_per_host=4,
+        keepalive_timeout=60,
+        dns_cache_ttl=300,
+        max_body_size=DEFAULT_MAX_BODY_SIZE,
+        stats_path: Optional[str] = None,
+        result_cache: Optional[ResultCache] = None,
+    ):
+        self.logger = logger or logging.getLogger('maigret')
+        self.db_path = db_path
+        self._db = db
+        self.proxy = proxy
+        self.tor_proxy = tor_proxy
+        self.i2p_proxy = i2p_proxy
+        self.cookies = cookies
+        self.check_domains = check_domains
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        # bytes of a page to download at most, 0 for no limit
+        self.max_body_size = max_body_size
+        self.pool_options = {
+            'connections_limit': max_connections,
+            'connections_per_host_limit': max_connections_per_host,
+            'keepalive_timeout': keepalive_timeout,
+        }
+        # outlives checkers, e.g. after the event loop change
+        self.dns_cache = DNSCache(ttl=dns_cache_ttl)
+        # tokens are reused until expiration
+        self.activator = SiteActivator()
+        self.stats_store = SitesStatsStore(stats_path)
+        try:
+            self.stats_store.load()
+        except ValueError as e:
+            # broken stats are replaced on closing
+            self.logger.warning(e)
+        self.result_cache = result_cache
+        self.checkers: Optional[Dict] = None
+        self._loop = None
+
+    @property
+    def db(self) -> MaigretDatabase:
+        if self._db is None:
+            self._db = MaigretDatabase().load_from_path(self.db_path)
+        return self._db
+
+    def get_checkers(self) -> Dict:
+        loop = asyncio.get_running_loop()
+        if self.checkers is not None and self._loop is not loop:
+            # pools are bound to the loop they were created in
+            self.logger.warning('Event loop has changed, recreating checkers')
+            self.checkers = None
+
+        if self.checkers is None:
+            cookie_jar = None
+            if self.cookies:
+                self.logger.debug(f"Using cookies jar file {self.cookies}")
+                cookie_jar = import_aiohttp_cookies(self.cookies)
+
+            self.checkers = make_checkers(
+                self.logger,
+                proxy=self.proxy,
+                tor_proxy=self.tor_proxy,
+                i2p_proxy=self.i2p_proxy,
+                cookie_jar=cookie_jar,
+                check_domains=self.check_domains,
+                dns_cache=self.dns_cache,
+                **self.pool_options,
+            )
+            self._loop = loop
+
+        return self.checkers
+
+    def get_sites(
+        self,
+        top_sites=sys.maxsize,
+        tags: Optional[List[str]] = None,
+        site_list: Optional[List[str]] = None,
+        use_disabled_sites=False,
+        id_type="username",
+    ) -> Dict[str, MaigretSite]:
+        return self.db.ranked_sites_dict(
+            top=top_sites,
+            tags=tags or [],
+            names=site_list or [],
+            disabled=use_disabled_sites,
+            id_type=id_type,
+        )
+
+    async def search(
+        self,
+        username: str,
+        site_dict: Optional[Dict[str, MaigretSite]] = None,
+        top_sites=500,
+        tags: Optional[List[str]] = None,
+        site_list: Optional[List[str]] = None,
+        use_disabled_sites=False,
+        id_type="username",
+        no_progressbar=True,
+        **kwargs,
+    ) -> QueryResultWrapper:
+        """
+        Search username with warm checkers, see `checking.maigret()` for
+        the rest of keyword arguments.
+        By default top sites of the loaded database are used.
+        """
+        results: QueryResultWrapper = {}
+        async for _, sitename, result in self.search_batch(
+            [username],
+            site_dict=site_dict,
+            top_sites=top_sites,
+            tags=tags,
+            site_list=site_list,
+            use_disabled_sites=use_disabled_sites,
+            id_type=id_type,
+            no_progressbar=no_progressbar,
+            **kwargs,
+        ):
+            results[sitename] = result
+        return results
+
+    async def search_batch(
+        self,
+        usernames: List[str],
+        site_dict: Optional[Dict[str, MaigretSite]] = None,
+        top_sites=500,
+        tags: Optional[List[str]] = None,
+        site_list: Optional[List[str]] = None,
+        use_disabled_sites=False,
+        id_type="username",
+        no_progressbar=True,
+        **kwargs,
+    ) -> AsyncIterator[Tuple[str, str, QueryResultWrapper]]:
+        """
+        Search usernames at once with warm checkers and yield tuples of
+        username, site name and result as soon as they are ready, see
+        `checking.maigret_batch()` for the rest of keyword arguments.
+        """
+        if site_dict is None:
+            site_dict = self.get_sites(
+                top_sites=top_sites,
+                tags=tags,
+                site_list=site_list,
+                use_disabled_sites=use_disabled_sites,
+                id_type=id_type,
+            )
+
+        async for item in maigret_batch(
+            usernames=usernames,
+            site_dict=site_dict,
+            logger=kwargs.pop('logger', self.logger),
+            id_type=id_type,
+            forced=use_disabled_sites,
+            max_connections=self.max_connections,
+            max_connections_per_host=self.max_connections_per_host,
+            max_body_size=kwargs.pop('max_body_size', self.max_body_size),
+            no_progressbar=no_progressbar,
+            checkers=self.get_checkers(),
+            stats_store=kwargs.pop('stats_store', self.stats_store),
+            result_cache=kwargs.pop('result_cache', self.result_cache),
+            activator=kwargs.pop('activator', self.activator),
+            **kwargs,
+        ):
+            yield item
+
+    async def close(self):
+        if self.checkers is not None:
+            for checker in self.checkers.values():
+                await checker.close()
+        self.checkers = None
+        self._loop = None
+        self.stats_store.save()
+
+    async def __aenter__(self) -> "MaigretService":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
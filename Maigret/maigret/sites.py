@@ -1,11 +1,85 @@
 # ****************************** -*-
 """Maigret Sites Information"""
+
 import copy
+import hashlib
 import json
+import os
+import pickle
+import re
 import sys
-from typing import Optional, List, Dict, Any, Tuple
+from string import Formatter
+from types import MappingProxyType
+from typing import Optional, List, Dict, Any, Mapping, Set, Tuple
+from urllib.parse import quote, urlparse
+
+from .__version__ import __version__
+from .errors import COMMON_ERRORS, CheckError, detect as detect_common_error
+from .utils import CaseConverter, LazyPattern, URLMatcher, is_country_tag
+
+# compiled snapshots of databases loaded from files, see MaigretDatabase.load_from_path
+DEFAULT_SNAPSHOTS_PATH = '~/.maigret/snapshots'
+# must be increased on changes of the snapshot file layout, changes of pickled
+# classes are detected by the hash of their modules, see get_snapshot_code_hash
+SNAPSHOT_FORMAT_VERSION = 3
+# modules of classes pickled to snapshots
+SNAPSHOT_MODULES = (__name__, f"{__package__}.errors", f"{__package__}.utils")
+
+_snapshot_code_hash: Optional[str] = None
+
+
+# fields of sites with values repeated across the database (check types,
+# engines, tags, etc), such values are kept in memory in one copy
+SHARED_VALUE_FIELDS = frozenset(
+    (
+        "check_type",
+        "engine",
+        "protocol",
+        "regex_check",
+        "request_method",
+        "source",
+        "tags",
+        "type",
+        "url_subpath",
+        "username_claimed",
+        "username_unclaimed",
+    )
+)
+
+
+def get_file_state(filename: str) -> Optional[Tuple[str, int, int]]:
+    """Path, mtime and size of a file to detect its changes, None if it's absent"""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return os.path.abspath(filename), stat.st_mtime_ns, stat.st_size
+
+
+def get_snapshot_code_hash() -> str:
+    """Hash of the source of modules with pickled classes, computed once"""
+    global _snapshot_code_hash
+    if _snapshot_code_hash is None:
+        code_hash = hashlib.sha256()
+        for name in SNAPSHOT_MODULES:
+            try:
+                with open(sys.modules[name].__file__ or "", "rb") as file:
+                    code_hash.update(file.read())
+            except (KeyError, OSError):
+                # e.g. a frozen app, the format version is the only guard
+                code_hash.update(name.encode("utf-8"))
+        _snapshot_code_hash = code_hash.hexdigest()
+    return _snapshot_code_hash
+
 
-from .utils import CaseConverter, URLMatcher, is_country_tag
+def intern_site_value(field: str, value: Any) -> Any:
+    if field not in SHARED_VALUE_FIELDS:
+        return value
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [sys.intern(v) if isinstance(v, str) else v for v in value]
+    return value
 
 
 class MaigretEngine:
@@ -20,6 +94,188 @@ class MaigretEngine:
         return self.__dict__
 
 
+class SiteMarkers:
+    """
+    Page markers of a site compiled once on site loading/updating:
+    deduplicated and merged with the engine ones.
+    Scans are skipped for kinds of markers a site doesn't have.
+    """
+
+    __slots__ = (
+        "fail_flags",
+        "presense_strs",
+        "absence_strs",
+        "activation_marks",
+        "stop_markers",
+    )
+
+    def __init__(
+        self,
+        fail_flags: Dict[str, str],
+        presense_strs: List[str],
+        absence_strs: List[str],
+        activation_marks: List[str],
+    ):
+        self.fail_flags = tuple(
+            (flag, CheckError("Site-specific", msg)) for flag, msg in fail_flags.items()
+        )
+        self.presense_strs = tuple(dict.fromkeys(presense_strs))
+        self.absence_strs = tuple(dict.fromkeys(absence_strs))
+        self.activation_marks = tuple(dict.fromkeys(activation_marks))
+
+        # markers after which the rest of a page doesn't matter: errors take
+        # precedence over presence and absence markers anywhere in a page;
+        # errors of markers are ordered as in detect_error()
+        self.stop_markers: Dict[str, CheckError] = dict(self.fail_flags)
+        for flag, error in COMMON_ERRORS.items():
+            self.stop_markers.setdefault(flag, error)
+
+    def detect_error(self, text: str) -> Optional[CheckError]:
+        for flag, error in self.fail_flags:
+            if flag in text:
+                return error
+        return detect_common_error(text)
+
+    def detect_presense(self, text: str) -> Optional[str]:
+        for flag in self.presense_strs:
+            if flag in text:
+                return flag
+        return None
+
+    def is_absence_detected(self, text: str) -> bool:
+        return any(flag in text for flag in self.absence_strs)
+
+    def is_activation_needed(self, text: str) -> bool:
+        return any(mark in text for mark in self.activation_marks)
+
+
+def split_url_template(template: str, values: Dict[str, str]) -> Tuple[Any, ...]:
+    """
+    Format all the fields of an URL template except a username one.
+    Return static parts of the URL with None in place of the username.
+    """
+    parts: List[Any] = []
+    static = ""
+    for literal, field, spec, conversion in Formatter().parse(template):
+        static += literal
+        if field is None:
+            continue
+        if field == "username":
+            parts.append(static)
+            parts.append(None)
+            static = ""
+        else:
+            # unknown fields raise KeyError, like str.format
+            static += format(values[field], spec or "")
+    parts.append(static)
+    return tuple(parts)
+
+
+class CheckPlan:
+    """
+    Request parameters of a site compiled once on site loading/updating,
+    so making a request for a username is just a join of strings.
+    """
+
+    # workaround to prevent slash errors
+    SLASHES_RE = re.compile("(?<!:)/+")
+
+    __slots__ = (
+        "templates",
+        "url_parts",
+        "probe_parts",
+        "probe_params",
+        "regex_check",
+        "username_re",
+        "method",
+        "allow_redirects",
+        "headers",
+    )
+
+    def __init__(self, site: "MaigretSite", url_main: Optional[str] = None):
+        # url_main is set to make a plan for a mirror of the site
+        values = {
+            "urlMain": site.url_main if url_main is None else url_main,
+            "urlSubpath": site.url_subpath,
+        }
+
+        # templates and their values, kept for broken templates only
+        self.templates: Optional[Tuple[str, Optional[str], Dict[str, str]]] = None
+        try:
+            # username is quoted in a public URL, so it can't contain ':'
+            # and break the slashes cleanup at the bounds of parts
+            self.url_parts: Tuple[Any, ...] = tuple(
+                self.SLASHES_RE.sub("/", p) if p else p
+                for p in split_url_template(site.url, values)
+            )
+            self.probe_parts = (
+                split_url_template(site.url_probe, values) if site.url_probe else None
+            )
+        except (KeyError, IndexError, ValueError):
+            # broken templates are formatted on checks to fail them only,
+            # not loading of the database
+            self.url_parts = ()
+            self.probe_parts = None
+            self.templates = (site.url, site.url_probe, values)
+        self.probe_params = "".join(f"&{k}={v}" for k, v in site.get_params.items())
+
+        self.regex_check = site.regex_check
+        self.username_re = re.compile(site.regex_check) if site.regex_check else None
+
+        if site.check_type == "status_code" and site.request_head_only:
+            # In most cases when we are detecting by status code,
+            # it is not necessary to get the entire body:  we can
+            # detect fine with just the HEAD response.
+            self.method = "head"
+        else:
+            # Either this detect method needs the content associated
+            # with the GET response, or this specific website will
+            # not respond properly unless we request the whole page.
+            self.method = "get"
+
+        # Site forwards request to a different URL if username not
+        # found.  Disallow the redirect so we can capture the
+        # http status from the original URL request.
+        self.allow_redirects = site.check_type != "response_url"
+
+        self.headers = tuple(site.headers.items())
+
+    @staticmethod
+    def _join(parts: Tuple[Any, ...], username: str) -> str:
+        return "".join(username if p is None else p for p in parts)
+
+    def make_url(self, username: str) -> str:
+        """Public URL of a user profile"""
+        quoted_username = quote(username)
+        if self.templates is not None:
+            url_template, _, values = self.templates
+            url = url_template.format(**values, username=quoted_username)
+            return self.SLASHES_RE.sub("/", url)
+        url = self._join(self.url_parts, quoted_username)
+        if not quoted_username or "/" in quoted_username:
+            url = self.SLASHES_RE.sub("/", url)
+        return url
+
+    def make_probe_url(self, username: str, url: str) -> str:
+        """URL to request, url is the public one made by make_url"""
+        if self.probe_parts is not None:
+            # There is a special URL for probing existence separate
+            # from where the user profile normally can be found.
+            url = self._join(self.probe_parts, username)
+        elif self.templates is not None and self.templates[1]:
+            _, probe_template, values = self.templates
+            url = probe_template.format(**values, username=username)
+        return url + self.probe_params
+
+    def is_username_allowed(self, username: str) -> bool:
+        return self.username_re is None or self.username_re.search(username) is not None
+
+    def make_headers(self, user_agent: str) -> Dict[str, str]:
+        headers = {"User-Agent": user_agent}
+        headers.update(self.headers)
+        return headers
+
+
 class MaigretSite:
     # Fields that should not be serialized when converting site to JSON
     NOT_SERIALIZABLE_FIELDS = [
@@ -30,6 +286,9 @@ class MaigretSite:
         "engineObj",
         "stats",
         "urlRegexp",
+        "urlRegexpHost",
+        "markers",
+        "checkPlan",
     ]
 
     # Username known to exist on the site
@@ -69,6 +328,8 @@ class MaigretSite:
     request_head_only = ""
     # GET parameters to include in requests
     get_params: Dict[str, Any] = {}
+    # Maximum size of a page to download in bytes, 0 to use the search one
+    max_body_size = 0
 
     # Substrings in HTML response that indicate profile exists
     presense_strs: List[str] = []
@@ -92,13 +353,16 @@ class MaigretSite:
 
     # URL protocol (http/https)
     protocol = ''
+    # Host part of url_regexp, see URLMatcher.extract_profile_url_host
+    url_regexp_host: Optional[str] = None
 
     def __init__(self, name, information):
         self.name = name
         self.url_subpath = ""
 
         for k, v in information.items():
-            self.__dict__[CaseConverter.camel_to_snake(k)] = v
+            field = sys.intern(CaseConverter.camel_to_snake(k))
+            self.__dict__[field] = intern_site_value(field, v)
 
         if (self.alexa_rank is None) or (self.alexa_rank == 0):
             # We do not know the popularity, so make site go to bottom of list.
@@ -167,7 +431,19 @@ class MaigretSite:
                         self.__dict__[CaseConverter.camel_to_snake(group)],
                     )
 
-            self.url_regexp = URLMatcher.make_profile_url_regexp(url, self.regex_check)
+            self.url_regexp = LazyPattern(
+                URLMatcher.make_profile_url_pattern(url, self.regex_check),
+                re.IGNORECASE,
+            )
+            self.url_regexp_host = URLMatcher.extract_profile_url_host(url)
+
+        self.markers = SiteMarkers(
+            self.errors_dict,
+            self.presense_strs,
+            self.absence_strs,
+            self.activation.get("marks", []),
+        )
+        self.check_plan = CheckPlan(self)
 
     def detect_username(self, url: str) -> Optional[str]:
         if self.url_regexp:
@@ -194,6 +470,25 @@ class MaigretSite:
 
         return _id, _type
 
+    @property
+    def url_host(self) -> str:
+        """Hostname of the site, used to group requests to the same server"""
+        url = self.url_main or self.url
+        host = urlparse(url).hostname if "://" in url else None
+        return host or self.name
+
+    @property
+    def request_host(self) -> Optional[str]:
+        """Hostname of the URL to be requested, None if it depends on a username"""
+        url = self.url_probe or self.url
+        url = url.replace("{urlMain}", self.url_main).replace(
+            "{urlSubpath}", self.url_subpath
+        )
+        host = urlparse(url).hostname if "://" in url else None
+        if not host or "{" in host:
+            return None
+        return host
+
     @property
     def pretty_name(self):
         if self.source:
@@ -243,7 +538,7 @@ class MaigretSite:
     def update_from_engine(self, engine: MaigretEngine) -> "MaigretSite":
         engine_data = engine.site
         for k, v in engine_data.items():
-            field = CaseConverter.camel_to_snake(k)
+            field = sys.intern(CaseConverter.camel_to_snake(k))
             if isinstance(v, dict):
                 # TODO: assertion of intersecting keys
                 # update dicts like errors
@@ -295,16 +590,41 @@ class MaigretDatabase:
         self._tags: list = []
         self._sites: list = []
         self._engines: list = []
+        # indexes of sites, maintained by _add_site() and update_site()
+        self._sites_by_name: Dict[str, MaigretSite] = {}
+        self._positions: Dict[str, int] = {}
+        self._sites_by_lower_name: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_source: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_tag: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_engine: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_protocol: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_id_type: Dict[str, Dict[str, MaigretSite]] = {}
+        # sites by host of profile URLs, and by host suffix for sites with
+        # profiles on subdomains (e.g. ".example.com" for {username}.example.com)
+        self._sites_by_url_host: Dict[str, Dict[str, MaigretSite]] = {}
+        self._sites_by_url_host_suffix: Dict[str, Dict[str, MaigretSite]] = {}
+        self._index_keys: Dict[str, List[Tuple[Dict, str]]] = {}
+        self._ranks: Dict[str, Tuple[int, str]] = {}
+        # sites sorted by rank for every id type, made on demand
+        self._ranked: Optional[Dict[str, List[MaigretSite]]] = None
+        # names of sites changed since loading or saving, see save_to_file()
+        self._dirty_sites: Set[str] = set()
+        # path, mtime and size of the file the database is loaded from
+        self._source: Optional[Tuple[str, int, int]] = None
 
     @property
     def sites(self):
         return self._sites
 
     @property
-    def sites_dict(self):
-        return {site.name: site for site in self._sites}
+    def sites_dict(self) -> Mapping[str, MaigretSite]:
+        """Read-only view of sites by name, use update_site() to change it"""
+        return MappingProxyType(self._sites_by_name)
 
     def has_site(self, site: MaigretSite):
+        if isinstance(site, MaigretSite):
+            return site == self._sites_by_name.get(site.name)
+        # comparison of a string by name or url, see MaigretSite.__eq__
         for s in self._sites:
             if site == s:
                 return True
@@ -313,6 +633,72 @@ class MaigretDatabase:
     def __contains__(self, site):
         return self.has_site(site)
 
+    @property
+    def is_dirty(self) -> bool:
+        """Whether sites are changed since loading or saving"""
+        return bool(self._dirty_sites)
+
+    def _get_index_keys(self, site: MaigretSite) -> List[Tuple[Dict, str]]:
+        keys = [
+            (self._sites_by_lower_name, site.name.lower()),
+            (self._sites_by_id_type, site.type),
+        ]
+        if site.source:
+            keys.append((self._sites_by_source, site.source.lower()))
+        for tag in set(site.tags):
+            keys.append((self._sites_by_tag, tag))
+        if isinstance(site.engine, str):
+            keys.append((self._sites_by_engine, site.engine.lower()))
+        if site.protocol:
+            keys.append((self._sites_by_protocol, site.protocol))
+        host = site.url_regexp_host
+        if host is not None:
+            if "{" in host or not host:
+                # sites with a host template are matched by the constant
+                # part of the host after the username, "" for any URL
+                suffix = host[host.rfind("}") + 1 :]
+                dot = suffix.find(".")
+                suffix = suffix[dot:] if dot >= 0 else ""
+                keys.append((self._sites_by_url_host_suffix, suffix))
+            else:
+                keys.append((self._sites_by_url_host, host))
+        return keys
+
+    def _index_site(self, site: MaigretSite):
+        keys = self._get_index_keys(site)
+        for index, key in keys:
+            index.setdefault(key, {})[site.name] = site
+        self._index_keys[site.name] = keys
+        self._ranks[site.name] = (site.alexa_rank, site.type)
+        self._sites_by_name[site.name] = site
+
+    def _unindex_site(self, name: str):
+        for index, key in self._index_keys.pop(name, []):
+            sites = index[key]
+            del sites[name]
+            if not sites:
+                del index[key]
+
+    def _add_site(self, site: MaigretSite):
+        if site.name in self._sites_by_name:
+            self.update_site(site)
+            return
+        self._positions[site.name] = len(self._sites)
+        self._sites.append(site)
+        self._index_site(site)
+        self._ranked = None
+
+    def _rank_key(self, site: MaigretSite) -> Tuple[int, int]:
+        # sites of the same rank are kept in order of the database
+        return site.alexa_rank, self._positions[site.name]
+
+    def _get_ranked(self, id_type: str) -> List[MaigretSite]:
+        if self._ranked is None:
+            self._ranked = {}
+            for site in sorted(self._sites, key=self._rank_key):
+                self._ranked.setdefault(site.type, []).append(site)
+        return self._ranked.get(id_type, [])
+
     def ranked_sites_dict(
         self,
         reverse=False,
@@ -336,41 +722,59 @@ class MaigretDatabase:
         Returns:
             dict: Dictionary of filtered and ranked sites, with site names as keys and MaigretSite objects as values
         """
-        normalized_names = list(map(str.lower, names))
-        normalized_tags = list(map(str.lower, tags))
-
-        is_name_ok = lambda x: x.name.lower() in normalized_names
-        is_source_ok = lambda x: x.source and x.source.lower() in normalized_names
-        is_engine_ok = (
-            lambda x: isinstance(x.engine, str) and x.engine.lower() in normalized_tags
-        )
-        is_tags_ok = lambda x: set(x.tags).intersection(set(normalized_tags))
-        is_protocol_in_tags = lambda x: x.protocol and x.protocol in normalized_tags
-        is_disabled_needed = lambda x: not x.disabled or (
-            "disabled" in tags or disabled
-        )
-        is_id_type_ok = lambda x: x.type == id_type
-
-        filter_tags_engines_fun = (
-            lambda x: not tags
-            or is_engine_ok(x)
-            or is_tags_ok(x)
-            or is_protocol_in_tags(x)
-        )
-        filter_names_fun = lambda x: not names or is_name_ok(x) or is_source_ok(x)
-
-        filter_fun = (
-            lambda x: filter_tags_engines_fun(x)
-            and filter_names_fun(x)
-            and is_disabled_needed(x)
-            and is_id_type_ok(x)
-        )
-
-        filtered_list = [s for s in self.sites if filter_fun(s)]
+        normalized_names = set(map(str.lower, names))
+        normalized_tags = set(map(str.lower, tags))
+        is_disabled_ok = "disabled" in tags or disabled
+
+        # candidates are taken from indexes, the rest of filters are checked
+        candidates: Optional[Dict[str, MaigretSite]] = None
+        if names:
+            candidates = {}
+            for name in normalized_names:
+                candidates.update(self._sites_by_lower_name.get(name, {}))
+                candidates.update(self._sites_by_source.get(name, {}))
+
+        if tags:
+            tagged_sites: Dict[str, MaigretSite] = {}
+            for tag in normalized_tags:
+                for index in (
+                    self._sites_by_tag,
+                    self._sites_by_engine,
+                    self._sites_by_protocol,
+                ):
+                    tagged_sites.update(index.get(tag, {}))
+            if candidates is None:
+                candidates = tagged_sites
+            else:
+                candidates = {
+                    k: v for k, v in candidates.items() if k in tagged_sites
+                }
+
+        if candidates is None and not reverse:
+            # top sites are the first ones of the ranked list
+            result = {}
+            for site in self._get_ranked(id_type):
+                if len(result) >= top:
+                    break
+                if not site.disabled or is_disabled_ok:
+                    result[site.name] = site
+            return result
+
+        if candidates is None:
+            candidates = self._sites_by_id_type.get(id_type, {})
+
+        filtered_list = [
+            s
+            for s in candidates.values()
+            if s.type == id_type and (not s.disabled or is_disabled_ok)
+        ]
 
-        sorted_list = sorted(
-            filtered_list, key=lambda x: x.alexa_rank, reverse=reverse
-        )[:top]
+        if reverse:
+            # the same order of sites of the same rank as without reversing
+            sort_key = lambda x: (-x.alexa_rank, self._positions[x.name])
+        else:
+            sort_key = self._rank_key
+        sorted_list = sorted(filtered_list, key=sort_key)[:top]
         return {site.name: site for site in sorted_list}
 
     @property
@@ -382,28 +786,78 @@ class MaigretDatabase:
         return {engine.name: engine for engine in self._engines}
 
     def update_site(self, site: MaigretSite) -> "MaigretDatabase":
-        for s in self._sites:
-            if s.name == site.name:
-                s = site
-                return self
+        """
+        Add a new site or replace the one with the same name. Sites changed
+        in place must be updated too to keep indexes actual.
+        """
+        self._dirty_sites.add(site.name)
+        old_site = self._sites_by_name.get(site.name)
+        if old_site is None:
+            self._add_site(site)
+            return self
 
-        self._sites.append(site)
+        old_rank = self._ranks[site.name]
+        self._unindex_site(site.name)
+        self._sites[self._positions[site.name]] = site
+        self._index_site(site)
+
+        # ranked lists keep site objects
+        if old_site is not site or old_rank != self._ranks[site.name]:
+            self._ranked = None
         return self
 
     def save_to_file(self, filename: str) -> "MaigretDatabase":
+        """
+        Save database to a JSON file. Saving to the file the database is
+        loaded from is skipped if no sites are changed with update_site(),
+        and only changed sites are serialized again, others are taken from
+        the file as is. So sites changed in place must be passed to
+        update_site() to be saved. The file is replaced atomically.
+        """
         if '://' in filename:
             return self
 
+        is_source = self._source is not None and self._source == get_file_state(
+            filename
+        )
+        if is_source and not self._dirty_sites:
+            return self
+
+        saved_sites = {}
+        if is_source:
+            try:
+                with open(filename, "r", encoding="utf-8") as file:
+                    saved_sites = json.load(file).get("sites", {})
+            except (OSError, ValueError):
+                pass
+
+        sites_data = {}
+        for site in self._sites:
+            if site.name in saved_sites and site.name not in self._dirty_sites:
+                sites_data[site.name] = saved_sites[site.name]
+            else:
+                sites_data[site.name] = site.strip_engine_data().json
+
         db_data = {
-            "sites": {site.name: site.strip_engine_data().json for site in self._sites},
+            "sites": sites_data,
             "engines": {engine.name: engine.json for engine in self._engines},
             "tags": self._tags,
         }
 
         json_data = json.dumps(db_data, indent=4)
 
-        with open(filename, "w") as f:
-            f.write(json_data)
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_filename, "w") as f:
+                f.write(json_data)
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+        self._dirty_sites.clear()
+        self._source = get_file_state(filename)
 
         return self
 
@@ -426,7 +880,7 @@ class MaigretDatabase:
                 if engine:
                     maigret_site.update_from_engine(self.engines_dict[engine])
 
-                self._sites.append(maigret_site)
+                self._add_site(maigret_site)
             except KeyError as error:
                 raise ValueError(
                     f"Problem parsing json content for site {site_name}: "
@@ -446,12 +900,101 @@ class MaigretDatabase:
 
         return self.load_from_json(data)
 
-    def load_from_path(self, path: str) -> "MaigretDatabase":
+    def load_from_path(
+        self, path: str, snapshots_path: Optional[str] = DEFAULT_SNAPSHOTS_PATH
+    ) -> "MaigretDatabase":
         if '://' in path:
             return self.load_from_http(path)
+        elif snapshots_path:
+            return self.load_from_snapshot(path, snapshots_path)
         else:
             return self.load_from_file(path)
 
+    def load_from_snapshot(
+        self, filename: str, snapshots_path: str = DEFAULT_SNAPSHOTS_PATH
+    ) -> "MaigretDatabase":
+        """
+        Load database from a file through its compiled snapshot: pickled sites
+        and engines ready to use. The snapshot is used if it's made from the
+        file with the same mtime and size or the same content hash, otherwise
+        the file is loaded as JSON and the snapshot is (re)made.
+        """
+        snapshots_path = os.path.expanduser(snapshots_path)
+        filename = os.path.abspath(filename)
+        path_hash = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+        snapshot_filename = os.path.join(snapshots_path, f"{path_hash}.pickle")
+
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            # the same error as loading without snapshot
+            return self.load_from_file(filename)
+
+        key = {
+            "format": SNAPSHOT_FORMAT_VERSION,
+            "version": __version__,
+            "code": get_snapshot_code_hash(),
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+        content_hash = None
+        try:
+            with open(snapshot_filename, "rb") as file:
+                header = pickle.load(file)
+                is_fresh = all(header.get(k) == v for k, v in key.items())
+                if not is_fresh and header.get("size") == key["size"]:
+                    # e.g. the file is touched by git checkout
+                    content_hash = self._get_file_hash(filename)
+                    is_fresh = header.get("sha256") == content_hash and all(
+                        header.get(k) == key[k] for k in ("format", "version", "code")
+                    )
+                if is_fresh:
+                    tags, engines, sites = pickle.load(file)
+                    is_empty = not self._sites
+                    self._tags += tags
+                    self._engines += engines
+                    for site in sites:
+                        self._add_site(site)
+                    self._source = (
+                        (filename, stat.st_mtime_ns, stat.st_size)
+                        if is_empty
+                        else None
+                    )
+                    return self
+        except Exception:
+            # no snapshot yet, or it's broken
+            pass
+
+        db = MaigretDatabase().load_from_file(filename)
+        key["sha256"] = content_hash or self._get_file_hash(filename)
+        try:
+            os.makedirs(snapshots_path, exist_ok=True)
+            tmp_filename = f"{snapshot_filename}.{os.getpid()}.tmp"
+            with open(tmp_filename, "wb") as file:
+                pickle.dump(key, file, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(
+                    (db._tags, db._engines, db._sites),
+                    file,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_filename, snapshot_filename)
+        except OSError:
+            # snapshot is only an optimization, e.g. home dir can be read-only
+            pass
+
+        is_empty = not self._sites
+        self._tags += db._tags
+        self._engines += db._engines
+        for site in db._sites:
+            self._add_site(site)
+        self._source = db._source if is_empty else None
+        return self
+
+    @staticmethod
+    def _get_file_hash(filename: str) -> str:
+        with open(filename, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
     def load_from_http(self, url: str) -> "MaigretDatabase":
         is_url_valid = url.startswith("http://") or url.startswith("https://")
 
@@ -498,7 +1041,11 @@ class MaigretDatabase:
                 f"Problem while attempting to access " f"data file '{filename}'."
             ) from error
 
-        return self.load_from_json(data)
+        is_empty = not self._sites
+        self.load_from_json(data)
+        # unchanged sites are saved back as they are in the file
+        self._source = get_file_state(filename) if is_empty else None
+        return self
 
     def get_scan_stats(self, sites_dict):
         sites = sites_dict or self.sites_dict
@@ -510,9 +1057,26 @@ class MaigretDatabase:
 
         return found_flags
 
+    def get_url_sites(self, url: str) -> List[MaigretSite]:
+        """
+        Sites whose profile URL regexps may match the url, in order of the
+        database: looked up by the host of the url instead of matching
+        regexps of all the sites
+        """
+        candidates: Dict[str, MaigretSite] = {}
+        for host in URLMatcher.extract_hosts(url):
+            candidates.update(self._sites_by_url_host.get(host, {}))
+            suffix = host
+            while suffix:
+                candidates.update(self._sites_by_url_host_suffix.get(suffix, {}))
+                dot = suffix.find(".", 1)
+                suffix = suffix[dot:] if dot >= 0 else ""
+            candidates.update(self._sites_by_url_host_suffix.get("", {}))
+        return sorted(candidates.values(), key=lambda s: self._positions[s.name])
+
     def extract_ids_from_url(self, url: str) -> dict:
         results = {}
-        for s in self._sites:
+        for s in self.get_url_sites(url):
             result = s.extract_id_from_url(url)
             if not result:
                 continue
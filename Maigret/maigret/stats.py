@@ -0,0 +1,323 @@
+"""Maigret requests timing and persisted per-site statistics"""
+
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from aiohttp import TraceConfig
+from socid_extractor import __version__ as EXTRACTOR_VERSION
+
+from .utils import load_json_file, save_json_file
+
+
+DEFAULT_STATS_PATH = '~/.maigret/sites_stats.json'
+
+
+class RequestTiming:
+    """
+    Timings of a site check in seconds: DNS resolving, connecting,
+    time to the first byte of a response and total time.
+    Filled by aiohttp trace hooks, see make_trace_config.
+
+    Also keeps the delay from Retry-After header of 429 and 503 responses.
+    """
+
+    __slots__ = (
+        "started",
+        "dns",
+        "connect",
+        "ttfb",
+        "total",
+        "bytes",
+        "retry_after",
+        "_dns_started",
+        "_connect_started",
+        "_connect_dns",
+    )
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.dns = 0.0
+        self.connect = 0.0
+        self.ttfb: Optional[float] = None
+        self.total: Optional[float] = None
+        self.bytes = 0
+        self.retry_after: Optional[float] = None
+        self._dns_started = 0.0
+        self._connect_started = 0.0
+        self._connect_dns = 0.0
+
+    def finish(self):
+        self.total = time.monotonic() - self.started
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        return {
+            "dns": self.dns,
+            "connect": self.connect,
+            "ttfb": self.ttfb,
+            "total": self.total,
+            "bytes": self.bytes,
+        }
+
+    def __repr__(self):
+        return f"<RequestTiming {self.json}>"
+
+
+async def _on_dns_resolvehost_start(session, ctx, params):
+    timing = ctx.trace_request_ctx
+    if timing is not None:
+        timing._dns_started = time.monotonic()
+
+
+async def _on_dns_resolvehost_end(session, ctx, params):
+    timing = ctx.trace_request_ctx
+    if timing is not None:
+        timing.dns += time.monotonic() - timing._dns_started
+
+
+async def _on_connection_create_start(session, ctx, params):
+    timing = ctx.trace_request_ctx
+    if timing is not None:
+        timing._connect_started = time.monotonic()
+        timing._connect_dns = timing.dns
+
+
+async def _on_connection_create_end(session, ctx, params):
+    timing = ctx.trace_request_ctx
+    if timing is not None:
+        # resolving is done inside of connection creating
+        elapsed = time.monotonic() - timing._connect_started
+        dns = timing.dns - timing._connect_dns
+        timing.connect += max(elapsed - dns, 0.0)
+
+
+async def _on_request_end(session, ctx, params):
+    timing = ctx.trace_request_ctx
+    # the first response, redirects are not counted
+    if timing is not None and timing.ttfb is None:
+        timing.ttfb = time.monotonic() - timing.started
+
+
+def make_trace_config() -> TraceConfig:
+    """
+    Trace config filling RequestTiming passed to a request
+    as `trace_request_ctx`
+    """
+    trace_config = TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
+
+
+class SiteStats:
+    """
+    Rolling statistics of site checks: total times of last requests,
+    checks, errors and found accounts counters and bytes transferred.
+    Also counters of extractions of ids data from pages of found accounts
+    and successful ones.
+    """
+
+    __slots__ = (
+        "latencies",
+        "checks",
+        "errors",
+        "claims",
+        "bytes",
+        "extractions",
+        "extracted",
+    )
+
+    def __init__(self, max_samples=50):
+        self.latencies: deque = deque(maxlen=max_samples)
+        self.checks = 0
+        self.errors = 0
+        self.claims = 0
+        self.bytes = 0
+        self.extractions = 0
+        self.extracted = 0
+
+    def add(
+        self,
+        timing: RequestTiming,
+        is_error: bool,
+        is_latency_known: bool,
+        is_claimed=False,
+    ):
+        self.checks += 1
+        self.errors += int(is_error)
+        self.claims += int(is_claimed)
+        self.bytes += timing.bytes
+        # e.g. failed connections have no latency of a site
+        if is_latency_known and timing.total is not None:
+            self.latencies.append(timing.total)
+
+    def add_extraction(self, is_extracted: bool):
+        self.extractions += 1
+        self.extracted += int(is_extracted)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Nearest-rank percentile of latencies, None if there are no ones"""
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        rank = math.ceil(percent / 100 * len(values))
+        return values[min(max(rank, 1), len(values)) - 1]
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.checks if self.checks else 0.0
+
+    @property
+    def claim_rate(self) -> float:
+        """Share of found accounts, smoothed for sites with few checks"""
+        return (self.claims + 1) / (self.checks + 2)
+
+    @property
+    def json(self) -> Dict[str, Any]:
+        return {
+            "latencies": [round(t, 3) for t in self.latencies],
+            "checks": self.checks,
+            "errors": self.errors,
+            "claims": self.claims,
+            "bytes": self.bytes,
+            "extractions": self.extractions,
+            "extracted": self.extracted,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any], max_samples=50) -> "SiteStats":
+        stats = cls(max_samples)
+        stats.latencies.extend(data.get("latencies", []))
+        stats.checks = data.get("checks", 0)
+        stats.errors = data.get("errors", 0)
+        stats.claims = data.get("claims", 0)
+        stats.bytes = data.get("bytes", 0)
+        stats.extractions = data.get("extractions", 0)
+        stats.extracted = data.get("extracted", 0)
+        return stats
+
+
+class SitesStatsStore:
+    """
+    Per-site statistics of checks, persisted between searches in a JSON file.
+
+    Extraction counters are reset on update of socid_extractor, as its
+    new schemes may match pages of sites which yielded nothing before.
+    """
+
+    def __init__(self, filename: Optional[str] = None, max_samples=50):
+        self.filename = os.path.expanduser(filename) if filename else None
+        self.max_samples = max_samples
+        self.sites: Dict[str, SiteStats] = {}
+
+    def __contains__(self, site_name) -> bool:
+        return site_name in self.sites
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    def get(self, site_name: str) -> Optional[SiteStats]:
+        return self.sites.get(site_name)
+
+    def update(
+        self,
+        site_name: str,
+        timing: RequestTiming,
+        is_error: bool,
+        is_latency_known: bool = True,
+        is_claimed: bool = False,
+    ):
+        stats = self.sites.get(site_name)
+        if stats is None:
+            stats = self.sites[site_name] = SiteStats(self.max_samples)
+        stats.add(timing, is_error, is_latency_known, is_claimed)
+
+    def update_extraction(self, site_name: str, is_extracted: bool):
+        stats = self.sites.get(site_name)
+        if stats is None:
+            stats = self.sites[site_name] = SiteStats(self.max_samples)
+        stats.add_extraction(is_extracted)
+
+    def is_extraction_needed(self, site_name: str, min_attempts=3) -> bool:
+        """Site has yielded ids data or hasn't been parsed enough times yet"""
+        stats = self.sites.get(site_name)
+        return stats is None or stats.extracted > 0 or stats.extractions < min_attempts
+
+    def get_timeout(
+        self,
+        site_name: str,
+        timeout: float,
+        factor=2.0,
+        min_timeout=1.0,
+        max_timeout: Optional[float] = None,
+        min_samples=5,
+    ) -> float:
+        """
+        Timeout of a site check derived from its latencies: p95 multiplied
+        by factor and clamped to [min_timeout, max_timeout]. The global
+        timeout is a ceiling and is used for sites without enough samples.
+        """
+        stats = self.sites.get(site_name)
+        if stats is None or len(stats.latencies) < min_samples:
+            return timeout
+
+        ceiling = min(timeout, max_timeout) if max_timeout else timeout
+        site_timeout = stats.percentile(95) * factor
+        return min(max(site_timeout, min_timeout), ceiling)
+
+    def get_priorities(self, site_names: List[str], timeout: float) -> Dict[str, float]:
+        """
+        Expected value of checks of sites: claim rate divided by expected
+        latency (median one). Sites without statistics get the median
+        latency of known sites, timeout if there are no ones.
+        """
+        latencies = {}
+        for name in site_names:
+            stats = self.sites.get(name)
+            latency = stats.percentile(50) if stats else None
+            if latency is not None:
+                latencies[name] = max(latency, 0.001)
+
+        known_latencies = sorted(latencies.values())
+        default_latency = (
+            known_latencies[len(known_latencies) // 2] if known_latencies else timeout
+        )
+
+        priorities = {}
+        for name in site_names:
+            stats = self.sites.get(name)
+            claim_rate = stats.claim_rate if stats else 0.5
+            priorities[name] = claim_rate / latencies.get(name, default_latency)
+        return priorities
+
+    def load(self) -> "SitesStatsStore":
+        if not self.filename:
+            return self
+        data = load_json_file(self.filename, "stats")
+        if data is None:
+            # no searches were made yet
+            return self
+
+        self.sites = {
+            name: SiteStats.from_json(site_data, self.max_samples)
+            for name, site_data in data.get("sites", {}).items()
+        }
+        if data.get("extractor_version") != EXTRACTOR_VERSION:
+            for stats in self.sites.values():
+                stats.extractions = stats.extracted = 0
+        return self
+
+    def save(self):
+        if not self.filename:
+            return
+        data = {
+            "extractor_version": EXTRACTOR_VERSION,
+            "sites": {name: s.json for name, s in self.sites.items()},
+        }
+        save_json_file(self.filename, data)
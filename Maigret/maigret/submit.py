@@ -382,6 +382,9 @@ class Submitter:
 
                 if new_value:
                     setattr(site, field, new_value)
+                    site.update_detectors()
+                    if site in self.db:
+                        self.db.update_site(site)
                     print(f"Updated {field} to: {new_value}")
 
         self.logger.info(site.json)
@@ -1,10 +1,12 @@
 # coding: utf8
 import ast
 import difflib
+import json
+import os
 import re
 import random
 import string
-from typing import Any
+from typing import Any, Dict, List, Optional, Pattern
 
 
 DEFAULT_USER_AGENTS = [
@@ -45,6 +47,8 @@ def enrich_link_str(link: str) -> str:
 class URLMatcher:
     _HTTP_URL_RE_STR = "^https?://(www.|m.)?(.+)$"
     HTTP_URL_RE = re.compile(_HTTP_URL_RE_STR)
+    HTTP_SCHEME_RE = re.compile("^https?://", re.IGNORECASE)
+    HOST_END_RE = re.compile("[/?#]")
     UNSAFE_SYMBOLS = ".?"
 
     @classmethod
@@ -57,6 +61,12 @@ class URLMatcher:
 
     @classmethod
     def make_profile_url_regexp(self, url: str, username_regexp: str = ""):
+        return re.compile(
+            self.make_profile_url_pattern(url, username_regexp), re.IGNORECASE
+        )
+
+    @classmethod
+    def make_profile_url_pattern(self, url: str, username_regexp: str = "") -> str:
         url_main_part = self.extract_main_part(url)
         for c in self.UNSAFE_SYMBOLS:
             url_main_part = url_main_part.replace(c, f"\\{c}")
@@ -65,9 +75,69 @@ class URLMatcher:
         url_regexp = url_main_part.replace(
             "{username}", f"({prepared_username_regexp})"
         )
-        regexp_str = self._HTTP_URL_RE_STR.replace("(.+)", url_regexp)
+        return self._HTTP_URL_RE_STR.replace("(.+)", url_regexp)
 
-        return re.compile(regexp_str, re.IGNORECASE)
+    @classmethod
+    def extract_profile_url_host(self, url: str) -> str:
+        """
+        Lowercased host part of a profile URL regexp made from the url,
+        may contain {username} for sites with profiles on subdomains
+        """
+        return self.HOST_END_RE.split(self.extract_main_part(url), 1)[0].lower()
+
+    @classmethod
+    def extract_hosts(self, url: str) -> List[str]:
+        """
+        Lowercased hosts of the url in all forms that profile URL regexps
+        can match: as is, and without "www." or "m." prefix
+        """
+        match = self.HTTP_SCHEME_RE.match(url)
+        if not match:
+            return []
+        host = self.HOST_END_RE.split(url[match.end() :], 1)[0].lower()
+        hosts = [host]
+        # the same prefixes as in HTTP_URL_RE, dots there match any symbol
+        if host.startswith("www") and len(host) > 4:
+            hosts.append(host[4:])
+        if host.startswith("m") and len(host) > 2:
+            hosts.append(host[2:])
+        return hosts
+
+
+class LazyPattern:
+    """
+    Regular expression compiled on the first use: most of loaded sites never
+    match URLs, and compiled patterns are compiled again on unpickling.
+    """
+
+    __slots__ = ("pattern", "flags", "_compiled")
+
+    def __init__(self, pattern: str, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled: Optional[Pattern] = None
+
+    @property
+    def compiled(self) -> Pattern:
+        if self._compiled is None:
+            self._compiled = re.compile(self.pattern, self.flags)
+        return self._compiled
+
+    def match(self, string: str):
+        return self.compiled.match(string)
+
+    def search(self, string: str):
+        return self.compiled.search(string)
+
+    def __getstate__(self):
+        return self.pattern, self.flags
+
+    def __setstate__(self, state):
+        self.pattern, self.flags = state
+        self._compiled = None
+
+    def __repr__(self):
+        return f"LazyPattern({self.pattern!r})"
 
 
 def ascii_data_display(data: str) -> Any:
@@ -124,3 +194,40 @@ def get_match_ratio(base_strs: list):
 
 def generate_random_username():
     return ''.join(random.choices(string.ascii_lowercase, k=10))
+
+
+def load_json_file(filename: str, description: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a JSON file saved by save_json_file(), None if there is no file yet.
+    Raise ValueError if the file is broken.
+    """
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as error:
+        raise ValueError(
+            f"Problem with parsing json contents of "
+            f"{description} file '{filename}': {str(error)}."
+        )
+
+
+def save_json_file(filename: str, data: Dict[str, Any]):
+    """
+    Save data to a JSON file atomically: through a temporary file of the
+    process, so concurrent runs don't truncate the file of each other.
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_filename, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
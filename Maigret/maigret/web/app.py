@@ -11,8 +11,9 @@ from flask import (
 import logging
 import os
 import asyncio
+import atexit
 from datetime import datetime
-from threading import Thread
+from threading import Lock, Thread
 import maigret
 import maigret.settings
 from maigret.sites import MaigretDatabase
@@ -41,68 +42,125 @@ def setup_logger(log_level, name):
     return logger
 
 
-async def maigret_search(username, options):
-    logger = setup_logger(logging.WARNING, 'maigret')
-    try:
-        db = MaigretDatabase().load_from_path(MAIGRET_DB_FILE)
-        
-        top_sites = int(options.get('top_sites') or 500) 
-        if options.get('all_sites'):
-            top_sites = 999999999  # effectively all
-        
-        tags = options.get('tags', [])
-        site_list= options.get('site_list', [])
-        logger.info(f"Filtering sites by tags: {tags}")
-        
-        sites = db.ranked_sites_dict(
-            top=top_sites,
-            tags=tags,
-            names=site_list,
-            disabled=False,
-            id_type='username'
-        )
-        
-        logger.info(f"Found {len(sites)} sites matching the tag criteria")
+_maigret_db = None
+
+
+def get_maigret_db():
+    # the database is loaded once and shared by all the search jobs
+    global _maigret_db
+    if _maigret_db is None:
+        _maigret_db = MaigretDatabase().load_from_path(MAIGRET_DB_FILE)
+    return _maigret_db
+
+
+def make_maigret_service(options):
+    return maigret.MaigretService(
+        db=get_maigret_db(),
+        logger=setup_logger(logging.WARNING, 'maigret'),
+        cookies=COOKIES_FILE if options.get('use_cookies') else None,
+        check_domains=options.get('with_domains', False),
+        proxy=options.get('proxy', None),
+        tor_proxy=options.get('tor_proxy', None),
+        i2p_proxy=options.get('i2p_proxy', None),
+    )
+
+
+# searches of all the jobs are made in one event loop of the process, so
+# services with their connection pools and DNS caches outlive the jobs
+_search_loop = None
+_search_loop_lock = Lock()
+# services by their connection options, used in the search loop only
+_maigret_services = {}
+
+
+def get_search_loop():
+    global _search_loop
+    with _search_loop_lock:
+        if _search_loop is None:
+            _search_loop = asyncio.new_event_loop()
+            Thread(
+                target=_search_loop.run_forever, name='maigret-search', daemon=True
+            ).start()
+            atexit.register(close_search_loop)
+    return _search_loop
+
+
+def get_maigret_service(options):
+    key = (
+        bool(options.get('use_cookies')),
+        bool(options.get('with_domains', False)),
+        options.get('proxy'),
+        options.get('tor_proxy'),
+        options.get('i2p_proxy'),
+    )
+    if key not in _maigret_services:
+        _maigret_services[key] = make_maigret_service(options)
+    return _maigret_services[key]
+
+
+async def close_maigret_services():
+    for service in _maigret_services.values():
+        await service.close()
+    _maigret_services.clear()
+
+
+def close_search_loop():
+    global _search_loop
+    with _search_loop_lock:
+        if _search_loop is None:
+            return
+        loop, _search_loop = _search_loop, None
+    asyncio.run_coroutine_threadsafe(close_maigret_services(), loop).result(timeout=10)
+    loop.call_soon_threadsafe(loop.stop)
+
 
-        results = await maigret.search(
-            username=username,
-            site_dict=sites,
+def get_search_sites(options, service):
+    logger = service.logger
+    top_sites = int(options.get('top_sites') or 500) 
+    if options.get('all_sites'):
+        top_sites = 999999999  # effectively all
+    
+    tags = options.get('tags', [])
+    site_list= options.get('site_list', [])
+    logger.info(f"Filtering sites by tags: {tags}")
+    
+    sites = service.get_sites(
+        top_sites=top_sites,
+        tags=tags,
+        site_list=site_list,
+        use_disabled_sites=False,
+        id_type='username'
+    )
+    
+    logger.info(f"Found {len(sites)} sites matching the tag criteria")
+    return sites
+
+
+async def search_multiple_usernames(usernames, options):
+    usernames = list(dict.fromkeys(u.strip() for u in usernames))
+    results = {username: {} for username in usernames}
+    # all the usernames are checked at once by one scheduler and connection pool
+    service = get_maigret_service(options)
+    try:
+        async for username, site_name, result in service.search_batch(
+            usernames,
+            site_dict=get_search_sites(options, service),
             timeout=int(options.get('timeout', 30)),
-            logger=logger,
             id_type='username',
-            cookies=COOKIES_FILE if options.get('use_cookies') else None,
             is_parsing_enabled=(not options.get('disable_extracting', False)),  
             recursive_search_enabled=(not options.get('disable_recursive_search', False)),
-            check_domains=options.get('with_domains', False),
-            proxy=options.get('proxy', None),
-            tor_proxy=options.get('tor_proxy', None),
-            i2p_proxy=options.get('i2p_proxy', None),
-        )
-        return results
+        ):
+            results[username][site_name] = result
     except Exception as e:
-        logger.error(f"Error during search: {str(e)}")
-        raise
-
-
-async def search_multiple_usernames(usernames, options):
-    results = []
-    for username in usernames:
-        try:
-            search_results = await maigret_search(username.strip(), options)
-            results.append((username.strip(), 'username', search_results))
-        except Exception as e:
-            logging.error(f"Error searching username {username}: {str(e)}")
-    return results
+        logging.error(f"Error searching usernames {usernames}: {str(e)}")
+    return [(username, 'username', results[username]) for username in usernames]
 
 
 def process_search_task(usernames, options, timestamp):
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        general_results = loop.run_until_complete(
-            search_multiple_usernames(usernames, options)
-        )
+        general_results = asyncio.run_coroutine_threadsafe(
+            search_multiple_usernames(usernames, options), get_search_loop()
+        ).result()
 
         session_folder = os.path.join(REPORTS_FOLDER, f"search_{timestamp}")
         os.makedirs(session_folder, exist_ok=True)
@@ -111,7 +169,7 @@ def process_search_task(usernames, options, timestamp):
         maigret.report.save_graph_report(
             graph_path,
             general_results,
-            MaigretDatabase().load_from_path(MAIGRET_DB_FILE),
+            get_maigret_db(),
         )
 
         individual_reports = []
@@ -1,14 +1,24 @@
 """Maigret activation test functions"""
 
+import base64
 import json
+import time
 import yarl
 
 import aiohttp
 import pytest
 from mock import Mock
+from werkzeug import Response
 
 from tests.conftest import LOCAL_SERVER_PORT
-from maigret.activation import ParsingActivator, import_aiohttp_cookies
+from maigret.activation import (
+    ParsingActivator,
+    SiteActivator,
+    get_jwt_expiration,
+    import_aiohttp_cookies,
+)
+from maigret.checking import maigret_batch
+from maigret.sites import MaigretSite
 
 COOKIES_TXT = """# HTTP Cookie File downloaded with cookies.txt by Genuinous @genuinous
 # This file can be used by wget, curl, aria2c and other standard compliant tools.
@@ -37,6 +47,112 @@ def test_vimeo_activation(default_db):
     assert token1 != token2
 
 
+def make_activated_site():
+    return MaigretSite(
+        'Activated',
+        {
+            'url': 'http://localhost:8989/url?id={username}',
+            'urlMain': 'http://localhost:8989/',
+            'checkType': 'message',
+            'presenseStrs': ['profile'],
+            'absenseStrs': ['not found'],
+            'headers': {'x-guest-token': 'expired'},
+            'activation': {
+                'method': 'twitter',
+                'marks': ['Bad guest token.'],
+                'url': 'http://localhost:8989/activate',
+                'src': 'guest_token',
+                'dst': 'x-guest-token',
+            },
+        },
+    )
+
+
+def test_get_jwt_expiration():
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': 1734117540}).encode())
+    token = f'header.{payload.decode().rstrip("=")}.signature'
+
+    assert get_jwt_expiration(token) == 1734117540
+    assert get_jwt_expiration('not a jwt') is None
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_activation_is_made_once(httpserver):
+    site = make_activated_site()
+    activations = []
+
+    def activation_handler(request):
+        activations.append(request)
+        return Response(json.dumps({'guest_token': 'fresh'}))
+
+    def page_handler(request):
+        if request.headers.get('x-guest-token') != 'fresh':
+            return Response('Bad guest token.', status=403)
+        if request.args['id'] == 'claimed':
+            return Response('user profile')
+        return Response('not found', status=404)
+
+    httpserver.expect_request('/activate').respond_with_handler(activation_handler)
+    httpserver.expect_request('/url').respond_with_handler(page_handler)
+
+    activator = SiteActivator()
+    usernames = ['claimed', 'user1', 'user2', 'user3']
+    results = {}
+    async for username, _, result in maigret_batch(
+        usernames, {site.name: site}, Mock(), activator=activator
+    ):
+        results[username] = result['status']
+
+    # checks made with the expired token are repeated with a new one
+    assert len(activations) == 1
+    assert results['claimed'].is_found() is True
+    assert results['user1'].is_found() is False
+    assert results['user1'].error is None
+
+    # the token is reused by the next search
+    async for username, _, result in maigret_batch(
+        ['claimed'], {site.name: site}, Mock(), activator=activator
+    ):
+        assert result['status'].is_found() is True
+    assert len(activations) == 1
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_activation_renews_expired_token(httpserver):
+    site = make_activated_site()
+    tokens = iter(['first', 'second'])
+    httpserver.expect_request('/activate').respond_with_handler(
+        lambda request: Response(json.dumps({'guest_token': next(tokens)}))
+    )
+
+    activator = SiteActivator()
+    assert await activator.activate(site, Mock()) is True
+    assert activator.get_headers(site) == {'x-guest-token': 'first'}
+
+    # a token got after a request is reused
+    assert await activator.activate(site, Mock(), since=time.time() - 10) is True
+    assert activator.get_headers(site) == {'x-guest-token': 'first'}
+
+    activator.tokens[site.name].expires = time.time()
+    assert activator.get_headers(site) == {}
+    await activator.wait(site, Mock())
+    assert activator.get_headers(site) == {'x-guest-token': 'second'}
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_failed_activation_is_not_repeated(httpserver):
+    site = make_activated_site()
+    httpserver.expect_request('/activate').respond_with_data('error', status=500)
+
+    activator = SiteActivator()
+    assert await activator.activate(site, Mock()) is False
+    assert await activator.activate(site, Mock(), since=time.time() - 10) is False
+    assert len(httpserver.log) == 1
+
+
 @pytest.mark.slow
 @pytest.mark.asyncio
 async def test_import_aiohttp_cookies(cookie_test_server):
@@ -0,0 +1,180 @@
+"""Maigret results cache test functions"""
+
+import time
+
+import pytest
+
+from maigret.cache import (
+    CacheBackend,
+    MemoryCacheBackend,
+    ResultCache,
+    SQLiteCacheBackend,
+    get_site_hash,
+)
+from maigret.errors import CheckError
+from maigret.result import MaigretCheckResult, MaigretCheckStatus
+from maigret.sites import MaigretSite
+
+
+def make_site():
+    return MaigretSite(
+        'Example',
+        {
+            'url': 'https://example.com/{username}',
+            'urlMain': 'https://example.com/',
+            'checkType': 'status_code',
+            'usernameClaimed': 'claimed',
+            'usernameUnclaimed': 'noonewouldeverusethis7',
+        },
+    )
+
+
+def make_result(site, username, status, error=None, parsing_enabled=False):
+    return {
+        'site': site,
+        'username': username,
+        'parsing_enabled': parsing_enabled,
+        'url_user': f'https://example.com/{username}',
+        'http_status': 200,
+        'status': MaigretCheckResult(
+            username,
+            site.name,
+            f'https://example.com/{username}',
+            status,
+            query_time=0.5,
+            error=error,
+        ),
+    }
+
+
+def test_backend_must_implement_storage():
+    class IncompleteBackend(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_memory_backend_lru():
+    backend = MemoryCacheBackend(max_size=2)
+    backend.set('a', '1', 100)
+    backend.set('b', '2', 100)
+    assert backend.get('a') == (100, '1')
+
+    backend.set('c', '3', 100)
+    assert backend.get('b') is None
+    assert backend.get('a') is not None
+    assert len(backend) == 2
+
+
+def test_sqlite_backend_persistence(tmp_path):
+    filename = str(tmp_path / 'cache.sqlite')
+    backend = SQLiteCacheBackend(filename)
+    backend.set('a', '1', 2e9)
+    backend.set('expired', '2', 1)
+    backend.close()
+
+    backend = SQLiteCacheBackend(filename)
+    assert backend.get('a') == (2e9, '1')
+    # purged on opening
+    assert backend.get('expired') is None
+    backend.close()
+
+
+def test_result_cache_roundtrip(tmp_path):
+    site = make_site()
+    cache = ResultCache.from_path(str(tmp_path / 'cache.sqlite'))
+    cache.set(
+        site,
+        'claimed',
+        'username',
+        make_result(site, 'claimed', MaigretCheckStatus.CLAIMED),
+    )
+
+    result = cache.get(site, ' claimed ', 'username')
+    assert result['is_cached']
+    assert result['status'].is_found()
+    assert result['status'].query_time == 0.5
+    assert result['url_user'] == 'https://example.com/claimed'
+    assert result['site'] is site
+
+    assert cache.get(site, 'claimed', 'gaia_id') is None
+    assert cache.get(site, 'Claimed', 'username') is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+    # from disk into a fresh memory layer
+    cache = ResultCache.from_path(str(tmp_path / 'cache.sqlite'))
+    assert cache.get(site, 'claimed', 'username') is not None
+    assert len(cache.backends[0]) == 1
+    cache.close()
+
+
+def test_result_cache_ttls(monkeypatch):
+    site = make_site()
+    cache = ResultCache(claimed_ttl=100, available_ttl=10, error_ttl=0)
+    cache.set(
+        site,
+        'claimed',
+        'username',
+        make_result(site, 'claimed', MaigretCheckStatus.CLAIMED),
+    )
+    cache.set(
+        site,
+        'free',
+        'username',
+        make_result(site, 'free', MaigretCheckStatus.AVAILABLE),
+    )
+    error_result = make_result(
+        site, 'error', MaigretCheckStatus.UNKNOWN, error=CheckError('Request timeout')
+    )
+    cache.set(site, 'error', 'username', error_result)
+
+    assert cache.get(site, 'free', 'username') is not None
+    assert cache.get(site, 'error', 'username') is None
+
+    now = time.time()
+    monkeypatch.setattr('maigret.cache.time.time', lambda: now + 50)
+    assert cache.get(site, 'claimed', 'username') is not None
+    assert cache.get(site, 'free', 'username') is None
+
+
+def test_result_cache_errors_and_parsing():
+    site = make_site()
+    cache = ResultCache()
+    error_result = make_result(
+        site, 'error', MaigretCheckStatus.UNKNOWN, error=CheckError('Server', '503')
+    )
+    cache.set(site, 'error', 'username', error_result)
+    error = cache.get(site, 'error', 'username')['status'].error
+    assert (error.type, error.desc) == ('Server', '503')
+
+    cache.set(
+        site,
+        'claimed',
+        'username',
+        make_result(site, 'claimed', MaigretCheckStatus.CLAIMED),
+    )
+    # ids weren't extracted from the found account page
+    assert cache.get(site, 'claimed', 'username', is_parsing_enabled=True) is None
+
+
+def test_result_cache_site_changed():
+    site = make_site()
+    cache = ResultCache()
+    cache.set(
+        site,
+        'claimed',
+        'username',
+        make_result(site, 'claimed', MaigretCheckStatus.CLAIMED),
+    )
+
+    site_hash = get_site_hash(site)
+    site.alexa_rank = 10
+    assert get_site_hash(site) == site_hash
+    assert cache.get(site, 'claimed', 'username') is not None
+
+    site.check_type = 'message'
+    assert get_site_hash(site) != site_hash
+    assert cache.get(site, 'claimed', 'username') is None
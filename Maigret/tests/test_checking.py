@@ -1,7 +1,26 @@
-from mock import Mock
+import time
+
+import aiohttp
+from mock import AsyncMock, MagicMock, Mock
 import pytest
+from werkzeug import Response
 
 from maigret import search
+from maigret.cache import ResultCache
+from maigret.extraction import IdsExtractor
+from maigret.frontier import SearchFrontier
+from maigret.history import SelfCheckHistory
+from maigret.checking import (
+    SimpleAiohttpChecker,
+    maigret_batch,
+    make_site_result,
+    read_response_text,
+    self_check,
+)
+from maigret.errors import CheckError
+from maigret.result import MaigretCheckStatus
+from maigret.sites import MaigretSite
+from maigret.stats import SitesStatsStore
 
 
 def site_result_except(server, username, **kwargs):
@@ -24,6 +43,19 @@ async def test_checking_by_status_code(httpserver, local_test_db):
     assert result['StatusCode']['status'].is_found() is False
 
 
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_drops_request_objects(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+
+    site_result_except(httpserver, 'claimed', status=200)
+
+    result = await search('claimed', site_dict=sites_dict, logger=Mock())
+    assert result['StatusCode']['status'].is_found() is True
+    for field in ('future', 'request', 'checker', 'cookies'):
+        assert field not in result['StatusCode']
+
+
 @pytest.mark.slow
 @pytest.mark.asyncio
 async def test_checking_by_message_positive_full(httpserver, local_test_db):
@@ -67,3 +99,476 @@ async def test_checking_by_message_negative(httpserver, local_test_db):
 
     result = await search('unclaimed', site_dict=sites_dict, logger=Mock())
     assert result['Message']['status'].is_found() is True
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_records_timing(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    stats_store = SitesStatsStore()
+
+    site_result_except(httpserver, 'claimed', status=200)
+
+    result = await search(
+        'claimed', site_dict=sites_dict, logger=Mock(), stats_store=stats_store
+    )
+    timing = result['StatusCode']['timing']
+    assert result['StatusCode']['status'].query_time == timing.total
+    assert 0 < timing.ttfb <= timing.total
+    assert timing.dns + timing.connect <= timing.ttfb
+
+    stats = stats_store.get('StatusCode')
+    assert stats.checks == 1
+    assert stats.percentile(95) == timing.total
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checker_reuses_pooled_session(httpserver):
+    httpserver.expect_request('/url').respond_with_data("user profile")
+    checker = SimpleAiohttpChecker(logger=Mock(), connections_per_host_limit=2)
+
+    checker.prepare(url=httpserver.url_for('/url'))
+    assert (await checker.check())[:2] == ("user profile", 200)
+    session = checker.session
+
+    checker.prepare(url=httpserver.url_for('/url'))
+    assert (await checker.check())[:2] == ("user profile", 200)
+    assert checker.session is session
+    assert session.connector.limit_per_host == 2
+
+    await checker.close()
+    assert session.closed
+    assert checker.session is None
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checker_doesnt_keep_cookies_of_sites(httpserver):
+    httpserver.expect_request('/url', query_string='id=user1').respond_with_response(
+        Response("user profile", headers={'Set-Cookie': 'sess=user1-secret'})
+    )
+    httpserver.expect_request('/url', query_string='id=user2').respond_with_handler(
+        lambda request: Response(request.headers.get('Cookie') or 'no cookies')
+    )
+    checker = SimpleAiohttpChecker(logger=Mock())
+
+    checker.prepare(url=httpserver.url_for('/url') + '?id=user1')
+    await checker.check()
+    checker.prepare(url=httpserver.url_for('/url') + '?id=user2')
+    assert (await checker.check())[0] == 'no cookies'
+
+    await checker.close()
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_unresolved_host_fails_fast():
+    site = MaigretSite(
+        'Unresolved',
+        {
+            'url': 'http://maigret-test.invalid/{username}',
+            'urlMain': 'http://maigret-test.invalid/',
+            'checkType': 'status_code',
+        },
+    )
+
+    result = await search('claimed', site_dict={'Unresolved': site}, logger=Mock())
+    status = result['Unresolved']['status']
+    assert status.is_found() is False
+    assert status.error.type == 'DNS resolve error'
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_read_response_text_stops_on_marker(httpserver):
+    body = 'a' * 95 + 'not found' + 'b' * 10000
+    httpserver.expect_request('/url').respond_with_data(body)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(httpserver.url_for('/url')) as response:
+            # the marker is split between chunks
+            text, marker = await read_response_text(
+                response, ['not found'], chunk_size=100
+            )
+
+    assert marker == 'not found'
+    assert 'not found' in text
+    assert body.startswith(text)
+    assert len(text) < len(body)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(httpserver.url_for('/url')) as response:
+            text, marker = await read_response_text(
+                response, [], max_body_size=1000, chunk_size=100
+            )
+
+    assert marker is None
+    assert body.startswith(text)
+    assert 1000 <= len(text) < len(body)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(httpserver.url_for('/url')) as response:
+            text, marker = await read_response_text(
+                response, ['absent'], chunk_size=100
+            )
+
+    assert (text, marker) == (body, None)
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checker_returns_error_of_stop_marker(httpserver):
+    body = 'captcha' + 'a' * 100000
+    httpserver.expect_request('/url').respond_with_data(body)
+    checker = SimpleAiohttpChecker(logger=Mock())
+    error = CheckError('Captcha')
+
+    checker.prepare(url=httpserver.url_for('/url'), stop_markers={'captcha': error})
+    text, status_code, check_error = await checker.check()
+
+    assert check_error is error
+    assert body.startswith(text) and len(text) < len(body)
+    await checker.close()
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_prewarms_dns_with_short_timeout(
+    httpserver, local_test_db, monkeypatch
+):
+    site_result_except(httpserver, 'claimed', response_data='user profile')
+    resolve_hosts = AsyncMock(return_value=set())
+    monkeypatch.setattr(SimpleAiohttpChecker, 'resolve_hosts', resolve_hosts)
+
+    async for _ in maigret_batch(
+        ['claimed'], local_test_db.sites_dict, Mock(), timeout=30
+    ):
+        pass
+
+    # a slow lookup doesn't delay all the checks by the request timeout
+    assert resolve_hosts.call_args.kwargs['timeout'] == 5.0
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_reads_error_markers_after_others(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    # markers of absence and presence go before an error one in the page
+    body = 'user profile not found' + 'a' * 100000 + '<title>Доступ ограничен</title>'
+    site_result_except(httpserver, 'claimed', response_data=body)
+
+    result = await search(
+        'claimed', site_dict={'Message': sites_dict['Message']}, logger=Mock()
+    )
+
+    status = result['Message']['status']
+    assert status.status == MaigretCheckStatus.UNKNOWN
+    assert status.error.type == 'Censorship'
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_returns_partial_results_by_deadline(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+
+    def slow_handler(request):
+        time.sleep(1)
+        return Response("user profile")
+
+    httpserver.expect_request('/url').respond_with_handler(slow_handler)
+
+    result = await search(
+        'claimed',
+        site_dict=sites_dict,
+        logger=Mock(),
+        timeout=5,
+        deadline=time.time() + 0.3,
+    )
+
+    for site_result in result.values():
+        assert site_result['is_unfinished']
+        assert site_result['status'].error.type == 'Deadline exceeded'
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_retries_temporary_error_inline(httpserver, local_test_db):
+    site = local_test_db.sites_dict['StatusCode']
+    requests = []
+
+    def flaky_handler(request):
+        requests.append(request)
+        if len(requests) == 1:
+            return Response("busy", status=503, headers={'Retry-After': '0'})
+        return Response("user profile")
+
+    httpserver.expect_request('/url').respond_with_handler(flaky_handler)
+
+    result = await search(
+        'claimed', site_dict={site.name: site}, logger=Mock(), retries=1
+    )
+
+    assert len(requests) == 2
+    assert result['StatusCode']['status'].is_found() is True
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_doesnt_retry_long_retry_after(httpserver, local_test_db):
+    site = local_test_db.sites_dict['StatusCode']
+    requests = []
+
+    def limited_handler(request):
+        requests.append(request)
+        return Response("slow down", status=429, headers={'Retry-After': '3600'})
+
+    httpserver.expect_request('/url').respond_with_handler(limited_handler)
+
+    result = await search(
+        'claimed', site_dict={site.name: site}, logger=Mock(), retries=2
+    )
+
+    assert len(requests) == 1
+    assert result['StatusCode']['status'].error.type == 'Too many requests'
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_reuses_cached_results(httpserver, local_test_db):
+    site = local_test_db.sites_dict['StatusCode']
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return Response("user profile")
+
+    httpserver.expect_request('/url').respond_with_handler(handler)
+    cache = ResultCache()
+
+    for _ in range(2):
+        result = await search(
+            'claimed', site_dict={site.name: site}, logger=Mock(), result_cache=cache
+        )
+        assert result['StatusCode']['status'].is_found() is True
+
+    assert len(requests) == 1
+    assert result['StatusCode']['is_cached']
+
+    result = await search(
+        'claimed',
+        site_dict={site.name: site},
+        logger=Mock(),
+        result_cache=cache,
+        bypass_cache=True,
+    )
+    assert len(requests) == 2
+    assert 'is_cached' not in result['StatusCode']
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_batch_of_usernames(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    usernames = [f'user{i}' for i in range(5)]
+
+    site_result_except(httpserver, 'user0', response_data="user profile")
+    for username in usernames[1:]:
+        site_result_except(httpserver, username, response_data="404", status=404)
+
+    results = {}
+    async for username, sitename, result in maigret_batch(
+        usernames, sites_dict, Mock()
+    ):
+        assert result['status'].username == username
+        results[(username, sitename)] = result
+
+    assert len(results) == len(usernames) * len(sites_dict)
+    assert results[('user0', 'StatusCode')]['status'].is_found() is True
+    assert results[('user0', 'Message')]['status'].is_found() is True
+    assert results[('user1', 'StatusCode')]['status'].is_found() is False
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_extracts_ids_in_workers(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    page = 'user profile Site.journal = {"username":"alex","id":1};'
+    site_result_except(httpserver, 'claimed', response_data=page)
+
+    extractor = IdsExtractor(workers=2, use_processes=False)
+    results = {}
+    try:
+        async for _, sitename, result in maigret_batch(
+            ['claimed'],
+            sites_dict,
+            Mock(),
+            is_parsing_enabled=True,
+            extractor=extractor,
+        ):
+            results[sitename] = result
+    finally:
+        extractor.close()
+
+    assert results['Message']['status'].ids_data == {'uid': '1', 'username': 'alex'}
+    assert results['Message']['ids_usernames'] == {'alex': 'username'}
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_skips_extraction_without_data(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    site_result_except(httpserver, 'claimed', response_data="user profile")
+
+    stats_store = SitesStatsStore()
+    extractor = Mock()
+    extractor.extract = AsyncMock(return_value={})
+    for _ in range(4):
+        await search(
+            'claimed',
+            site_dict=sites_dict,
+            logger=Mock(),
+            is_parsing_enabled=True,
+            stats_store=stats_store,
+            extractor=extractor,
+        )
+
+    # parsed 3 times on each site only
+    assert extractor.extract.call_count == 6
+    assert stats_store.get('Message').extractions == 3
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_recursive_search_in_one_run(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    site_result_except(
+        httpserver,
+        'claimed',
+        response_data='user profile Site.journal = {"username":"alex","id":1};',
+    )
+    site_result_except(
+        httpserver,
+        'alex',
+        response_data='user profile Site.journal = {"username":"bob","id":2};',
+    )
+    site_result_except(httpserver, 'bob', response_data='404', status=404)
+
+    frontier = SearchFrontier(max_depth=1)
+    checked = []
+    async for username, sitename, result in maigret_batch(
+        ['claimed'],
+        sites_dict,
+        Mock(),
+        is_parsing_enabled=True,
+        frontier=frontier,
+    ):
+        checked.append((username, sitename))
+        depth = frontier.get_depth(username)
+        for new_username, id_type in result.get('ids_usernames', {}).items():
+            frontier.add(new_username, id_type, depth + 1)
+
+    assert sorted(checked) == [
+        ('alex', 'Message'),
+        ('alex', 'StatusCode'),
+        ('claimed', 'Message'),
+        ('claimed', 'StatusCode'),
+    ]
+    # bob is too deep
+    assert 'bob' not in frontier
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_checking_progress_total_of_not_recursive_search(
+    httpserver, local_test_db, monkeypatch
+):
+    site_result_except(httpserver, 'claimed', response_data='user profile')
+    alive_bar = MagicMock()
+    monkeypatch.setattr('maigret.checking.alive_bar', alive_bar)
+
+    async for _ in maigret_batch(
+        ['claimed'],
+        local_test_db.sites_dict,
+        Mock(),
+        frontier=SearchFrontier(max_depth=0),
+    ):
+        pass
+
+    # count of checks is known without extraction of ids
+    assert alive_bar.call_args.args == (2,)
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_self_check_applies_changes(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    sites_dict['Message'].disabled = True
+
+    site_result_except(httpserver, 'claimed', response_data="user profile")
+    # wrong status code, but the right message
+    site_result_except(httpserver, 'unclaimed', response_data="not found")
+
+    history = SelfCheckHistory()
+    is_changed = await self_check(
+        local_test_db, sites_dict, Mock(), silent=True, history=history
+    )
+
+    assert is_changed is True
+    assert sites_dict['StatusCode'].disabled is True
+    assert sites_dict['Message'].disabled is False
+    assert local_test_db.is_dirty
+    assert history.get('StatusCode').failures == 1
+    assert history.get('Message').is_working is True
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_self_check_history_of_changed_sites(httpserver, local_test_db):
+    sites_dict = local_test_db.sites_dict
+    sites_dict['Message'].disabled = True
+    sites_dict['Message'].tags.append('unchecked')
+
+    site_result_except(httpserver, 'claimed', response_data="user profile")
+    site_result_except(httpserver, 'unclaimed', response_data="not found")
+
+    history = SelfCheckHistory()
+    await self_check(local_test_db, sites_dict, Mock(), silent=True, history=history)
+    # sites changed by the self-check are not due again as changed ones
+    assert history.get_sites_to_check(sites_dict, budget=10) == {}
+    site_hash = history.get('Message').site_hash
+
+    is_changed = await self_check(
+        local_test_db, sites_dict, Mock(), silent=True, history=history
+    )
+
+    assert is_changed is False
+    assert history.get('Message').site_hash == site_hash
+    assert history.get('StatusCode').failures == 2
+    assert history.get_sites_to_check(sites_dict, budget=10) == {}
+
+
+def test_make_site_result_uses_mirror_on_retry():
+    site = MaigretSite(
+        'Site',
+        {
+            'url': '{urlMain}/{username}',
+            'urlMain': 'https://example.com',
+            'mirrors': ['https://mirror.example.com'],
+            'checkType': 'status_code',
+        },
+    )
+    options = {
+        'parsing': False,
+        'timeout': 3,
+        'checkers': {site.protocol: Mock()},
+        'forced': False,
+        'id_type': 'username',
+    }
+
+    result = make_site_result(site, 'user', options, Mock(), retry=True)
+
+    assert result['request']['url'] == 'https://mirror.example.com/user'
+    # the shared site is not changed
+    assert site.url_main == 'https://example.com'
+    assert site.check_plan.make_url('user') == 'https://example.com/user'
@@ -4,21 +4,30 @@ from argparse import Namespace
 from typing import Dict, Any
 
 DEFAULT_ARGS: Dict[str, Any] = {
+    'adaptive_timeout': False,
     'all_sites': False,
+    'bypass_cache': False,
+    'cache_file': '~/.maigret/results_cache.sqlite',
     'connections': 100,
+    'connections_per_host': 4,
     'cookie_file': None,
     'csv': False,
     'db_file': 'resources/data.json',
+    'deadline': None,
     'debug': False,
     'disable_extracting': False,
     'disable_recursive_search': False,
+    'extract_workers': 0,
     'folderoutput': 'reports',
+    'hedge_requests': False,
     'html': False,
     'graph': False,
     'id_type': 'username',
     'ignore_ids_list': [],
     'info': False,
     'json': '',
+    'max_body_size': 2097152,
+    'min_timeout': 1.0,
     'new_site_to_submit': False,
     'no_color': False,
     'no_progressbar': False,
@@ -28,17 +37,23 @@ DEFAULT_ARGS: Dict[str, Any] = {
     'print_check_errors': False,
     'print_not_found': False,
     'proxy': None,
+    'recursion_depth': None,
     'reports_sorting': 'default',
     'retries': 0,
     'self_check': False,
+    'self_check_budget': 0,
+    'self_check_history': '~/.maigret/self_check_history.json',
     'site_list': [],
     'stats': False,
+    'stats_file': '~/.maigret/sites_stats.json',
     'tags': '',
     'timeout': 30,
+    'timeout_factor': 2.0,
     'tor_proxy': 'socks5://127.0.0.1:9050',
     'i2p_proxy': 'http://127.0.0.1:4444',
     'top_sites': 500,
     'txt': False,
+    'use_cache': False,
     'use_disabled_sites': False,
     'username': [],
     'verbose': False,
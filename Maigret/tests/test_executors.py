@@ -3,12 +3,14 @@
 import pytest
 import asyncio
 import logging
+import time
 from maigret.executors import (
     AsyncioSimpleExecutor,
     AsyncioProgressbarExecutor,
     AsyncioProgressbarSemaphoreExecutor,
     AsyncioProgressbarQueueExecutor,
     AsyncioQueueGeneratorExecutor,
+    AsyncioHostAwareExecutor,
 )
 
 logger = logging.getLogger(__name__)
@@ -109,3 +111,85 @@ async def test_asyncio_queue_generator_executor():
     assert results == [0, 3, 6, 9, 1, 4, 7, 2, 5, 8]
     assert executor.execution_time > 0.2
     assert executor.execution_time < 0.3
+
+
+@pytest.mark.asyncio
+async def test_asyncio_host_aware_executor():
+    active = {}
+    max_active = {}
+
+    async def host_func(n, host=None):
+        active[host] = active.get(host, 0) + 1
+        max_active[host] = max(max_active.get(host, 0), active[host])
+        await asyncio.sleep(0.1)
+        active[host] -= 1
+        return n
+
+    tasks = [(host_func, [n], {'host': 'a.com' if n < 6 else 'b.com'}) for n in range(10)]
+    tasks += [(host_func, [n], {}) for n in range(10, 14)]
+
+    executor = AsyncioHostAwareExecutor(
+        logger=logger, in_parallel=8, in_parallel_per_host=2
+    )
+    results = [result async for result in executor.run(tasks)]
+
+    assert sorted(results) == list(range(14))
+    assert max_active == {'a.com': 2, 'b.com': 2, None: 4}
+    # a.com takes 3 rounds of 2 queries
+    assert executor.execution_time > 0.3
+    assert executor.execution_time < 0.4
+
+
+@pytest.mark.asyncio
+async def test_asyncio_host_aware_executor_timeout():
+    async def slow_func(n, default=None, host=None):
+        await asyncio.sleep(n)
+        return n
+
+    tasks = [
+        (slow_func, [0], {'default': 'timeout', 'host': 'a.com'}),
+        (slow_func, [1], {'default': 'timeout', 'host': 'a.com'}),
+    ]
+    executor = AsyncioHostAwareExecutor(logger=logger, timeout=0.2)
+    results = [result async for result in executor.run(tasks)]
+
+    assert results == [0, 'timeout']
+
+
+@pytest.mark.asyncio
+async def test_asyncio_host_aware_executor_deadline():
+    async def slow_func(n, host=None):
+        await asyncio.sleep(0.1)
+        return n
+
+    tasks = [(slow_func, [n], {'host': f'host{n}'}) for n in range(10)]
+    executor = AsyncioHostAwareExecutor(
+        logger=logger, in_parallel=2, deadline=time.time() + 0.25
+    )
+    results = [r async for r in executor.run(tasks)]
+
+    assert executor.is_deadline_exceeded
+    assert 0 < len(results) < 10
+    assert executor.execution_time < 0.5
+
+
+@pytest.mark.asyncio
+async def test_asyncio_host_aware_executor_priorities():
+    started = []
+
+    async def func(n, host=None, priority=0):
+        started.append(n)
+        await asyncio.sleep(0.01)
+        return n
+
+    tasks = [(func, [n], {'host': f'host{n}', 'priority': n % 2}) for n in range(6)]
+    executor = AsyncioHostAwareExecutor(logger=logger, in_parallel=1)
+    results = []
+    async for result in executor.run(tasks):
+        results.append(result)
+        # queries added while running are scheduled by their priority
+        if result == 0:
+            executor.add((func, [10], {'host': 'host0', 'priority': 0}))
+
+    assert started == [0, 2, 4, 10, 1, 3, 5]
+    assert sorted(results) == sorted(started)
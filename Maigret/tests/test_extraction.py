@@ -0,0 +1,31 @@
+"""Maigret ids extraction test functions"""
+
+import pytest
+from mock import Mock
+
+from maigret.extraction import IdsExtractor
+from maigret.sites import MaigretSite
+
+PAGE = 'Site.journal = {"username":"alex","id":1};'
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+@pytest.mark.parametrize('workers,use_processes', [(0, False), (2, False), (1, True)])
+async def test_ids_extractor(workers, use_processes):
+    site = MaigretSite('site', {'url': 'https://site.com/{username}'})
+    logger = Mock()
+    extractor = IdsExtractor(workers=workers, use_processes=use_processes)
+    try:
+        assert await extractor.extract(PAGE, logger, site) == {
+            'uid': '1',
+            'username': 'alex',
+        }
+        assert await extractor.extract('', logger, site) == {}
+        # errors of parsing are not raised
+        assert await extractor.extract(None, logger, site) == {}
+        assert logger.warning.called
+    finally:
+        extractor.close()
+
+    assert extractor._pool is None
@@ -0,0 +1,36 @@
+"""Maigret recursive search frontier test functions"""
+
+from maigret.frontier import SearchFrontier
+
+
+def test_frontier_dedupes_normalized_ids():
+    frontier = SearchFrontier()
+    assert frontier.add('Alex', 'username')
+    assert not frontier.add(' alex ', 'username')
+    assert not frontier.add('ALEX', 'username', depth=1)
+    assert not frontier.add('', 'username')
+
+    assert frontier.pop_new() == [('Alex', 'username', 0)]
+    assert frontier.pop_new() == []
+    assert 'alex' in frontier
+    assert frontier.get_depth('alex') == 0
+
+
+def test_frontier_depth_limit():
+    frontier = SearchFrontier(max_depth=1)
+    assert frontier.add('alex', 'username')
+    assert frontier.add('123', 'vk_id', depth=1)
+    assert not frontier.add('bob', 'username', depth=2)
+
+    assert 'bob' not in frontier
+    assert frontier.pop_new() == [('alex', 'username', 0), ('123', 'vk_id', 1)]
+
+
+def test_frontier_ignored_ids():
+    frontier = SearchFrontier()
+    frontier.ignore('alex')
+
+    assert 'alex' in frontier
+    assert not frontier.add('alex', 'username')
+    assert frontier.get_depth('alex') is None
+    assert frontier.pop_new() == []
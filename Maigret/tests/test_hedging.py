@@ -0,0 +1,118 @@
+"""Maigret hedged requests test functions"""
+
+import asyncio
+
+import pytest
+
+from maigret.errors import CheckError
+from maigret.hedging import HedgingPolicy
+from maigret.sites import MaigretSite
+from maigret.stats import RequestTiming, SitesStatsStore
+
+
+def make_store(site_name, latency):
+    store = SitesStatsStore()
+    for _ in range(10):
+        timing = RequestTiming()
+        timing.total = latency
+        store.update(site_name, timing, is_error=False)
+    return store
+
+
+def make_site():
+    return MaigretSite(
+        'Site',
+        {
+            'url': '{urlMain}/{username}',
+            'urlMain': 'https://example.com',
+            'mirrors': ['https://example.com', 'https://mirror.example.com'],
+        },
+    )
+
+
+def make_fake_check(latencies):
+    requested = []
+
+    async def make_check(url, timing):
+        latency, error = latencies[len(requested)]
+        requested.append(url)
+        await asyncio.sleep(latency)
+        return url, 200, error
+
+    return make_check, requested
+
+
+def test_hedging_delay_and_budget():
+    policy = HedgingPolicy(make_store('Site', 0.5), max_hedges=1)
+
+    # not less than twice the median
+    assert policy.get_delay('Site') == 1.0
+    assert policy.get_delay('Unknown') is None
+    assert policy.acquire()
+    assert not policy.acquire()
+    assert policy.get_delay('Site') is None
+
+
+def test_hedging_mirror_url():
+    site = make_site()
+
+    url = HedgingPolicy.get_url(site, 'https://example.com/user')
+    assert url == 'https://mirror.example.com/user'
+    assert HedgingPolicy.get_url(site, 'https://api.com/user') == 'https://api.com/user'
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins():
+    policy = HedgingPolicy(make_store('Site', 0.05), max_hedges=1)
+    make_check, requested = make_fake_check([(1, None), (0, None)])
+
+    response, timing = await policy.check(
+        make_check, make_site(), 'https://example.com/user', 0.05, RequestTiming(), 5
+    )
+
+    assert response[0] == 'https://mirror.example.com/user'
+    assert len(requested) == 2
+    assert policy.wins == 1
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_error_waits_for_primary():
+    policy = HedgingPolicy(make_store('Site', 0.05), max_hedges=1)
+    make_check, _ = make_fake_check([(0.2, None), (0, CheckError('HTTP'))])
+
+    response, _ = await policy.check(
+        make_check, make_site(), 'https://example.com/user', 0.05, RequestTiming(), 5
+    )
+
+    assert response == ('https://example.com/user', 200, None)
+    assert policy.wins == 0
+
+
+@pytest.mark.asyncio
+async def test_hedged_requests_are_bounded_by_timeout():
+    policy = HedgingPolicy(make_store('Site', 0.05), max_hedges=1)
+    # the first request fails after the hedged one is made
+    make_check, _ = make_fake_check([(0.1, CheckError('HTTP')), (10, None)])
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    response, _ = await policy.check(
+        make_check, make_site(), 'https://example.com/user', 0.05, RequestTiming(), 0.3
+    )
+
+    assert loop.time() - started < 0.5
+    assert response[2].type == 'HTTP'
+    assert policy.wins == 0
+
+
+@pytest.mark.asyncio
+async def test_fast_request_is_not_hedged():
+    policy = HedgingPolicy(make_store('Site', 0.05), max_hedges=1)
+    make_check, requested = make_fake_check([(0, None)])
+
+    await policy.check(
+        make_check, make_site(), 'https://example.com/user', 0.05, RequestTiming(), 5
+    )
+
+    assert len(requested) == 1
+    assert policy.hedges == 0
@@ -0,0 +1,91 @@
+"""Maigret self-check history test functions"""
+
+import pytest
+
+from maigret.history import SelfCheckHistory
+from maigret.sites import MaigretSite
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+def make_site(name, **kwargs):
+    return MaigretSite(name, {'url': f'https://{name}.com/{{username}}', **kwargs})
+
+
+def test_history_outcomes():
+    history = SelfCheckHistory()
+    site = make_site('site')
+
+    history.update(site, is_working=True, now=100)
+    assert history.get('site').last_changed is None
+
+    history.update(site, is_working=False, now=200)
+    history.update(site, is_working=False, now=300)
+    site_history = history.get('site')
+    assert site_history.failures == 2
+    assert site_history.last_changed == 200
+    assert site_history.last_checked == 300
+
+    history.update(site, is_working=True, now=400)
+    assert history.get('site').failures == 0
+    assert history.get('site').last_changed == 400
+
+
+def test_history_sites_to_check():
+    now = 100 * DAY
+    history = SelfCheckHistory()
+    sites = {name: make_site(name) for name in ('new', 'fresh', 'stale', 'failed')}
+    sites['changed'] = make_site('changed')
+
+    history.update(sites['fresh'], is_working=True, now=now - DAY)
+    history.update(sites['stale'], is_working=True, now=now - 8 * DAY)
+    history.update(sites['failed'], is_working=False, now=now - 2 * HOUR)
+    history.update(sites['changed'], is_working=True, now=now - HOUR)
+    sites['changed'].check_type = 'message'
+
+    to_check = history.get_sites_to_check(sites, budget=10, now=now)
+    assert list(to_check) == ['new', 'changed', 'failed', 'stale']
+
+    assert list(history.get_sites_to_check(sites, budget=2, now=now)) == [
+        'new',
+        'changed',
+    ]
+
+    # failed sites are not re-checked too often
+    history.update(sites['failed'], is_working=False, now=now - HOUR / 2)
+    assert 'failed' not in history.get_sites_to_check(sites, budget=10, now=now)
+
+
+def test_history_flapping_sites():
+    now = 100 * DAY
+    history = SelfCheckHistory()
+    site = make_site('site')
+    history.update(site, is_working=False, now=now - 3 * HOUR)
+    history.update(site, is_working=True, now=now - 2 * HOUR)
+
+    assert list(history.get_sites_to_check({'site': site}, budget=1, now=now)) == [
+        'site'
+    ]
+    # stable again after a few days
+    now += 4 * DAY
+    history.update(site, is_working=True, now=now - 2 * HOUR)
+    assert not history.get_sites_to_check({'site': site}, budget=1, now=now)
+
+
+def test_history_save_and_load(tmp_path):
+    filename = str(tmp_path / 'history' / 'self_check.json')
+    history = SelfCheckHistory(filename)
+    history.update(make_site('site'), is_working=False, now=100)
+    history.save()
+
+    loaded = SelfCheckHistory(filename).load()
+    assert loaded.get('site').json == history.get('site').json
+
+
+def test_history_load_broken(tmp_path):
+    filename = tmp_path / 'self_check.json'
+    filename.write_text('broken')
+
+    with pytest.raises(ValueError):
+        SelfCheckHistory(str(filename)).load()
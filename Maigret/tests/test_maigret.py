@@ -6,7 +6,8 @@ import copy
 import pytest
 from mock import Mock
 
-from maigret.maigret import self_check, maigret
+from maigret.checking import maigret
+from maigret.maigret import self_check
 from maigret.maigret import (
     extract_ids_from_page,
     extract_ids_from_results,
@@ -22,6 +22,7 @@ from maigret.report import (
 )
 from maigret.result import MaigretCheckResult, MaigretCheckStatus
 from maigret.sites import MaigretSite
+from maigret.stats import RequestTiming
 
 
 GOOD_RESULT = MaigretCheckResult('', '', '', MaigretCheckStatus.CLAIMED)
@@ -352,6 +353,18 @@ def test_generate_json_simple_report_broken():
     assert list(json.loads(data[0]).keys()) == []
 
 
+def test_generate_json_report_with_timing():
+    jsonfile = StringIO()
+    timing = RequestTiming()
+    timing.finish()
+    MODIFIED_RESULTS = {'GitHub': dict(EXAMPLE_RESULTS['GitHub'], timing=timing)}
+    generate_json_report('test', MODIFIED_RESULTS, jsonfile, 'simple')
+
+    jsonfile.seek(0)
+    data = json.loads(jsonfile.read())
+    assert data['GitHub']['timing']['total'] == timing.total
+
+
 def test_generate_json_ndjson_report():
     jsonfile = StringIO()
     MODIFIED_RESULTS = dict(EXAMPLE_RESULTS)
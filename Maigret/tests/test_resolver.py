@@ -0,0 +1,53 @@
+"""Maigret DNS resolving test functions"""
+
+import socket
+
+import pytest
+
+from maigret.resolver import CachingResolver, DNSCache, make_resolve_result
+
+
+class FakeResolver:
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.calls = []
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        self.calls.append(host)
+        if host not in self.hosts:
+            raise OSError(None, 'Domain name not found')
+        return [make_resolve_result(host, self.hosts[host], port)]
+
+    async def close(self):
+        pass
+
+
+def test_dns_cache_ttl():
+    cache = DNSCache(ttl=100, negative_ttl=0)
+    cache.set('example.com', [make_resolve_result('example.com', '1.2.3.4')])
+    cache.set_failed('failed.com')
+
+    assert cache.get_address('example.com') == '1.2.3.4'
+    assert 'example.com' in cache
+    # negative entry is expired immediately
+    assert cache.is_failed('failed.com') is False
+    assert cache.get('unknown.com') is None
+
+
+@pytest.mark.asyncio
+async def test_caching_resolver():
+    fake = FakeResolver({'example.com': '1.2.3.4'})
+    resolver = CachingResolver(DNSCache(), fake)
+
+    failed = await resolver.resolve_hosts(['example.com', 'failed.com', 'example.com'])
+    assert failed == {'failed.com'}
+
+    addresses = await resolver.resolve('example.com', 443, socket.AF_UNSPEC)
+    assert addresses[0]['host'] == '1.2.3.4'
+    assert addresses[0]['port'] == 443
+
+    with pytest.raises(OSError):
+        await resolver.resolve('failed.com', 443, socket.AF_UNSPEC)
+
+    # everything is taken from the cache
+    assert sorted(fake.calls) == ['example.com', 'failed.com']
@@ -0,0 +1,46 @@
+"""Maigret retries test functions"""
+
+from email.utils import formatdate
+import time
+
+from maigret.errors import CheckError
+from maigret.retry import RetryPolicy, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+
+    delay = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+    assert 55 < delay <= 60
+    assert parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(retries=5, max_retries=100, base_delay=0.5, max_delay=3)
+
+    for attempt, cap in enumerate([0.5, 1, 2, 3, 3]):
+        for _ in range(20):
+            assert 0 <= policy.get_delay(attempt) <= cap
+
+    assert policy.get_delay(0, retry_after=2) == 2
+    assert policy.get_delay(0, retry_after=10) is None
+
+
+def test_retry_policy_acquire():
+    policy = RetryPolicy(retries=1, max_retries=2)
+    timeout = CheckError('Request timeout')
+
+    assert policy.acquire(0, None) is None
+    assert policy.acquire(0, CheckError('Captcha', 'Cloudflare')) is None
+    # retries of a site
+    assert policy.acquire(1, timeout) is None
+    assert policy.acquire(0, CheckError('Too many requests'), retry_after=60) is None
+    assert policy.used == 0
+
+    assert policy.acquire(0, timeout) is not None
+    assert policy.acquire(0, CheckError('Server', '503 status code')) is not None
+    # retries of the search
+    assert policy.acquire(0, timeout) is None
+    assert policy.used == 2
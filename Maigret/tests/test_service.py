@@ -0,0 +1,78 @@
+"""Maigret search service test functions"""
+
+import json
+
+import pytest
+from mock import Mock
+from werkzeug import Response
+
+from maigret import MaigretService
+from tests.test_activation import make_activated_site
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_service_keeps_checkers_between_searches(httpserver, local_test_db):
+    httpserver.expect_request('/url', query_string='id=claimed').respond_with_data(
+        "user profile"
+    )
+    httpserver.expect_request('/url', query_string='id=unclaimed').respond_with_data(
+        "404 not found", status=404
+    )
+
+    async with MaigretService(db=local_test_db, logger=Mock()) as service:
+        result = await service.search('claimed', site_list=['Message'])
+        assert result['Message']['status'].is_found() is True
+        session = service.checkers[''].session
+
+        result = await service.search('unclaimed', site_list=['Message'])
+        assert result['Message']['status'].is_found() is False
+        assert service.checkers[''].session is session
+        assert not session.closed
+
+    assert session.closed
+    assert service.checkers is None
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_service_keeps_tokens_between_searches(httpserver, local_test_db):
+    site = make_activated_site()
+    activations = []
+
+    def activation_handler(request):
+        activations.append(request)
+        return Response(json.dumps({'guest_token': 'fresh'}))
+
+    def page_handler(request):
+        if request.headers.get('x-guest-token') != 'fresh':
+            return Response('Bad guest token.', status=403)
+        return Response('user profile')
+
+    httpserver.expect_request('/activate').respond_with_handler(activation_handler)
+    httpserver.expect_request('/url').respond_with_handler(page_handler)
+
+    async with MaigretService(db=local_test_db, logger=Mock()) as service:
+        for username in ('user1', 'user2'):
+            result = await service.search(username, site_dict={site.name: site})
+            assert result[site.name]['status'].is_found() is True
+
+    assert len(activations) == 1
+
+
+def test_service_sites_filtering(local_test_db):
+    service = MaigretService(db=local_test_db)
+
+    assert list(service.get_sites(site_list=['StatusCode'])) == ['StatusCode']
+    assert len(service.get_sites(top_sites=1)) == 1
+
+
+def test_service_starts_with_broken_stats(tmp_path, local_test_db):
+    stats_file = tmp_path / 'stats.json'
+    stats_file.write_text('broken')
+    logger = Mock()
+
+    service = MaigretService(db=local_test_db, logger=logger, stats_path=str(stats_file))
+
+    assert service.stats_store.sites == {}
+    logger.warning.assert_called_once()
@@ -1,5 +1,10 @@
 """Maigret Database test functions"""
 
+import json
+import os
+
+import pytest
+
 from maigret.sites import MaigretDatabase, MaigretSite
 
 EXAMPLE_DB = {
@@ -182,6 +187,59 @@ def test_ranked_sites_dict_id_type():
     assert len(db.ranked_sites_dict(id_type='gaia_id')) == 1
 
 
+def test_ranked_sites_dict_after_update():
+    db = MaigretDatabase()
+    db.update_site(MaigretSite('1', {'alexaRank': 1, 'tags': ['forum']}))
+    db.update_site(MaigretSite('2', {'alexaRank': 2}))
+    assert list(db.ranked_sites_dict().keys()) == ['1', '2']
+
+    # changed in place
+    site = db.sites_dict['1']
+    site.alexa_rank = 3
+    site.tags = ['blog']
+    db.update_site(site)
+    assert list(db.ranked_sites_dict().keys()) == ['2', '1']
+    assert list(db.ranked_sites_dict(tags=['forum']).keys()) == []
+    assert list(db.ranked_sites_dict(tags=['blog']).keys()) == ['1']
+
+    # replaced by a new object
+    new_site = MaigretSite('2', {'alexaRank': 5, 'type': 'gaia_id'})
+    db.update_site(new_site)
+    assert len(db.sites) == 2
+    assert db.sites_dict['2'] is new_site
+    assert new_site in db
+    assert list(db.ranked_sites_dict().keys()) == ['1']
+    assert list(db.ranked_sites_dict(id_type='gaia_id').keys()) == ['2']
+
+
+def test_extract_ids_from_url():
+    db = MaigretDatabase()
+    db.update_site(MaigretSite('Path', {'url': 'https://example.com/u/{username}'}))
+    db.update_site(
+        MaigretSite(
+            'Subdomain', {'url': 'https://{username}.example.com', 'type': 'blog'}
+        )
+    )
+    db.update_site(MaigretSite('Other', {'url': 'https://other.com/{username}'}))
+
+    assert [s.name for s in db.get_url_sites('https://example.com/u/alex')] == [
+        'Path'
+    ]
+    assert [s.name for s in db.get_url_sites('https://alex.example.com/')] == [
+        'Subdomain'
+    ]
+    assert db.extract_ids_from_url('https://www.example.com/u/alex') == {
+        'alex': 'username'
+    }
+    assert db.extract_ids_from_url('https://alex.example.com') == {'alex': 'blog'}
+    assert db.extract_ids_from_url('https://example.org/u/alex') == {}
+
+    # index is updated with the site
+    db.update_site(MaigretSite('Other', {'url': 'https://example.org/u/{username}'}))
+    assert db.extract_ids_from_url('https://other.com/alex') == {}
+    assert db.extract_ids_from_url('https://example.org/u/alex') == {'alex': 'username'}
+
+
 def test_get_url_template():
     site = MaigretSite(
         "test",
@@ -220,3 +278,189 @@ def test_has_site_url_or_name(default_db):
     # false
     assert default_db.has_site("https://aeifgoai3h4g8a3u4g5") == False
     assert default_db.has_site("aeifgoai3h4g8a3u4g5") == False
+
+
+def test_site_markers():
+    db = MaigretDatabase()
+    db.load_from_json(EXAMPLE_DB)
+    markers = db.sites_dict['Amperka'].markers
+
+    assert markers.presense_strs == ()
+    assert markers.detect_presense('Powered by XenForo') is None
+    assert markers.is_absence_detected(
+        "The specified member cannot be found. Please enter a member's entire name."
+    )
+
+    error = markers.detect_error('<p>You must be logged-in to do that.</p>')
+    assert error.type == 'Site-specific'
+    assert error.desc == 'Login required'
+    assert markers.detect_error('<html>profile</html>') is None
+
+
+def test_site_markers_deduplicated():
+    site = MaigretSite('test', {'presenseStrs': ['user', 'profile', 'user']})
+
+    assert site.markers.presense_strs == ('user', 'profile')
+    assert site.markers.detect_presense('profile of a user') == 'user'
+
+
+def test_check_plan():
+    site = MaigretSite(
+        'test',
+        {
+            'url': '{urlMain}//user/{username}',
+            'urlMain': 'https://example.com/',
+            'urlProbe': '{urlMain}api?name={username}',
+            'getParams': {'format': 'json'},
+            'regexCheck': '^[a-z]+$',
+            'checkType': 'response_url',
+            'headers': {'Accept': 'application/json'},
+        },
+    )
+    plan = site.check_plan
+
+    assert plan.make_url('alex') == 'https://example.com/user/alex'
+    assert plan.make_url('a b') == 'https://example.com/user/a%20b'
+    assert (
+        plan.make_probe_url('alex', plan.make_url('alex'))
+        == 'https://example.com/api?name=alex&format=json'
+    )
+    assert plan.is_username_allowed('alex')
+    assert not plan.is_username_allowed('Alex')
+    assert plan.method == 'get'
+    assert not plan.allow_redirects
+    assert plan.make_headers('UA') == {'User-Agent': 'UA', 'Accept': 'application/json'}
+
+
+def test_check_plan_updated_with_site():
+    site = MaigretSite(
+        'test',
+        {'url': '{urlMain}/{username}', 'urlMain': 'https://example.com'},
+    )
+    site.update({'url_main': 'https://mirror.example.com'})
+
+    assert site.check_plan.make_url('alex') == 'https://mirror.example.com/alex'
+    assert 'checkPlan' not in site.json
+
+
+def test_check_plan_of_broken_template():
+    db = MaigretDatabase().load_from_json(
+        {
+            'sites': {
+                'Broken': {'url': '{urlMain}/{lang}/{username}', 'urlMain': 'https://a.com'},
+                'Good': {'url': '{urlMain}/{username}', 'urlMain': 'https://b.com'},
+            },
+        }
+    )
+
+    # only checks of the site fail
+    with pytest.raises(KeyError):
+        db.sites_dict['Broken'].check_plan.make_url('alex')
+    assert db.sites_dict['Good'].check_plan.make_url('alex') == 'https://b.com/alex'
+
+
+def test_load_from_snapshot(tmp_path):
+    db_file = tmp_path / 'db.json'
+    db_file.write_text(json.dumps(EXAMPLE_DB))
+    snapshots_path = str(tmp_path / 'snapshots')
+
+    db = MaigretDatabase().load_from_path(str(db_file), snapshots_path)
+    assert len(os.listdir(snapshots_path)) == 1
+
+    snapshot_db = MaigretDatabase().load_from_path(str(db_file), snapshots_path)
+    assert [s.json for s in snapshot_db.sites] == [s.json for s in db.sites]
+    amperka = snapshot_db.sites_dict['Amperka']
+    assert amperka.engine_obj is snapshot_db.engines_dict['XenForo']
+    assert amperka.check_plan.make_url('test') == db.sites[0].check_plan.make_url(
+        'test'
+    )
+    assert amperka.detect_username('http://forum.amperka.ru/members/?username=test')
+
+
+def test_load_from_snapshot_source_changed(tmp_path):
+    db_file = tmp_path / 'db.json'
+    db_file.write_text(json.dumps(EXAMPLE_DB))
+    snapshots_path = str(tmp_path / 'snapshots')
+    MaigretDatabase().load_from_path(str(db_file), snapshots_path)
+
+    changed_db = json.loads(json.dumps(EXAMPLE_DB))
+    changed_db['sites']['Amperka']['urlMain'] = 'https://forum.amperka.ru'
+    db_file.write_text(json.dumps(changed_db))
+
+    db = MaigretDatabase().load_from_path(str(db_file), snapshots_path)
+    assert db.sites[0].url_main == 'https://forum.amperka.ru'
+
+
+def test_load_from_snapshot_code_changed(tmp_path, monkeypatch):
+    db_file = tmp_path / 'db.json'
+    db_file.write_text(json.dumps(EXAMPLE_DB))
+    snapshots_path = str(tmp_path / 'snapshots')
+    monkeypatch.setattr('maigret.sites._snapshot_code_hash', 'old')
+    MaigretDatabase().load_from_path(str(db_file), snapshots_path)
+
+    # pickled classes have changed, the file is loaded again
+    monkeypatch.setattr('maigret.sites._snapshot_code_hash', 'new')
+    loads = []
+    load_from_file = MaigretDatabase.load_from_file
+
+    def counting_load_from_file(self, filename):
+        loads.append(filename)
+        return load_from_file(self, filename)
+
+    monkeypatch.setattr(MaigretDatabase, 'load_from_file', counting_load_from_file)
+    db = MaigretDatabase().load_from_path(str(db_file), snapshots_path)
+    assert len(loads) == 1
+    assert db.sites[0].name == 'Amperka'
+
+    MaigretDatabase().load_from_path(str(db_file), snapshots_path)
+    assert len(loads) == 1
+
+
+def test_load_from_snapshot_broken(tmp_path):
+    db_file = tmp_path / 'db.json'
+    db_file.write_text(json.dumps(EXAMPLE_DB))
+    snapshots_path = tmp_path / 'snapshots'
+    MaigretDatabase().load_from_path(str(db_file), str(snapshots_path))
+
+    for snapshot in snapshots_path.iterdir():
+        snapshot.write_bytes(b'broken')
+
+    db = MaigretDatabase().load_from_path(str(db_file), str(snapshots_path))
+    assert db.sites[0].name == 'Amperka'
+
+
+def test_save_to_file_only_if_changed(tmp_path):
+    db_file = tmp_path / 'db.json'
+    db_file.write_text(json.dumps(EXAMPLE_DB, indent=4))
+    mtime = db_file.stat().st_mtime_ns
+
+    db = MaigretDatabase().load_from_path(str(db_file), str(tmp_path / 'snapshots'))
+    assert not db.is_dirty
+    db.save_to_file(str(db_file))
+    assert db_file.stat().st_mtime_ns == mtime
+
+    site = db.sites_dict['Amperka']
+    site.disabled = True
+    db.update_site(site)
+    assert db.is_dirty
+    db.save_to_file(str(db_file))
+    assert not db.is_dirty
+    # no temporary files are left
+    assert sorted(os.listdir(tmp_path)) == ['db.json', 'snapshots']
+
+    saved_db = MaigretDatabase().load_from_file(str(db_file))
+    assert saved_db.sites_dict['Amperka'].disabled is True
+    assert [s.json for s in saved_db.sites] == [s.json for s in db.sites]
+
+
+def test_save_to_file_keeps_unchanged_sites(tmp_path):
+    db_file = tmp_path / 'db.json'
+    db_file.write_text(json.dumps(EXAMPLE_DB, indent=4))
+
+    db = MaigretDatabase().load_from_file(str(db_file))
+    db.update_site(MaigretSite('New', {'url': 'https://new.com/{username}'}))
+    db.save_to_file(str(db_file))
+
+    saved_data = json.loads(db_file.read_text())
+    assert saved_data['sites']['Amperka'] == EXAMPLE_DB['sites']['Amperka']
+    assert saved_data['sites']['New'] == {'url': 'https://new.com/{username}'}
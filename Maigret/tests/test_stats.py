@@ -0,0 +1,126 @@
+"""Maigret per-site statistics test functions"""
+
+import json
+import os
+
+from maigret.stats import RequestTiming, SiteStats, SitesStatsStore
+
+
+def make_timing(total, size=0):
+    timing = RequestTiming()
+    timing.total = total
+    timing.bytes = size
+    return timing
+
+
+def test_site_stats_percentiles():
+    stats = SiteStats(max_samples=100)
+    for i in range(1, 101):
+        stats.add(make_timing(i / 100), is_error=False, is_latency_known=True)
+
+    assert stats.percentile(50) == 0.5
+    assert stats.percentile(95) == 0.95
+    assert stats.percentile(100) == 1.0
+    assert SiteStats().percentile(95) is None
+
+
+def test_site_stats_rolling_window():
+    stats = SiteStats(max_samples=3)
+    for total in (10, 1, 2, 3):
+        stats.add(make_timing(total, size=100), is_error=False, is_latency_known=True)
+    # timeouts are counted as errors, but not as latencies
+    stats.add(make_timing(30), is_error=True, is_latency_known=False)
+
+    assert list(stats.latencies) == [1, 2, 3]
+    assert stats.checks == 5
+    assert stats.error_rate == 0.2
+    assert stats.bytes == 400
+
+
+def test_stats_store_save_and_load(tmp_path):
+    filename = str(tmp_path / 'stats' / 'sites.json')
+    store = SitesStatsStore(filename)
+    store.update('Site', make_timing(0.1234, size=10), is_error=False)
+    store.update('Site', make_timing(5), is_error=True, is_latency_known=False)
+    store.save()
+    # no temporary files are left
+    assert os.listdir(tmp_path / 'stats') == ['sites.json']
+
+    loaded = SitesStatsStore(filename).load()
+    stats = loaded.get('Site')
+    assert list(stats.latencies) == [0.123]
+    assert stats.checks == 2
+    assert stats.errors == 1
+    assert stats.bytes == 10
+
+
+def test_stats_store_extraction_needed(tmp_path):
+    filename = str(tmp_path / 'sites.json')
+    store = SitesStatsStore(filename)
+    for _ in range(3):
+        assert store.is_extraction_needed('Empty')
+        store.update_extraction('Empty', is_extracted=False)
+        store.update_extraction('Parsed', is_extracted=False)
+    store.update_extraction('Parsed', is_extracted=True)
+
+    assert not store.is_extraction_needed('Empty')
+    assert store.is_extraction_needed('Parsed')
+
+    store.save()
+    loaded = SitesStatsStore(filename).load()
+    assert not loaded.is_extraction_needed('Empty')
+    assert loaded.get('Parsed').extracted == 1
+
+
+def test_stats_store_extraction_reset_by_extractor_update(tmp_path):
+    filename = tmp_path / 'sites.json'
+    store = SitesStatsStore(str(filename))
+    for _ in range(3):
+        store.update_extraction('Empty', is_extracted=False)
+    store.save()
+
+    data = json.loads(filename.read_text())
+    data['extractor_version'] = '0.0.1'
+    filename.write_text(json.dumps(data))
+
+    assert SitesStatsStore(str(filename)).load().is_extraction_needed('Empty')
+
+
+def test_stats_store_without_file():
+    store = SitesStatsStore().load()
+    store.update('Site', make_timing(1), is_error=False)
+    store.save()
+
+    assert 'Site' in store
+
+
+def test_stats_store_adaptive_timeout():
+    store = SitesStatsStore()
+    for total in (0.2, 0.3, 0.4, 0.5, 0.6):
+        store.update('Fast', make_timing(total), is_error=False)
+    for total in (8, 9, 10, 11, 12):
+        store.update('Slow', make_timing(total), is_error=False)
+    store.update('New', make_timing(0.1), is_error=False)
+
+    assert store.get_timeout('Fast', 30) == 1.2
+    assert store.get_timeout('Fast', 30, factor=1, min_timeout=1.0) == 1.0
+    assert store.get_timeout('Slow', 30) == 24
+    assert store.get_timeout('Slow', 15) == 15
+    assert store.get_timeout('Slow', 30, max_timeout=20) == 20
+    # not enough samples
+    assert store.get_timeout('New', 30) == 30
+    assert store.get_timeout('Unknown', 30) == 30
+
+
+def test_stats_store_priorities():
+    store = SitesStatsStore()
+    for _ in range(8):
+        store.update('Found fast', make_timing(0.5), is_error=False, is_claimed=True)
+        store.update('Found slow', make_timing(5), is_error=False, is_claimed=True)
+        store.update('Not found', make_timing(0.5), is_error=False)
+
+    priorities = store.get_priorities(['Found fast', 'Found slow', 'Not found', 'New'], 30)
+    ordered = sorted(priorities, key=lambda name: priorities[name], reverse=True)
+
+    # claimed per second: 1.8, 1.0 (median latency), 0.2, 0.18
+    assert ordered == ['Found fast', 'New', 'Not found', 'Found slow']
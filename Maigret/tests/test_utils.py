@@ -1,15 +1,22 @@
 """Maigret utils test functions"""
 
 import itertools
+import os
+import pickle
 import re
 
+import pytest
+
 from maigret.utils import (
     CaseConverter,
     is_country_tag,
     enrich_link_str,
     URLMatcher,
+    LazyPattern,
     get_dict_ascii_tree,
     get_match_ratio,
+    load_json_file,
+    save_json_file,
 )
 
 
@@ -103,6 +110,39 @@ def test_url_make_profile_url_regexp():
         )
 
 
+def test_url_hosts():
+    url = 'https://www.Example.com/{username}'
+    assert URLMatcher.extract_profile_url_host(url) == 'example.com'
+    assert URLMatcher.extract_profile_url_host('https://{username}.example.com') == (
+        '{username}.example.com'
+    )
+    assert URLMatcher.extract_profile_url_host('example.com/{username}') == ''
+
+    assert URLMatcher.extract_hosts('HTTPS://WWW.example.com/alex?a=1') == [
+        'www.example.com',
+        'example.com',
+    ]
+    assert URLMatcher.extract_hosts('http://m.example.com#alex') == [
+        'm.example.com',
+        'example.com',
+    ]
+    assert URLMatcher.extract_hosts('ftp://example.com/alex') == []
+
+
+def test_lazy_pattern():
+    pattern = LazyPattern(r'^https?://example\.com/(.+?)$', re.IGNORECASE)
+    assert pattern._compiled is None
+
+    assert pattern.match('HTTPS://example.com/alex').group(1) == 'alex'
+    assert pattern.search('no url') is None
+    assert pattern._compiled is not None
+
+    restored = pickle.loads(pickle.dumps(pattern))
+    assert restored._compiled is None
+    assert restored.pattern == pattern.pattern
+    assert restored.match('http://example.com/alex')
+
+
 def test_get_dict_ascii_tree():
     data = {
         'uid': 'dXJpOm5vZGU6VXNlcjoyNjQwMzQxNQ==',
@@ -144,3 +184,21 @@ def test_get_match_ratio():
     fun = get_match_ratio(["test", "maigret", "username"])
 
     assert fun("test") == 1
+
+
+def test_json_file_save_and_load(tmp_path):
+    filename = str(tmp_path / 'data' / 'file.json')
+    assert load_json_file(filename, 'test') is None
+
+    save_json_file(filename, {'a': 1})
+    # no temporary files are left
+    assert os.listdir(tmp_path / 'data') == ['file.json']
+    assert load_json_file(filename, 'test') == {'a': 1}
+
+    with pytest.raises(TypeError):
+        save_json_file(filename, {'a': object()})
+    assert os.listdir(tmp_path / 'data') == ['file.json']
+
+    (tmp_path / 'data' / 'file.json').write_text('broken')
+    with pytest.raises(ValueError, match="test file"):
+        load_json_file(filename, 'test')
@@ -59,5 +59,6 @@ if __name__ == '__main__':
         #     continue
 
         update_tags(site)
+        db.update_site(site)
 
         db.save_to_file(args.base_file)
\ No newline at end of file
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Maigret: database loading benchmark
+Compares loading of the sites database from JSON with loading of its
+compiled snapshot, in the current process and in a new process (as on
+startup of the CLI).
+"""
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from maigret.sites import MaigretDatabase
+
+
+STARTUP_CODE = '''
+import sys, time
+start = time.perf_counter()
+from maigret.sites import MaigretDatabase
+db = MaigretDatabase().load_from_path(sys.argv[1], sys.argv[2] or None)
+print(time.perf_counter() - start)
+'''
+
+
+def bench(load, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_startup(filename, snapshots_path, rounds):
+    times = []
+    for _ in range(rounds):
+        output = subprocess.check_output(
+            [sys.executable, '-c', STARTUP_CODE, filename, snapshots_path or '']
+        )
+        times.append(float(output))
+    return statistics.median(times)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--base",
+        "-b",
+        metavar="BASE_FILE",
+        dest="base_file",
+        default="maigret/resources/data.json",
+        help="JSON file with sites data.",
+    )
+    parser.add_argument("--rounds", type=int, default=10, help="Count of rounds.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as snapshots_path:
+        # make the snapshot
+        db = MaigretDatabase().load_from_path(args.base_file, snapshots_path)
+        print(f'{len(db.sites)} sites, {len(db.engines)} engines')
+
+        json_time = bench(
+            lambda: MaigretDatabase().load_from_file(args.base_file), args.rounds
+        )
+        snapshot_time = bench(
+            lambda: MaigretDatabase().load_from_path(args.base_file, snapshots_path),
+            args.rounds,
+        )
+        print('\nIn process:')
+        print(f'JSON load:      {json_time:.3f}s')
+        print(f'Snapshot load:  {snapshot_time:.3f}s')
+        print(f'Speedup:        {json_time / snapshot_time:.2f}x')
+
+        json_time = bench_startup(args.base_file, None, args.rounds)
+        snapshot_time = bench_startup(args.base_file, snapshots_path, args.rounds)
+        print('\nStartup (import and load in a new process):')
+        print(f'JSON load:      {json_time:.3f}s')
+        print(f'Snapshot load:  {snapshot_time:.3f}s')
+        print(f'Speedup:        {json_time / snapshot_time:.2f}x')
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Maigret: hedged requests benchmark
+Runs searches over sites of a local server with long tail latency
+(most responses are fast, a few ones are slow) with and without hedged
+requests and compares percentiles of the search completion time.
+"""
+import asyncio
+import logging
+import multiprocessing
+import random
+import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from aiohttp import web
+
+from maigret.checking import maigret
+from maigret.sites import MaigretSite
+from maigret.stats import SitesStatsStore
+
+
+def run_server(port, fast_latency, slow_latency, slow_share):
+    # in a separate process, so the server doesn't slow down the client
+    app = make_app(fast_latency, slow_latency, slow_share)
+    web.run_app(app, host='127.0.0.1', port=port, print=None)
+
+
+def make_app(fast_latency, slow_latency, slow_share):
+    async def handler(request):
+        slow = random.random() < slow_share
+        await asyncio.sleep(slow_latency if slow else fast_latency)
+        return web.Response(text="user profile")
+
+    app = web.Application()
+    app.router.add_get('/{site}/{username}', handler)
+    return app
+
+
+def make_sites(count, port):
+    return {
+        f'Site{i}': MaigretSite(
+            f'Site{i}',
+            {
+                'url': f'http://127.0.0.1:{port}/site{i}/{{username}}',
+                'urlMain': f'http://127.0.0.1:{port}/',
+                'checkType': 'status_code',
+                'usernameClaimed': 'claimed',
+                'usernameUnclaimed': 'noonewouldeverusethis7',
+            },
+        )
+        for i in range(count)
+    }
+
+
+async def search(sites, stats_store, hedging, timeout):
+    start = time.perf_counter()
+    await maigret(
+        'claimed',
+        site_dict=sites,
+        logger=logging.getLogger('maigret'),
+        timeout=timeout,
+        no_progressbar=True,
+        max_connections_per_host=0,
+        prewarm_dns=False,
+        stats_store=stats_store,
+        hedging=hedging,
+    )
+    return time.perf_counter() - start
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(int(len(values) * percent / 100), len(values) - 1)
+    return values[index]
+
+
+async def main(args):
+    sites = make_sites(args.sites, args.port)
+    stats_store = SitesStatsStore()
+
+    # collect latencies of sites
+    for _ in range(args.warmup):
+        await search(sites, stats_store, False, args.timeout)
+
+    for hedging in (False, True):
+        times = [
+            await search(sites, stats_store, hedging, args.timeout)
+            for _ in range(args.rounds)
+        ]
+        title = 'With hedging:   ' if hedging else 'Without hedging:'
+        print(
+            f'{title} p50 {percentile(times, 50):.3f}s, '
+            f'p90 {percentile(times, 90):.3f}s, '
+            f'p99 {percentile(times, 99):.3f}s'
+        )
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=100, help="Count of sites.")
+    parser.add_argument("--rounds", type=int, default=100, help="Count of searches.")
+    parser.add_argument(
+        "--warmup", type=int, default=10, help="Count of searches to collect stats."
+    )
+    parser.add_argument("--fast-latency", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument(
+        "--slow-share", type=float, default=0.02, help="Share of slow responses."
+    )
+    parser.add_argument("--timeout", type=float, default=3)
+    parser.add_argument("--port", type=int, default=8990)
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(
+        target=run_server,
+        args=(args.port, args.fast_latency, args.slow_latency, args.slow_share),
+        daemon=True,
+    )
+    server.start()
+    time.sleep(1)
+    try:
+        asyncio.run(main(args))
+    finally:
+        server.terminate()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Maigret: page markers detection microbenchmark
+Compares the previous detection path (separate scans over the page
+for site errors, common errors, presence and absence strings) with
+the precompiled site markers.
+"""
+import random
+import string
+import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from maigret import errors
+from maigret.sites import MaigretDatabase
+
+
+def legacy_classify(site, html_text):
+    # copy of the detection code path before the precompiled markers
+    error = None
+    for flag, msg in site.errors_dict.items():
+        if flag in html_text:
+            error = msg
+            break
+    if not error:
+        error = errors.detect(html_text)
+
+    is_need_activation = any(
+        [s for s in site.activation.get("marks", []) if s in html_text]
+    )
+
+    presense_flag = None
+    for flag in site.presense_strs:
+        if flag in html_text:
+            presense_flag = flag
+            break
+
+    is_absence_detected = any(
+        [(absence_flag in html_text) for absence_flag in site.absence_strs]
+    )
+    return error, is_need_activation, presense_flag, is_absence_detected
+
+
+def markers_classify(site, html_text):
+    markers = site.markers
+    error = markers.detect_error(html_text)
+    is_need_activation = bool(site.activation) and markers.is_activation_needed(
+        html_text
+    )
+    if error:
+        return error, is_need_activation, None, False
+
+    presense_flag = markers.detect_presense(html_text)
+    is_absence_detected = markers.is_absence_detected(html_text)
+    return error, is_need_activation, presense_flag, is_absence_detected
+
+
+def make_page(size):
+    random.seed(0)
+    return ''.join(random.choices(string.ascii_letters + ' <>/="\n', k=size))
+
+
+def bench(func, sites, page, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for site in sites:
+            func(site, page)
+    return (time.perf_counter() - start) / rounds
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--base",
+        "-b",
+        metavar="BASE_FILE",
+        dest="base_file",
+        default="maigret/resources/data.json",
+        help="JSON file with sites data.",
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=200_000, help="Size of a test page."
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="Count of rounds.")
+    args = parser.parse_args()
+
+    db = MaigretDatabase().load_from_file(args.base_file)
+    sites = [s for s in db.sites if s.check_type == 'message']
+    page = make_page(args.page_size)
+    pages = {
+        'profile page': page,
+        'bot protection page': '<title>Attention Required! | Cloudflare</title>'
+        + page,
+    }
+
+    print(f'{len(sites)} message check sites, page of {args.page_size} chars')
+    for title, page in pages.items():
+        legacy_time = bench(legacy_classify, sites, page, args.rounds)
+        markers_time = bench(markers_classify, sites, page, args.rounds)
+
+        print(f'\n{title.capitalize()}:')
+        print(f'Legacy detection:  {legacy_time:.3f}s per round')
+        print(f'Site markers:      {markers_time:.3f}s per round')
+        print(f'Speedup:           {legacy_time / markers_time:.2f}x')
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Maigret: memory usage benchmark
+Measures memory taken by the loaded sites database and by results of
+a search on all the sites (as with -a), which are kept at the same time
+e.g. by the bot. Requests are not made, every site returns the same page.
+"""
+import asyncio
+import gc
+import logging
+import os
+import resource
+import tracemalloc
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from maigret.checking import SimpleAiohttpChecker, maigret
+from maigret.sites import MaigretDatabase
+
+
+class PageChecker(SimpleAiohttpChecker):
+    async def check(self, timing=None):
+        await asyncio.sleep(0)
+        return '<html>' + 'x' * 2000 + '</html>', 200, None
+
+
+def get_rss() -> float:
+    """Resident memory of the process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        # peak value on other systems
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def measure(func):
+    gc.collect()
+    traced, rss = tracemalloc.get_traced_memory()[0], get_rss()
+    result = func()
+    gc.collect()
+    traced = (tracemalloc.get_traced_memory()[0] - traced) / 2**20
+    return result, traced, get_rss() - rss
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--base",
+        "-b",
+        metavar="BASE_FILE",
+        dest="base_file",
+        default="maigret/resources/data.json",
+        help="JSON file with sites data.",
+    )
+    parser.add_argument(
+        "--no-tracemalloc",
+        action="store_true",
+        help="Measure only resident memory (tracing slows down and takes memory).",
+    )
+    args = parser.parse_args()
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+
+    logger = logging.getLogger('maigret')
+    logger.setLevel(logging.CRITICAL)
+
+    db, db_traced, db_rss = measure(
+        lambda: MaigretDatabase().load_from_file(args.base_file)
+    )
+    sites = db.ranked_sites_dict(disabled=False)
+    checker = PageChecker(logger=logger)
+    checkers = {'': checker, 'tor': checker, 'i2p': checker, 'dns': checker}
+
+    results, results_traced, results_rss = measure(
+        lambda: asyncio.run(
+            maigret(
+                'username',
+                sites,
+                logger,
+                no_progressbar=True,
+                checkers=checkers,
+                prewarm_dns=False,
+            )
+        )
+    )
+
+    print(f'{len(db.sites)} sites in the database, {len(results)} results')
+    if not args.no_tracemalloc:
+        print(f'Database:  {db_traced:.2f} MB allocated')
+        print(f'Results:   {results_traced:.2f} MB allocated')
+    print(f'Database:  {db_rss:.2f} MB resident')
+    print(f'Results:   {results_rss:.2f} MB resident')
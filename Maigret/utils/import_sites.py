@@ -7,6 +7,7 @@ import alive_progress
 from mock import Mock
 import requests
 
+from maigret.checking import maigret
 from maigret.maigret import *
 from maigret.result import MaigretCheckStatus
 from maigret.sites import MaigretSite